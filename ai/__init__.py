@@ -1,7 +1,27 @@
 """
 AI service module for processing files with prompts using OpenRouter API
 """
-from .service import load_prompt, process_file_with_prompt
-
-__all__ = ['load_prompt', 'process_file_with_prompt']
+from .service import load_prompt, process_file_with_prompt, parse_resumes_batched
+from .extraction import ExtractionResult, extract_text
+from .extraction_cache import extract_text_cached
+from .upload import FileTooLargeError
+from .budget import TextBudget, fit_text_budget
+from .prompt_registry import PromptTemplate, as_prompt_template, get_prompt, prompt_hash
+from .transport import get_transport, get_transport_stats
+from .ratelimit import get_rate_limiter, configure_rate_limiter
+from .concurrency import get_concurrency_limiter, get_concurrency_stats
+from .circuit import call_with_failover, get_breaker_states
+from .usage import get_usage_stats
+from .streaming import get_stream_stats
 
+__all__ = [
+    'load_prompt', 'process_file_with_prompt', 'parse_resumes_batched',
+    'ExtractionResult', 'extract_text', 'extract_text_cached', 'FileTooLargeError',
+    'TextBudget', 'fit_text_budget',
+    'PromptTemplate', 'as_prompt_template', 'get_prompt', 'prompt_hash',
+    'get_transport', 'get_transport_stats',
+    'get_rate_limiter', 'configure_rate_limiter',
+    'get_concurrency_limiter', 'get_concurrency_stats',
+    'call_with_failover', 'get_breaker_states',
+    'get_usage_stats', 'get_stream_stats',
+]
@@ -0,0 +1,206 @@
+"""
+asyncio OpenRouter client.
+
+Async counterpart of process_file_with_prompt(): requests share one
+httpx.AsyncClient connection pool, and waiting on the rate limiter or a
+retry backoff yields to the event loop instead of holding a thread. A
+single process can keep dozens of parses in flight.
+
+Requires httpx (pip install httpx). Request building, error classification
+and response parsing are shared with the sync service.
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+# Support both package imports (ai.async_service) and running from the ai folder
+try:
+    from .transport import TransportError, TransportResponse
+    from .ratelimit import get_rate_limiter, estimate_tokens
+    from .concurrency import get_concurrency_limiter
+    from .upload import request_body
+    from .retry import OpenRouterError, call_with_retry_async
+    from .circuit import track_attempt
+    from .usage import record_response_usage
+    from .service import build_chat_request, read_chat_response, parse_chat_content
+except ImportError:
+    from transport import TransportError, TransportResponse
+    from ratelimit import get_rate_limiter, estimate_tokens
+    from concurrency import get_concurrency_limiter
+    from upload import request_body
+    from retry import OpenRouterError, call_with_retry_async
+    from circuit import track_attempt
+    from usage import record_response_usage
+    from service import build_chat_request, read_chat_response, parse_chat_content
+
+
+# Runs blocking calls of async requests (rate limiter backend, usage sinks)
+_blocking_runner: Callable[..., Awaitable[Any]] = asyncio.to_thread
+
+
+def configure_blocking_runner(runner: Callable[..., Awaitable[Any]]):
+    """
+    Set how async requests run the blocking calls they make
+
+    runner(func, *args) returns an awaitable of func(*args). The default,
+    asyncio.to_thread, suits backends without per-thread state; Django sets
+    sync_to_async, so database backends and usage sinks run on the thread
+    whose connection it manages.
+    """
+    global _blocking_runner
+    _blocking_runner = runner
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking call with the configured runner (keeps usage labels)"""
+    return await _blocking_runner(func, *args)
+
+
+async def _async_chunks(data: Any) -> AsyncIterator[bytes]:
+    # httpx.AsyncClient only streams async iterables; blocks are small file reads
+    for chunk in data:
+        yield chunk
+
+
+class AsyncTransport:
+    """Pooled httpx.AsyncClient; create one per event loop and close it when done"""
+
+    def __init__(self, max_connections: Optional[int] = None, http2: Optional[bool] = None):
+        if not HAS_HTTPX:
+            raise ImportError("The async OpenRouter client requires httpx: pip install httpx")
+        if max_connections is None:
+            max_connections = int(os.getenv('OPENROUTER_ASYNC_MAX_CONNECTIONS', '50'))
+        if http2 is None:
+            http2 = os.getenv('OPENROUTER_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+        self.http2 = bool(http2 and HAS_H2)
+        self._client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def post(self, url: str, headers: Optional[Dict[str, str]] = None,
+                   json: Any = None, timeout: float = 60, data: Any = None) -> TransportResponse:
+        """
+        Send a POST request
+
+        data is a pre-encoded body instead of json (an iterable of bytes such
+        as StreamedJSONBody), sent as it is read.
+
+        Raises:
+            TransportError: On connection errors or timeouts
+        """
+        content = _async_chunks(data) if data is not None else None
+        try:
+            native = await self._client.post(url, headers=headers, json=json, content=content, timeout=timeout)
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        return TransportResponse(native.status_code, native.reason_phrase, native.headers, native)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self) -> 'AsyncTransport':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+async def post_chat_completion(
+    transport: AsyncTransport,
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+    timeout: float = 60,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Send a chat completion request under the rate limiter and retry policy
+
+    Returns:
+        The response JSON
+
+    Raises:
+        OpenRouterError: If the request fails (after retries)
+    """
+    model = payload['model']
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(payload)
+
+    latency = None
+
+    async def attempt():
+        nonlocal latency
+        # Every attempt waits for the model's requests/min and tokens/min budget
+        await limiter.acquire_async(model, estimated_tokens, run_blocking=run_blocking)
+        try:
+            # ...then for a slot under the adaptive concurrency limit
+            async with get_concurrency_limiter().async_slot():
+                with track_attempt(model):
+                    started = time.monotonic()
+                    try:
+                        # Files are encoded while they are sent, into a fresh body per attempt
+                        post_headers, body = request_body(headers, payload)
+                        response = await transport.post(url, headers=post_headers, timeout=timeout, **body)
+                    except TransportError as e:
+                        raise OpenRouterError(f"OpenRouter API error: {str(e)}", retryable=True)
+                    result = read_chat_response(response, url, model)
+                    latency = time.monotonic() - started
+        except OpenRouterError:
+            # Nothing was generated; the next attempt reserves the estimate again
+            await run_blocking(limiter.refund, model, estimated_tokens)
+            raise
+        return result
+
+    result = await call_with_retry_async(attempt, on_retry=on_retry)
+    await run_blocking(limiter.record_usage, model, estimated_tokens, result.get("usage", {}).get("total_tokens"))
+    # Usage sinks may write to a database
+    await run_blocking(record_response_usage, model, result, latency)
+    return result
+
+
+async def process_file_with_prompt_async(
+    file_path: str,
+    prompt_name: str,
+    model: str,
+    transport: AsyncTransport,
+    extract_text: bool = None,
+    resume_text: Optional[str] = None,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], Any]] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Async version of process_file_with_prompt()
+
+    Takes the same arguments plus the AsyncTransport to send on. on_retry
+    may be a plain or a coroutine function.
+    """
+    if resume_text is None:
+        # Reading and extracting the file is blocking work
+        url, headers, payload, timeout = await asyncio.to_thread(
+            build_chat_request, file_path, prompt_name, model,
+            extract_text=extract_text, **kwargs
+        )
+    else:
+        url, headers, payload, timeout = build_chat_request(
+            file_path, prompt_name, model,
+            extract_text=extract_text, resume_text=resume_text, **kwargs
+        )
+    result = await post_chat_completion(transport, url, headers, payload, timeout, on_retry=on_retry)
+    return parse_chat_content(result)
@@ -0,0 +1,101 @@
+"""
+Benchmark the PDF extraction backends over a folder of CVs
+
+For every installed backend, reports per file the median extraction time,
+pages, characters extracted and how much of the text is Persian/Arabic
+script, plus how many characters came out as Arabic presentation forms
+(glyph shapes instead of letters, a sign of broken right-to-left output).
+
+Usage (from the ai folder):
+    python benchmark_extraction.py [folder] [--repeat N] [--parallel WORKERS]
+
+The folder defaults to CV_files. --parallel also times each backend with
+its pages spread over a process pool of that size.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Support both package imports (ai.benchmark_extraction) and running from the ai folder
+try:
+    from .extraction import PDF_BACKENDS, extract_text
+except ImportError:
+    from extraction import PDF_BACKENDS, extract_text
+
+
+def is_arabic_script(ch):
+    return '؀' <= ch <= 'ۿ' or 'ݐ' <= ch <= 'ݿ'
+
+
+def is_presentation_form(ch):
+    return 'ﭐ' <= ch <= '﷿' or 'ﹰ' <= ch <= '﻿'
+
+
+def measure(file_path, backend, repeat, executor=None):
+    """Median duration (ms) and the last result of extracting a file with one backend"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        # Raw backend output: normalization would hide presentation forms
+        result = extract_text(str(file_path), backends=[backend], executor=executor, normalize=False)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PDF extraction backends")
+    parser.add_argument('folder', nargs='?', default=str(Path(__file__).parent / 'CV_files'))
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per file and backend (median is reported)')
+    parser.add_argument('--parallel', type=int, default=0, help='Also time page-parallel extraction with this many processes')
+    args = parser.parse_args()
+
+    files = sorted(Path(args.folder).glob('*.pdf'))
+    if not files:
+        print(f"❌ No PDF files found in {args.folder}")
+        return
+    backends = [name for name, backend in PDF_BACKENDS.items() if backend.available]
+    missing = [f"{name} ({backend.install_hint})" for name, backend in PDF_BACKENDS.items() if not backend.available]
+    if missing:
+        print(f"ℹ️  Not installed: {', '.join(missing)}")
+
+    executor = ProcessPoolExecutor(max_workers=args.parallel) if args.parallel > 1 else None
+    modes = [('serial', None)] + ([(f'parallel x{args.parallel}', executor)] if executor else [])
+    totals = {}
+
+    print(f"{'file':<30} {'backend':<10} {'mode':<12} {'ms':>9} {'pages':>5} {'chars':>7} {'persian':>8} {'pres.forms':>10}")
+    print("-" * 97)
+    try:
+        for file_path in files:
+            for name in backends:
+                for mode, pool in modes:
+                    try:
+                        duration, result = measure(file_path, name, args.repeat, pool)
+                    except Exception as e:
+                        print(f"{file_path.name[:30]:<30} {name:<10} {mode:<12} failed: {e}")
+                        continue
+                    text = result.text
+                    arabic = sum(1 for ch in text if is_arabic_script(ch))
+                    forms = sum(1 for ch in text if is_presentation_form(ch))
+                    print(
+                        f"{file_path.name[:30]:<30} {name:<10} {mode:<12} {duration:>9.1f} {result.page_count:>5} "
+                        f"{len(text):>7} {arabic / len(text) if text else 0:>8.1%} {forms:>10}"
+                    )
+                    total = totals.setdefault((name, mode), {'ms': 0.0, 'chars': 0, 'forms': 0})
+                    total['ms'] += duration
+                    total['chars'] += len(text)
+                    total['forms'] += forms
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print()
+    print(f"{'backend':<10} {'mode':<12} {'total ms':>10} {'chars':>9} {'pres.forms':>10}")
+    for (name, mode), total in totals.items():
+        print(f"{name:<10} {mode:<12} {total['ms']:>10.1f} {total['chars']:>9} {total['forms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
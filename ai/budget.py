@@ -0,0 +1,268 @@
+"""
+Token budget for resume text sent to the LLM.
+
+Most CVs are a few pages, but 40-page portfolios and theses make the
+slowest, most expensive parses. Before resume text goes into a prompt it is
+fitted to a token budget:
+
+    - whitespace runs are always collapsed
+    - over budget, lines repeated on many pages (running headers and
+      footers, "Page 3 of 40") are kept only once
+    - still over budget, the text is split into sections at recognised
+      headings and sections are kept by priority (contact details,
+      summary, experience, education and skills before courses, projects,
+      publications and appendices), truncating the section that crosses
+      the budget and marking what was omitted
+
+Tokens are estimated locally (about four characters per token for Latin
+script and two for Persian/Arabic), without a tokenizer.
+
+Configuration (environment variables):
+    RESUME_TOKEN_BUDGET: Resume text tokens per prompt; 0 disables (default: 8000)
+"""
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# A line seen this many times (digits ignored) is a running header or footer
+REPEATED_LINE_MIN = 4
+REPEATED_LINE_MAX_CHARS = 80
+
+# Below this, a partial section is not worth keeping
+MIN_PARTIAL_TOKENS = 100
+
+# Section heading keywords; lower priorities are kept first
+SECTION_PRIORITIES = [
+    (0, ['contact', 'personal', 'profile', 'summary', 'objective', 'about me',
+         'اطلاعات تماس', 'اطلاعات فردی', 'مشخصات', 'درباره', 'خلاصه']),
+    (1, ['experience', 'employment', 'work history', 'career', 'education', 'skills',
+         'سوابق', 'تجربه', 'تجربیات', 'تحصیلات', 'مهارت']),
+    (2, ['certification', 'certificate', 'courses', 'training', 'languages', 'awards', 'honors',
+         'دوره', 'گواهی', 'زبان', 'افتخارات', 'جوایز']),
+    (3, ['projects', 'volunteer', 'interests', 'hobbies', 'پروژه', 'علاقه']),
+    (4, ['publications', 'papers', 'research', 'references', 'thesis', 'appendix', 'chapter',
+         'bibliography', 'مقالات', 'انتشارات', 'پژوهش', 'پایان نامه', 'پایان‌نامه', 'منابع', 'فصل']),
+]
+KEYWORD_PRIORITY = {
+    keyword: priority for priority, keywords in SECTION_PRIORITIES for keyword in keywords
+}
+HEADING_MAX_CHARS = 60
+HEADING_MAX_WORDS = 6
+HEADING_PATTERN = re.compile(
+    r'^[\W\d_]*(' + '|'.join(map(re.escape, sorted(KEYWORD_PRIORITY, key=len, reverse=True))) + ')',
+    re.IGNORECASE,
+)
+
+
+def count_tokens(text: str) -> int:
+    """Estimated tokens: ~4 characters per token for ASCII, ~2 for other scripts"""
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return (ascii_chars + 2 * (len(text) - ascii_chars) + 3) // 4
+
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse spaces and tabs, trim lines and keep at most one blank line in a row"""
+    text = re.sub(r'[ \t\r\f\v\u00a0]+', ' ', text)
+    text = re.sub(r' ?\n ?', '\n', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+@dataclass(frozen=True)
+class TextBudget:
+    """Resume text fitted to a token budget, with what was left out"""
+    text: str
+    tokens: int
+    original_tokens: int
+    budget: int
+    repeated_lines_removed: int = 0
+    truncated_sections: Tuple[str, ...] = field(default_factory=tuple)
+    omitted_sections: Tuple[str, ...] = field(default_factory=tuple)
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.repeated_lines_removed or self.truncated_sections or self.omitted_sections)
+
+    def notes(self) -> Dict[str, Any]:
+        """Summary for ParsedResume.extraction_notes"""
+        return {
+            'budget_tokens': self.budget,
+            'original_tokens': self.original_tokens,
+            'sent_tokens': self.tokens,
+            'repeated_lines_removed': self.repeated_lines_removed,
+            'truncated_sections': list(self.truncated_sections),
+            'omitted_sections': list(self.omitted_sections),
+        }
+
+
+def _section_priority(line: str) -> Optional[int]:
+    """Priority of a heading line, or None if the line is not a heading"""
+    if len(line) > HEADING_MAX_CHARS or len(line.split()) > HEADING_MAX_WORDS:
+        return None
+    match = HEADING_PATTERN.match(line)
+    if match is None:
+        return None
+    return KEYWORD_PRIORITY[match.group(1).lower()]
+
+
+def _drop_repeated_lines(lines: List[str]) -> Tuple[List[str], int]:
+    """Keep only the first occurrence of lines repeated on many pages"""
+    # Numbered headings ("Chapter 3") look alike but are section boundaries
+    keys = [
+        re.sub(r'\d+', '#', line)
+        if line and len(line) <= REPEATED_LINE_MAX_CHARS and _section_priority(line) is None else None
+        for line in lines
+    ]
+    counts = Counter(key for key in keys if key is not None)
+    seen = set()
+    kept = []
+    for line, key in zip(lines, keys):
+        if key is not None and counts[key] >= REPEATED_LINE_MIN:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return kept, len(lines) - len(kept)
+
+
+def _split_sections(lines: List[str]) -> List[Tuple[str, int, List[str]]]:
+    """(heading, priority, lines) per section; text before the first heading ranks first"""
+    sections = [('', 0, [])]
+    for line in lines:
+        priority = _section_priority(line)
+        if priority is not None:
+            sections.append((line, priority, []))
+        sections[-1][2].append(line)
+    return [section for section in sections if section[2]]
+
+
+def _omitted_marker(names: List[str]) -> str:
+    if len(names) <= 3:
+        return f"[omitted: {', '.join(names)}]"
+    return f"[{len(names)} sections omitted: {names[0]} ... {names[-1]}]"
+
+
+def _cut_line(line: str, max_tokens: int) -> str:
+    """The longest prefix of line within max_tokens, ending at a word boundary if there is one nearby"""
+    low, high = 0, len(line)
+    # Binary search on the prefix length (token estimates grow with length)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(line[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = line[:low]
+    space = cut.rfind(' ')
+    if space > len(cut) * 0.8:
+        cut = cut[:space]
+    return cut
+
+
+def _allocate(sections: List[Tuple[str, int, List[str]]], line_tokens: List[List[int]],
+              budget: int) -> Dict[int, Tuple[int, Optional[str]]]:
+    """
+    Whole sections by priority, then as much of the next one as fits
+
+    Returns:
+        {section index: (whole lines kept, cut-down next line or None)}
+    """
+    remaining = budget
+    kept_lines = {}
+    for index in sorted(range(len(sections)), key=lambda i: (sections[i][1], i)):
+        section_tokens = sum(line_tokens[index])
+        if section_tokens <= remaining:
+            kept_lines[index] = (len(line_tokens[index]), None)
+            remaining -= section_tokens
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            kept = 0
+            while line_tokens[index][kept] <= remaining:
+                remaining -= line_tokens[index][kept]
+                kept += 1
+            # The line crossing the budget is cut rather than dropped, so one
+            # huge paragraph (or text without line breaks) still gets through
+            partial = None
+            if remaining >= MIN_PARTIAL_TOKENS:
+                partial = _cut_line(sections[index][2][kept], remaining - 1)
+                remaining -= count_tokens(partial) + 1
+            kept_lines[index] = (kept, partial)
+    return kept_lines
+
+
+def _assemble(sections: List[Tuple[str, int, List[str]]],
+              kept_lines: Dict[int, Tuple[int, Optional[str]]]) -> Tuple[str, List[str], List[str]]:
+    output = []
+    truncated, omitted = [], []
+    # Consecutive omitted sections share one marker
+    run = []
+    for index, (heading, _, section_lines) in enumerate(sections):
+        name = heading or '(start)'
+        kept, partial = kept_lines.get(index, (0, None))
+        if kept == 0 and partial is None:
+            omitted.append(name)
+            run.append(name)
+            continue
+        if run:
+            output.append(_omitted_marker(run))
+            run = []
+        output.extend(section_lines[:kept])
+        if partial is not None:
+            output.append(f"{partial} [...]")
+        if kept < len(section_lines):
+            truncated.append(name)
+            omitted_lines = len(section_lines) - kept - (partial is not None)
+            if omitted_lines:
+                output.append(f"[{name}: {omitted_lines} more lines omitted]")
+    if run:
+        output.append(_omitted_marker(run))
+    return '\n'.join(output), truncated, omitted
+
+
+def fit_text_budget(text: str, max_tokens: Optional[int] = None) -> TextBudget:
+    """
+    Fit resume text to a token budget
+
+    Fitting text that already fits only collapses its whitespace, so fitted
+    text passes through again unchanged.
+
+    Args:
+        text: Extracted resume text
+        max_tokens: Budget (default: RESUME_TOKEN_BUDGET; 0 only collapses whitespace)
+
+    Returns:
+        TextBudget with the text to send
+    """
+    budget = max_tokens if max_tokens is not None else int(os.getenv('RESUME_TOKEN_BUDGET', '8000'))
+    return _fit_text_budget(text, budget)
+
+
+@lru_cache(maxsize=64)
+def _fit_text_budget(text: str, budget: int) -> TextBudget:
+    original_tokens = count_tokens(text)
+    cleaned = collapse_whitespace(text)
+    tokens = count_tokens(cleaned)
+    if budget <= 0 or tokens <= budget:
+        return TextBudget(cleaned, tokens, original_tokens, budget)
+
+    lines, repeated = _drop_repeated_lines(cleaned.split('\n'))
+    # Removed lines leave blank runs behind
+    sections = _split_sections(collapse_whitespace('\n'.join(lines)).split('\n'))
+    line_tokens = [[count_tokens(line) + 1 for line in section_lines] for _, _, section_lines in sections]
+
+    # Omission markers cost tokens too: shrink the allowance until the result fits
+    allowance = budget
+    while True:
+        fitted, truncated, omitted = _assemble(sections, _allocate(sections, line_tokens, allowance))
+        tokens = count_tokens(fitted)
+        if tokens <= budget or allowance <= MIN_PARTIAL_TOKENS:
+            break
+        allowance = max(allowance - (tokens - budget), MIN_PARTIAL_TOKENS)
+
+    return TextBudget(
+        fitted, tokens, original_tokens, budget,
+        repeated_lines_removed=repeated,
+        truncated_sections=tuple(truncated),
+        omitted_sections=tuple(omitted),
+    )
@@ -0,0 +1,218 @@
+"""
+Per-model circuit breakers and ordered model failover.
+
+Each model has a breaker that tracks its most recent request attempts. When
+too many of them failed or were slow, the breaker opens and calls go to the
+next model in the list instead of waiting on a sick upstream. After a
+cooldown the breaker lets a single probe call through (half-open); a
+successful probe closes it again and traffic returns to the preferred model.
+
+Attempts are recorded by the senders (track_attempt) once the request has
+its rate-limit budget and concurrency slot, so local queueing and retry
+backoff never count as model latency. Only upstream failures (network
+errors, timeouts, throttling and server errors) count against a model; a
+bad request or a bad key says nothing about its health.
+
+Configuration (environment variables):
+    OPENROUTER_BREAKER_WINDOW: Recent calls tracked per model (default: 20)
+    OPENROUTER_BREAKER_MIN_CALLS: Calls needed before the breaker can open (default: 5)
+    OPENROUTER_BREAKER_ERROR_RATE: Failure ratio that opens the breaker (default: 0.5)
+    OPENROUTER_BREAKER_SLOW_CALL: Seconds after which a call counts as failed (default: 30)
+    OPENROUTER_BREAKER_COOLDOWN: Seconds before an open breaker is probed (default: 30)
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+try:
+    from .retry import OpenRouterError, is_retryable_status
+except ImportError:
+    from retry import OpenRouterError, is_retryable_status
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(OpenRouterError):
+    """Raised when every model in a failover list is unavailable"""
+
+
+class CircuitBreaker:
+    """Rolling error-rate and latency breaker for one model"""
+
+    def __init__(self, model: str, window: int = 20, min_calls: int = 5,
+                 error_rate: float = 0.5, slow_call: float = 30.0, cooldown: float = 30.0):
+        self.model = model
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window)  # (failed, latency) pairs
+        self.state = CLOSED
+        self.opened_at = None
+        self._probing = False
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to this model now (claims the probe when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, failed: bool, latency: float):
+        """Record the outcome of a request attempt"""
+        failed = failed or latency >= self.slow_call
+        with self._lock:
+            if self.state == OPEN:
+                # Attempts that started before the breaker opened
+                return
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+
+            self._calls.append((failed, latency))
+            if len(self._calls) >= self.min_calls:
+                failures = sum(1 for call_failed, _ in self._calls if call_failed)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open()
+
+    def release(self):
+        """End a half-open probe; if no attempt was recorded, the next call probes again"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._calls.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self._calls)
+            latencies = sorted(latency for _, latency in calls)
+            return {
+                'state': self.state,
+                'calls': len(calls),
+                'error_rate': round(sum(1 for failed, _ in calls if failed) / len(calls), 3) if calls else 0.0,
+                'p50_latency': round(latencies[len(latencies) // 2], 3) if latencies else None,
+                'open_for': round(time.monotonic() - self.opened_at, 1) if self.state != CLOSED else None,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Return the process-wide breaker for a model"""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                window=int(os.getenv('OPENROUTER_BREAKER_WINDOW', '20')),
+                min_calls=int(os.getenv('OPENROUTER_BREAKER_MIN_CALLS', '5')),
+                error_rate=float(os.getenv('OPENROUTER_BREAKER_ERROR_RATE', '0.5')),
+                slow_call=float(os.getenv('OPENROUTER_BREAKER_SLOW_CALL', '30')),
+                cooldown=float(os.getenv('OPENROUTER_BREAKER_COOLDOWN', '30')),
+            )
+            _breakers[model] = breaker
+        return breaker
+
+
+def get_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Return the state of every model's breaker"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.model: breaker.snapshot() for breaker in breakers}
+
+
+def is_model_failure(error: OpenRouterError) -> bool:
+    """Network errors and timeouts (no status), throttling and server errors count against a model"""
+    return error.status_code is None or is_retryable_status(error.status_code)
+
+
+@contextmanager
+def track_attempt(model: str) -> Iterator[None]:
+    """
+    Record one request attempt at a model in its breaker
+
+    Enter once the attempt has its rate-limit budget and concurrency slot,
+    right before the request is sent.
+    """
+    breaker = get_breaker(model)
+    started = time.monotonic()
+    try:
+        yield
+    except OpenRouterError as e:
+        if is_model_failure(e):
+            breaker.record(True, time.monotonic() - started)
+        raise
+    breaker.record(False, time.monotonic() - started)
+
+
+def call_with_failover(models: List[str], call: Callable[[str], Any]) -> Tuple[Any, str]:
+    """
+    Call call(model) for the first available model, failing over on errors
+
+    Models are tried in order, skipping those whose breaker is open. An
+    OpenRouterError moves on to the next model; any other exception (e.g. a
+    bad local file) is raised as is. The breakers are fed by the attempts
+    call(model) sends (see track_attempt).
+
+    Returns:
+        Tuple of (call result, model that answered)
+
+    Raises:
+        OpenRouterError: The last model's error if every attempted model failed
+        CircuitOpenError: If every model's breaker is open
+    """
+    last_error = None
+    for model in models:
+        breaker = get_breaker(model)
+        if not breaker.allow_request():
+            continue
+        try:
+            return call(model), model
+        except OpenRouterError as e:
+            last_error = e
+        finally:
+            breaker.release()
+
+    if last_error is not None:
+        raise last_error
+    raise CircuitOpenError(f"No model available, all circuits open: {', '.join(models)}", retryable=True)
+
+
+async def call_with_failover_async(models: List[str], call: Callable[[str], Awaitable[Any]]) -> Tuple[Any, str]:
+    """Async version of call_with_failover(); call(model) is a coroutine function"""
+    last_error = None
+    for model in models:
+        breaker = get_breaker(model)
+        if not breaker.allow_request():
+            continue
+        try:
+            return await call(model), model
+        except OpenRouterError as e:
+            last_error = e
+        finally:
+            breaker.release()
+
+    if last_error is not None:
+        raise last_error
+    raise CircuitOpenError(f"No model available, all circuits open: {', '.join(models)}", retryable=True)
@@ -0,0 +1,246 @@
+"""
+Adaptive concurrency limit for OpenRouter requests (AIMD).
+
+Every request attempt takes a slot from a process-wide limiter, after the
+rate limiter's wait. The number of slots adapts to what the upstream can
+take:
+
+    - additive increase: each fast enough call made while requests were
+      queued for a slot raises the limit by 1/limit, i.e. about one slot per
+      round of calls
+    - multiplicative decrease: a throttled call (429 or 503) multiplies the
+      limit by OPENROUTER_CONCURRENCY_BACKOFF, and a call much slower than
+      usual (short-term average latency above the long-term average times
+      OPENROUTER_CONCURRENCY_LATENCY_TOLERANCE) by 0.9; at most once per
+      round of calls, since calls in flight saw the same congestion
+
+so quiet hours run many parses in parallel and throttling backs off without
+tuning worker counts by hand.
+
+Configuration (environment variables):
+    OPENROUTER_ADAPTIVE_CONCURRENCY: "false" to stop limiting and adapting;
+        slots are then only counted (default: true)
+    OPENROUTER_CONCURRENCY_MIN: Lowest limit (default: 1)
+    OPENROUTER_CONCURRENCY_MAX: Highest limit (default: 32)
+    OPENROUTER_CONCURRENCY_INITIAL: Starting limit (default: 3)
+    OPENROUTER_CONCURRENCY_BACKOFF: Factor applied on throttling (default: 0.5)
+    OPENROUTER_CONCURRENCY_LATENCY_TOLERANCE: Slowdown treated as congestion (default: 2.0)
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+try:
+    from .retry import OpenRouterError
+except ImportError:
+    from retry import OpenRouterError
+
+# Responses telling us to send less
+THROTTLE_STATUS_CODES = {429, 503}
+
+# Decrease applied when latency, rather than an error, signals congestion
+LATENCY_BACKOFF = 0.9
+
+# Smoothing of the short- and long-term latency averages
+SHORT_ALPHA = 0.3
+LONG_ALPHA = 0.05
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit shared by threads and event loops (thread-safe)"""
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 32, initial: int = 3,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0, enabled: bool = True):
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        # threading.Event for threads, (loop, future) for coroutines, in arrival order
+        self._waiters = deque()
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _has_room(self) -> bool:
+        return not self.enabled or self._in_flight < int(self._limit)
+
+    def acquire(self):
+        """Wait for a slot (blocking)"""
+        with self._lock:
+            if self._has_room() and not self._waiters:
+                self._in_flight += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        # Slots are handed over by release(), already counted as in flight
+        event.wait()
+
+    async def acquire_async(self):
+        """Wait for a slot without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._has_room() and not self._waiters:
+                self._in_flight += 1
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            # Handed a slot just before being cancelled: give it back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        """
+        Free a slot and adapt the limit
+
+        Args:
+            latency: Seconds the call took, if it completed
+            throttled: Whether the upstream answered 429/503
+        """
+        with self._lock:
+            queued = bool(self._waiters) or self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            if self.enabled:
+                if throttled:
+                    self.throttled += 1
+                    self._decrease(self.backoff)
+                elif latency is not None:
+                    self._observe(latency, queued)
+            self._hand_over()
+
+    def _observe(self, latency: float, queued: bool):
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += SHORT_ALPHA * (latency - self._short_latency)
+            self._long_latency += LONG_ALPHA * (latency - self._long_latency)
+
+        if self._short_latency > self._long_latency * self.latency_tolerance:
+            self._decrease(LATENCY_BACKOFF)
+        elif queued and self._limit < self.max_limit:
+            # Only grow when the limit is what held requests back
+            self._limit = min(self._limit + 1 / self._limit, float(self.max_limit))
+            self.increases += 1
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < (self._short_latency or 1.0):
+            return
+        self._last_decrease = now
+        self._limit = max(self._limit * factor, float(self.min_limit))
+        self.decreases += 1
+
+    def _hand_over(self):
+        while self._waiters and self._has_room():
+            waiter = self._waiters.popleft()
+            self._in_flight += 1
+            if isinstance(waiter, threading.Event):
+                waiter.set()
+            else:
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(self._wake, future)
+                except RuntimeError:
+                    # The waiter's loop is closed
+                    self._in_flight -= 1
+
+    def _wake(self, future: asyncio.Future):
+        if future.done():
+            # Cancelled while the slot was on its way
+            self.release()
+        else:
+            future.set_result(None)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold a slot for one request, feeding its latency or throttling back"""
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except OpenRouterError as e:
+            self.release(throttled=e.status_code in THROTTLE_STATUS_CODES)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[None]:
+        """Async version of slot()"""
+        await self.acquire_async()
+        started = time.monotonic()
+        try:
+            yield
+        except OpenRouterError as e:
+            self.release(throttled=e.status_code in THROTTLE_STATUS_CODES)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.release(time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'limit': int(self._limit),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': self._in_flight,
+                'queued': len(self._waiters),
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'throttled': self.throttled,
+                'latency_short': round(self._short_latency, 3) if self._short_latency is not None else None,
+                'latency_long': round(self._long_latency, 3) if self._long_latency is not None else None,
+            }
+
+
+_limiter: Optional[AdaptiveConcurrencyLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_concurrency_limiter() -> AdaptiveConcurrencyLimiter:
+    """Return the process-wide concurrency limiter, configured from the environment"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AdaptiveConcurrencyLimiter(
+                    min_limit=int(os.getenv('OPENROUTER_CONCURRENCY_MIN', '1')),
+                    max_limit=int(os.getenv('OPENROUTER_CONCURRENCY_MAX', '32')),
+                    initial=int(os.getenv('OPENROUTER_CONCURRENCY_INITIAL', '3')),
+                    backoff=float(os.getenv('OPENROUTER_CONCURRENCY_BACKOFF', '0.5')),
+                    latency_tolerance=float(os.getenv('OPENROUTER_CONCURRENCY_LATENCY_TOLERANCE', '2.0')),
+                    enabled=os.getenv('OPENROUTER_ADAPTIVE_CONCURRENCY', 'true').lower() == 'true',
+                )
+    return _limiter
+
+
+def get_concurrency_stats() -> Dict[str, Any]:
+    """Return the current concurrency limit, slots in use and queued requests"""
+    return get_concurrency_limiter().snapshot()
@@ -0,0 +1,267 @@
+"""
+Text extraction stage for resume files (PDF/DOCX)
+
+Extraction runs once per file; the result (text plus page count, timing and
+the extractor used) is handed to the LLM call and stored with the parse.
+Persian/Arabic script in the text is normalized first (see normalize.py).
+
+PDFs go through pluggable backends, tried per file in order of preference:
+PyMuPDF (fast, keeps right-to-left Persian text in reading order) when it is
+installed, then PyPDF2. A backend that fails or yields almost no text (e.g.
+an odd font encoding) hands the file to the next one. Given an executor,
+long PDFs are split into page ranges extracted in parallel.
+
+Configuration (environment variables):
+    PDF_EXTRACTORS: Backends in order of preference (default: pymupdf,pypdf2)
+    PDF_MIN_CHARS_PER_PAGE: Average text per page below which the next
+        backend is tried (default: 20)
+    PDF_PARALLEL_MIN_PAGES: Pages a PDF needs before it is split across an
+        executor (default: 8)
+    PDF_PAGES_PER_TASK: Pages per parallel task (default: 4)
+    TEXT_NORMALIZATION: "false" to skip Persian/Arabic normalization of the
+        extracted text (default: true)
+"""
+import os
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Support both package imports (ai.extraction) and running from the ai folder
+try:
+    from .normalize import NORMALIZER_VERSION, normalization_enabled, normalize_text
+except ImportError:
+    from normalize import NORMALIZER_VERSION, normalization_enabled, normalize_text
+
+# Try to import PDF/DOCX text extraction libraries
+try:
+    import pymupdf
+    HAS_PYMUPDF = True
+except ImportError:
+    try:
+        # PyMuPDF before 1.24.3
+        import fitz as pymupdf
+        HAS_PYMUPDF = True
+    except ImportError:
+        HAS_PYMUPDF = False
+
+try:
+    import PyPDF2
+    HAS_PYPDF2 = True
+except ImportError:
+    HAS_PYPDF2 = False
+
+try:
+    import docx
+    from docx import Document
+    HAS_DOCX = True
+    DOCX_VERSION = getattr(docx, '__version__', '')
+except ImportError:
+    HAS_DOCX = False
+    DOCX_VERSION = ''
+
+
+@dataclass
+class ExtractionResult:
+    """Extracted text with metadata about how it was produced"""
+    text: str
+    page_count: int
+    extractor: str
+    duration_ms: float
+    extractor_version: str = ''
+    # Persian/Arabic script normalized (see normalize.py)
+    normalized: bool = False
+    # Loaded from the extraction cache rather than extracted now
+    cached: bool = False
+    # sha256 of the file, when extract_text_cached hashed it
+    content_hash: Optional[str] = None
+
+    def metadata(self) -> Dict[str, Any]:
+        """Return everything except the text itself"""
+        data = asdict(self)
+        data.pop('text')
+        data['char_count'] = len(self.text)
+        return data
+
+
+class PyMuPDFBackend:
+    """PDF text through MuPDF (pip install PyMuPDF)"""
+    name = 'pymupdf'
+    available = HAS_PYMUPDF
+    version = pymupdf.__version__ if HAS_PYMUPDF else ''
+    install_hint = 'pip install PyMuPDF'
+
+    @staticmethod
+    def page_count(file_path: str) -> int:
+        with pymupdf.open(file_path) as doc:
+            return doc.page_count
+
+    @staticmethod
+    def extract_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        with pymupdf.open(file_path) as doc:
+            return [doc[number].get_text('text') for number in range(start, min(stop or doc.page_count, doc.page_count))]
+
+
+class PyPDF2Backend:
+    """PDF text through PyPDF2 (pure Python)"""
+    name = 'pypdf2'
+    available = HAS_PYPDF2
+    version = PyPDF2.__version__ if HAS_PYPDF2 else ''
+    install_hint = 'pip install PyPDF2'
+
+    @staticmethod
+    def page_count(file_path: str) -> int:
+        with open(file_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+
+    @staticmethod
+    def extract_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        with open(file_path, 'rb') as file:
+            pages = PyPDF2.PdfReader(file).pages
+            return [pages[number].extract_text() for number in range(start, min(stop or len(pages), len(pages)))]
+
+
+PDF_BACKENDS = {backend.name: backend for backend in (PyMuPDFBackend, PyPDF2Backend)}
+
+
+def pdf_backends(names: Optional[List[str]] = None) -> List[Any]:
+    """
+    Installed PDF backends in order of preference
+
+    Args:
+        names: Backend names (default: PDF_EXTRACTORS)
+
+    Raises:
+        ValueError: If a name is not a known backend
+    """
+    if names is None:
+        names = [name.strip() for name in os.getenv('PDF_EXTRACTORS', 'pymupdf,pypdf2').split(',') if name.strip()]
+    unknown = [name for name in names if name not in PDF_BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown PDF extractors {unknown}; available: {list(PDF_BACKENDS)}")
+    return [PDF_BACKENDS[name] for name in names if PDF_BACKENDS[name].available]
+
+
+def extract_pdf_pages(backend_name: str, file_path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Text of pages [start, stop) with one backend (picklable, for process pools)"""
+    return PDF_BACKENDS[backend_name].extract_pages(file_path, start, stop)
+
+
+def _pdf_pages(backend, file_path: str, executor=None) -> List[str]:
+    if executor is not None:
+        page_count = backend.page_count(file_path)
+        if page_count >= int(os.getenv('PDF_PARALLEL_MIN_PAGES', '8')):
+            per_task = max(int(os.getenv('PDF_PAGES_PER_TASK', '4')), 1)
+            futures = [
+                executor.submit(extract_pdf_pages, backend.name, file_path, start, start + per_task)
+                for start in range(0, page_count, per_task)
+            ]
+            return [text for future in futures for text in future.result()]
+    return backend.extract_pages(file_path)
+
+
+def _extract_pdf(file_path: str, backends: Optional[List[str]] = None, executor=None) -> ExtractionResult:
+    candidates = pdf_backends(backends)
+    if not candidates:
+        raise ImportError("PyMuPDF or PyPDF2 is required for PDF text extraction. Install one with: pip install PyMuPDF")
+    min_chars = int(os.getenv('PDF_MIN_CHARS_PER_PAGE', '20'))
+    started = time.perf_counter()
+    best = None
+    error = None
+    for backend in candidates:
+        try:
+            pages = _pdf_pages(backend, file_path, executor)
+        except Exception as e:
+            error = e
+            continue
+        chars = sum(len(text.strip()) for text in pages)
+        if best is None or chars > best[2]:
+            best = (backend, pages, chars)
+        if chars >= min_chars * max(len(pages), 1):
+            break
+    if best is None:
+        raise ValueError(f"Error reading PDF: {str(error)}")
+
+    backend, pages, _ = best
+    return ExtractionResult(
+        # One join rather than growing a string page by page
+        text="".join(f"{text}\n" for text in pages),
+        page_count=len(pages),
+        extractor=backend.name,
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+        extractor_version=backend.version,
+    )
+
+
+def _extract_docx(file_path: str) -> ExtractionResult:
+    if not HAS_DOCX:
+        raise ImportError("python-docx is required for DOCX text extraction. Install it with: pip install python-docx")
+    started = time.perf_counter()
+    try:
+        doc = Document(file_path)
+        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+    except Exception as e:
+        raise ValueError(f"Error reading DOCX: {str(e)}")
+    return ExtractionResult(
+        text=text,
+        # DOCX has no fixed pagination
+        page_count=1,
+        extractor='python-docx',
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+        extractor_version=DOCX_VERSION,
+    )
+
+
+def extractor_signature(file_path: str, backends: Optional[List[str]] = None,
+                        normalize: Optional[bool] = None) -> str:
+    """
+    Which extractors (and versions) extract_text would use for this file
+
+    Text extracted under another signature, e.g. before PyMuPDF was
+    installed or upgraded, should be extracted again.
+    """
+    file_ext = Path(file_path).suffix.lower()
+    if file_ext == '.pdf':
+        signature = ','.join(f"{backend.name}-{backend.version}" for backend in pdf_backends(backends))
+    elif file_ext in ['.doc', '.docx']:
+        signature = f"python-docx-{DOCX_VERSION}"
+    else:
+        return ''
+    if normalization_enabled() if normalize is None else normalize:
+        signature += f"+normalize-{NORMALIZER_VERSION}"
+    return signature
+
+
+def extract_text(file_path: str, backends: Optional[List[str]] = None, executor=None,
+                 normalize: Optional[bool] = None) -> ExtractionResult:
+    """
+    Extract text from a PDF or DOCX file
+
+    Args:
+        file_path: Path to the file
+        backends: PDF backend names to try, in order (default: PDF_EXTRACTORS)
+        executor: Optional concurrent.futures executor (a process pool for
+                  real parallelism) to extract the pages of long PDFs on
+        normalize: Normalize Persian/Arabic script (see normalize.py;
+                   default: TEXT_NORMALIZATION)
+
+    Returns:
+        ExtractionResult
+
+    Raises:
+        ImportError: If the library needed for this file type is missing
+        ValueError: If the file cannot be read or the type is unsupported
+    """
+    file_ext = Path(file_path).suffix.lower()
+
+    if file_ext == '.pdf':
+        result = _extract_pdf(file_path, backends, executor)
+    elif file_ext in ['.doc', '.docx']:
+        result = _extract_docx(file_path)
+    else:
+        raise ValueError(f"Text extraction not supported for file type: {file_ext}")
+
+    if normalization_enabled() if normalize is None else normalize:
+        result.text = normalize_text(result.text)
+        result.normalized = True
+    return result
@@ -0,0 +1,159 @@
+"""
+Content-addressed cache of extracted resume text.
+
+Extraction is deterministic for a given file and extractor, so its result is
+stored once per file content hash, as a gzip-compressed JSON artifact
+(<dir>/<hash[:2]>/<hash>.json.gz) holding the text, page count, extractor,
+extractor version and original timing. Re-parsing after a prompt change or
+re-ranking then reads the artifact instead of opening the PDF again. An
+artifact written by other extractors (e.g. before PyMuPDF was installed or
+upgraded, or with text normalization changed) is ignored and replaced.
+
+Configuration (environment variables):
+    EXTRACTION_CACHE_DIR: Directory for the artifacts; unset or empty
+        disables the cache (the Django backend defaults it to
+        backend/extraction_cache). Artifacts hold resume text, so they are
+        written owner-only; keep the directory out of served paths.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Support both package imports (ai.extraction_cache) and running from the ai folder
+try:
+    from .extraction import ExtractionResult, extract_text, extractor_signature
+except ImportError:
+    from extraction import ExtractionResult, extract_text, extractor_signature
+
+# Bump when the artifact layout changes
+ARTIFACT_FORMAT = 1
+
+
+def content_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file's bytes without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Extraction artifacts in a directory, shared by every process that can see it"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, content_hash: str) -> Path:
+        return self.directory / content_hash[:2] / f"{content_hash}.json.gz"
+
+    def get(self, content_hash: str, signature: str) -> Optional[ExtractionResult]:
+        """Return the cached extraction, or None if missing, unreadable or from other extractors"""
+        try:
+            with gzip.open(self.path(content_hash), 'rt', encoding='utf-8') as f:
+                artifact = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if artifact.get('format') != ARTIFACT_FORMAT or artifact.get('signature') != signature:
+            return None
+        return ExtractionResult(**artifact['result'], cached=True, content_hash=content_hash)
+
+    def put(self, content_hash: str, signature: str, result: ExtractionResult):
+        """Store an extraction (atomically, so readers never see a partial file)"""
+        path = self.path(content_hash)
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        path.parent.mkdir(mode=0o700, exist_ok=True)
+        artifact = {
+            'format': ARTIFACT_FORMAT,
+            'signature': signature,
+            'created_at': time.time(),
+            'result': {key: value for key, value in asdict(result).items() if key not in ('cached', 'content_hash')},
+        }
+        # mkstemp creates the file owner-only (0600), and it keeps that mode when renamed
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(artifact, ensure_ascii=False).encode('utf-8'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Artifact count and size on disk (walks the directory)"""
+        files = list(self.directory.glob('*/*.json.gz')) if self.directory.exists() else []
+        return {
+            'directory': str(self.directory),
+            'artifacts': len(files),
+            'bytes': sum(path.stat().st_size for path in files),
+        }
+
+    def clear(self, older_than_days: Optional[float] = None) -> int:
+        """
+        Delete artifacts
+
+        Args:
+            older_than_days: Only delete artifacts not written (or replaced) within this many days
+
+        Returns:
+            Number of deleted artifacts
+        """
+        if not self.directory.exists():
+            return 0
+        cutoff = time.time() - older_than_days * 86400 if older_than_days is not None else None
+        deleted = 0
+        for path in self.directory.glob('*/*.json.gz'):
+            if cutoff is None or path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                deleted += 1
+        return deleted
+
+
+def get_extraction_cache(cache_dir: Optional[str] = None) -> Optional[ExtractionCache]:
+    """The cache in cache_dir (default: EXTRACTION_CACHE_DIR), or None when disabled"""
+    if cache_dir is None:
+        cache_dir = os.getenv('EXTRACTION_CACHE_DIR', '')
+    return ExtractionCache(cache_dir) if cache_dir else None
+
+
+def extract_text_cached(file_path: str, cache_dir: Optional[str] = None,
+                        content_hash: Optional[str] = None, **kwargs) -> ExtractionResult:
+    """
+    extract_text() through the extraction cache
+
+    Module-level (picklable), so it can run in a process pool like extract_text.
+
+    Args:
+        file_path: Path to the file
+        cache_dir: Artifact directory (default: EXTRACTION_CACHE_DIR; empty disables)
+        content_hash: sha256 of the file, if the caller already has it
+        **kwargs: Passed on to extract_text (backends, executor, normalize)
+
+    Returns:
+        ExtractionResult, with cached=True when read from an artifact and
+        content_hash set whenever the cache is enabled
+    """
+    cache = get_extraction_cache(cache_dir)
+    if cache is None:
+        return extract_text(file_path, **kwargs)
+
+    content_hash = content_hash or content_sha256(file_path)
+    signature = extractor_signature(file_path, kwargs.get('backends'), kwargs.get('normalize'))
+    result = cache.get(content_hash, signature)
+    if result is not None:
+        return result
+
+    result = extract_text(file_path, **kwargs)
+    result.content_hash = content_hash
+    try:
+        cache.put(content_hash, signature, result)
+    except OSError:
+        # A read-only or full disk only costs the next caller an extraction
+        pass
+    return result
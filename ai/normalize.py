@@ -0,0 +1,119 @@
+"""
+Persian/Arabic text normalization.
+
+Extracted resume text mixes Arabic and Persian code points for the same
+letter (ي/ی, ك/ک), carries Arabic Presentation Forms glyphs (from PDFs
+whose text layer stores shaped letters), Persian and Arabic-Indic digits,
+tatweel, diacritics, bidi control marks and icon-font glyphs. The same word
+then tokenizes differently and exact matches ("پایتون", "09121234567")
+fail. normalize_text maps it all to one form in a single str.translate
+pass plus a zero-width non-joiner cleanup:
+
+    - Arabic yeh/alef maksura -> Persian yeh, Arabic kaf -> Persian kaf
+    - Presentation Forms -> base letters (their NFKC decomposition)
+    - Persian and Arabic-Indic digits -> ASCII digits
+    - tatweel, diacritics, bidi marks, zero-width spaces, soft hyphens,
+      control characters and private-use (icon font) glyphs removed
+    - zero-width non-joiners kept once, and only between two letters
+
+Applied once after extraction, so the LLM prompt, ParsedResume.raw_text and
+the extraction cache all hold normalized text.
+
+Configuration (environment variables):
+    TEXT_NORMALIZATION: "false" to keep extracted text as-is (default: true)
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, Optional
+
+# Bump when the mapping changes, so cached extractions are normalized again
+NORMALIZER_VERSION = 1
+
+ZWNJ = '\u200c'
+
+# Letters written with either the Arabic or the Persian code point
+LETTER_MAP = {
+    'ي': 'ی',  # ARABIC LETTER YEH
+    'ى': 'ی',  # ARABIC LETTER ALEF MAKSURA
+    'ك': 'ک',  # ARABIC LETTER KAF
+}
+
+REMOVED_RANGES = [
+    (0x0000, 0x0008),  # C0 controls (PyPDF2 writes NUL for glyphs it cannot map),
+    (0x000B, 0x000B),  # keeping tab, newline, carriage return and form feed
+    (0x000E, 0x001F),
+    (0x007F, 0x007F),
+    (0x0610, 0x061A),  # Arabic signs above/below letters
+    (0x064B, 0x065F),  # Harakat (diacritics)
+    (0x0670, 0x0670),  # Superscript alef
+    (0x06D6, 0x06ED),  # Quranic annotation marks
+    (0x0640, 0x0640),  # Tatweel (kashida)
+    (0x00AD, 0x00AD),  # Soft hyphen
+    (0x200B, 0x200B),  # Zero-width space
+    (0x200D, 0x200F),  # Zero-width joiner, LRM, RLM
+    (0x202A, 0x202E),  # Bidi embeddings and overrides
+    (0x2066, 0x2069),  # Bidi isolates
+    (0xFEFF, 0xFEFF),  # Byte order mark / zero-width no-break space
+    (0xE000, 0xF8FF),  # Private use area (icon fonts)
+]
+
+PRESENTATION_FORM_RANGES = [
+    (0xFB50, 0xFDFF),  # Arabic Presentation Forms-A
+    (0xFE70, 0xFEFC),  # Arabic Presentation Forms-B
+]
+
+
+def _build_table() -> Dict[int, Optional[str]]:
+    table: Dict[int, Optional[str]] = {}
+    for start, stop in REMOVED_RANGES:
+        for codepoint in range(start, stop + 1):
+            table[codepoint] = None
+    for start, stop in PRESENTATION_FORM_RANGES:
+        for codepoint in range(start, stop + 1):
+            char = chr(codepoint)
+            base = unicodedata.normalize('NFKC', char)
+            if base != char:
+                # Drop the diacritics some forms carry, and unify letters
+                table[codepoint] = ''.join(
+                    LETTER_MAP.get(c, c) for c in base if table.get(ord(c), c) is not None
+                ) or None
+    # Persian (extended Arabic-Indic) and Arabic-Indic digits
+    for zero in (0x06F0, 0x0660):
+        for value in range(10):
+            table[zero + value] = str(value)
+    for char, replacement in LETTER_MAP.items():
+        table[ord(char)] = replacement
+    return table
+
+
+TRANSLATION_TABLE = _build_table()
+
+# A ZWNJ only matters between two letters; runs and stray ones are dropped
+ZWNJ_RUNS = re.compile(ZWNJ + '{2,}')
+STRAY_ZWNJ = re.compile(r'(?<!\w)' + ZWNJ + '|' + ZWNJ + r'(?!\w)')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize Persian/Arabic script (see module docstring)
+
+    Args:
+        text: Extracted text
+
+    Returns:
+        Normalized text
+    """
+    text = text.translate(TRANSLATION_TABLE)
+    if ZWNJ in text:
+        text = STRAY_ZWNJ.sub('', ZWNJ_RUNS.sub(ZWNJ, text))
+    return text
+
+
+def normalize_key(text: str) -> str:
+    """Normalized, case-folded and whitespace-collapsed form for exact matching (e.g. skill names)"""
+    return ' '.join(normalize_text(text).casefold().split())
+
+
+def normalization_enabled() -> bool:
+    return os.getenv('TEXT_NORMALIZATION', 'true').lower() == 'true'
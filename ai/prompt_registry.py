@@ -0,0 +1,174 @@
+"""
+Registry of prompt templates in ai/prompts.
+
+Each template is read from disk once, validated, hashed and kept in memory.
+The file's modification time is re-checked at most every
+PROMPT_RELOAD_INTERVAL seconds, so editing a prompt takes effect without a
+restart, while the hot path costs a dictionary lookup.
+
+A template either uses str.format placeholders such as {resume_text} (and
+then must escape literal braces as {{ }}), or has no placeholders at all and
+is sent verbatim. The content hash (SHA-256 of the file bytes) identifies a
+prompt version, e.g. in parse cache keys.
+
+Configuration (environment variables):
+    PROMPT_RELOAD_INTERVAL: Seconds between modification-time checks,
+        0 to check on every use (default: 1.0)
+"""
+import hashlib
+import os
+import re
+import string
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+# {name} but not {{name}}
+PLACEHOLDER_PATTERN = re.compile(r'(?<!\{)\{([A-Za-z_]\w*)\}(?!\})')
+
+
+class PromptError(ValueError):
+    """A prompt template is missing, malformed or lacks a required placeholder"""
+
+
+class PromptTemplate:
+    """A loaded prompt template"""
+
+    def __init__(self, name: str, path: Optional[Path], text: str, sha256: str, mtime: float):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.sha256 = sha256
+        self.mtime = mtime
+        self.placeholders = frozenset(PLACEHOLDER_PATTERN.findall(text))
+        self._splits: Dict[str, Tuple[str, str]] = {}
+        if self.placeholders:
+            self._validate()
+
+    @classmethod
+    def from_text(cls, text: str, name: str = '<inline>') -> 'PromptTemplate':
+        """A template from a string rather than a file in ai/prompts"""
+        return cls(name, None, text, hashlib.sha256(text.encode('utf-8')).hexdigest(), 0.0)
+
+    def _validate(self):
+        try:
+            fields = {field for _, field, _, _ in string.Formatter().parse(self.text) if field is not None}
+        except ValueError as e:
+            raise PromptError(f"Prompt {self.name} is not a valid format string: {e}")
+        unexpected = sorted(field for field in fields if field not in self.placeholders)
+        if unexpected:
+            raise PromptError(
+                f"Prompt {self.name} has unescaped braces around {unexpected}; "
+                "write literal braces as {{ }} in a template with placeholders"
+            )
+
+    def format(self, **values) -> str:
+        """
+        Fill in the placeholders (templates without placeholders are returned as-is)
+
+        Raises:
+            PromptError: If a placeholder has no value
+        """
+        if not self.placeholders:
+            return self.text
+        missing = sorted(self.placeholders - set(values))
+        if missing:
+            raise PromptError(f"Prompt {self.name} needs values for {missing}")
+        return self.text.format(**values)
+
+    def split(self, placeholder: str) -> Optional[Tuple[str, str]]:
+        """
+        The text before and after a placeholder, with brace escaping undone
+
+        Returns:
+            Tuple of (head, tail), or None if the template lacks the placeholder
+        """
+        if placeholder not in self.placeholders:
+            return None
+        if placeholder not in self._splits:
+            head, _, tail = self.text.partition("{" + placeholder + "}")
+            unescape = lambda text: text.replace("{{", "{").replace("}}", "}")
+            self._splits[placeholder] = (unescape(head), unescape(tail))
+        return self._splits[placeholder]
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class PromptRegistry:
+    """Loads templates from a directory once and reloads them when the file changes"""
+
+    def __init__(self, directory: Path, reload_interval: Optional[float] = None):
+        self.directory = Path(directory)
+        if reload_interval is None:
+            reload_interval = float(os.getenv('PROMPT_RELOAD_INTERVAL', '1.0'))
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._checked_at: Dict[str, float] = {}
+
+    def get(self, name: str, require: Iterable[str] = ()) -> PromptTemplate:
+        """
+        Return the template ai/prompts/{name}.md
+
+        Args:
+            name: Prompt file name without .md extension
+            require: Placeholders the caller is going to fill in
+
+        Raises:
+            FileNotFoundError: If the prompt file doesn't exist
+            PromptError: If the template is malformed or lacks a required placeholder
+        """
+        now = time.monotonic()
+        template = self._templates.get(name)
+        if template is None or now - self._checked_at.get(name, 0) >= self.reload_interval:
+            template = self._refresh(name, now)
+
+        missing = sorted(set(require) - template.placeholders)
+        if missing:
+            raise PromptError(f"Prompt {name} lacks placeholders {missing}")
+        return template
+
+    def _refresh(self, name: str, now: float) -> PromptTemplate:
+        path = self.directory / f"{name}.md"
+        with self._lock:
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                self._templates.pop(name, None)
+                raise FileNotFoundError(f"Prompt file not found: {path}")
+
+            template = self._templates.get(name)
+            if template is None or template.mtime != mtime:
+                data = path.read_bytes()
+                template = PromptTemplate(
+                    name, path, data.decode('utf-8'), hashlib.sha256(data).hexdigest(), mtime
+                )
+                self._templates[name] = template
+            self._checked_at[name] = now
+            return template
+
+    def clear(self):
+        """Forget every loaded template"""
+        with self._lock:
+            self._templates.clear()
+            self._checked_at.clear()
+
+
+_registry = PromptRegistry(Path(__file__).parent / 'prompts')
+
+
+def get_prompt(name: str, require: Iterable[str] = ()) -> PromptTemplate:
+    """Return a template from the process-wide registry (see PromptRegistry.get)"""
+    return _registry.get(name, require)
+
+
+def as_prompt_template(prompt: Union[PromptTemplate, str]) -> PromptTemplate:
+    """Accept a template string where a PromptTemplate is expected (callers predating the registry)"""
+    return prompt if isinstance(prompt, PromptTemplate) else PromptTemplate.from_text(prompt)
+
+
+def prompt_hash(name: str) -> str:
+    """Content hash of a prompt, usable as its version in cache keys"""
+    return _registry.get(name).sha256
@@ -0,0 +1,252 @@
+"""
+Token-bucket rate limiting for OpenRouter calls.
+
+Each model gets two buckets: requests per minute and tokens per minute.
+A call reserves one request and its estimated tokens up front, waiting only
+as long as the buckets need to refill, and the token estimate is corrected
+with the real usage once the response arrives. An attempt that fails before
+the model generated anything (throttled, server error, network failure)
+gives its token estimate back, so retries do not reserve it twice. Bucket state lives in a
+pluggable backend so several workers can share one quota:
+
+    MemoryBackend: threads of a single process
+    FileLockBackend: processes on one host (fcntl-locked state file)
+    Database backend: every host sharing the database (configured by the
+        Django app, see processing.ratelimit)
+
+Configuration (environment variables):
+    OPENROUTER_RATE_LIMITS: JSON object of per-model limits, e.g.
+        {"default": {"rpm": 20}, "openai/gpt-4o-mini": {"rpm": 60, "tpm": 200000}}
+        A limit of 0 (or a missing key) means unlimited. Default: 20 rpm.
+    OPENROUTER_RATE_LIMIT_BACKEND: "memory" (default), "file" or "db"
+    OPENROUTER_RATE_LIMIT_FILE: State file for the file backend
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+DEFAULT_LIMITS = {'default': {'rpm': 20, 'tpm': 0}}
+
+
+def take_tokens(state: Optional[Dict[str, float]], amount: float, capacity: float,
+                rate: float, now: float):
+    """
+    Reserve tokens from a bucket
+
+    The bucket may go negative: the caller owns the reservation and waits
+    until the deficit has refilled, so waiting callers are served in order.
+
+    Args:
+        state: {'tokens', 'updated_at'} or None for a new (full) bucket
+        amount: Tokens to take (negative to give tokens back)
+        capacity: Bucket size (the burst allowance)
+        rate: Tokens refilled per second
+        now: Current wall-clock time
+
+    Returns:
+        Tuple of (new state, seconds to wait)
+    """
+    if state is None:
+        tokens = capacity
+    else:
+        elapsed = max(now - state['updated_at'], 0)
+        tokens = min(capacity, state['tokens'] + elapsed * rate)
+    tokens = min(capacity, tokens - min(amount, capacity))
+    wait = -tokens / rate if tokens < 0 else 0.0
+    return {'tokens': tokens, 'updated_at': now}, wait
+
+
+class MemoryBackend:
+    """Bucket state shared by the threads of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[str, float]] = {}
+
+    def take(self, key: str, amount: float, capacity: float, rate: float) -> float:
+        with self._lock:
+            state, wait = take_tokens(self._buckets.get(key), amount, capacity, rate, time.time())
+            self._buckets[key] = state
+            return wait
+
+
+class FileLockBackend:
+    """Bucket state shared by the processes of one host through a locked JSON file"""
+
+    def __init__(self, path: Optional[str] = None):
+        if not HAS_FCNTL:
+            raise RuntimeError("The file rate limit backend requires fcntl (Unix only)")
+        self.path = path or os.path.join(tempfile.gettempdir(), 'hirescan-ratelimit.json')
+        self._lock = threading.Lock()
+
+    def take(self, key: str, amount: float, capacity: float, rate: float) -> float:
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    buckets = json.loads(f.read() or '{}')
+                except json.JSONDecodeError:
+                    buckets = {}
+                state, wait = take_tokens(buckets.get(key), amount, capacity, rate, time.time())
+                buckets[key] = state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(buckets))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            return wait
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """
+    Rough token count for a chat completion request
+
+    About four characters per token for the messages, plus the completion
+    budget when max_tokens is set. Corrected later by record_usage().
+    Values encoded only when sent (streamed file data URLs) count by their
+    len() without being encoded.
+    """
+    streamed_chars = 0
+
+    def placeholder(value):
+        nonlocal streamed_chars
+        streamed_chars += len(value)
+        return ''
+
+    prompt_chars = len(json.dumps(payload.get('messages', []), ensure_ascii=False, default=placeholder))
+    return (prompt_chars + streamed_chars) // 4 + int(payload.get('max_tokens') or 0)
+
+
+class RateLimiter:
+    """Per-model requests/min and tokens/min limiter over a bucket backend"""
+
+    def __init__(self, backend=None, limits: Optional[Dict[str, Dict[str, int]]] = None):
+        self.backend = backend or MemoryBackend()
+        self.limits = limits or DEFAULT_LIMITS
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def limits_for(self, model: str) -> Dict[str, int]:
+        return self.limits.get(model) or self.limits.get('default') or {}
+
+    def _take(self, model: str, kind: str, amount: float) -> float:
+        per_minute = self.limits_for(model).get(kind) or 0
+        if per_minute <= 0 or not amount:
+            return 0.0
+        return self.backend.take(f"{model}:{kind}", amount, per_minute, per_minute / 60.0)
+
+    def reserve(self, model: str, tokens: int = 0) -> float:
+        """
+        Reserve one request and `tokens` tokens for a model without waiting
+
+        Returns:
+            Seconds the caller must wait before sending the request
+        """
+        wait = max(self._take(model, 'rpm', 1), self._take(model, 'tpm', tokens))
+        with self._stats_lock:
+            self.acquired += 1
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+        return wait
+
+    def acquire(self, model: str, tokens: int = 0) -> float:
+        """
+        Reserve one request and `tokens` tokens for a model, sleeping if needed
+
+        Returns:
+            Seconds spent waiting
+        """
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, model: str, tokens: int = 0,
+                            run_blocking: Callable[..., Awaitable[float]] = asyncio.to_thread) -> float:
+        """
+        Like acquire(), but waits without blocking the event loop
+
+        Backends may do blocking I/O (file lock, database), so the reservation
+        runs through run_blocking(func, *args) (default: asyncio.to_thread).
+        """
+        wait = await run_blocking(self.reserve, model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def refund(self, model: str, tokens: int):
+        """Give back the tokens reserved for an attempt that failed without using them"""
+        self._take(model, 'tpm', -tokens)
+
+    def record_usage(self, model: str, estimated: int, actual: Optional[int]):
+        """Correct a reservation with the token usage reported by the API"""
+        if actual is not None:
+            self._take(model, 'tpm', actual - estimated)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'limits': self.limits,
+                'acquired': self.acquired,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+            }
+
+
+def _limits_from_env() -> Dict[str, Dict[str, int]]:
+    raw = os.getenv('OPENROUTER_RATE_LIMITS')
+    if not raw:
+        return DEFAULT_LIMITS
+    try:
+        limits = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"OPENROUTER_RATE_LIMITS is not valid JSON: {e}")
+    if not isinstance(limits, dict):
+        raise ValueError("OPENROUTER_RATE_LIMITS must be a JSON object keyed by model")
+    return limits
+
+
+def _backend_from_env():
+    name = os.getenv('OPENROUTER_RATE_LIMIT_BACKEND', 'memory').lower()
+    if name == 'file':
+        return FileLockBackend(os.getenv('OPENROUTER_RATE_LIMIT_FILE') or None)
+    # "db" is installed by the Django app via configure_rate_limiter()
+    return MemoryBackend()
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, creating it on first use"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(_backend_from_env(), _limits_from_env())
+    return _limiter
+
+
+def configure_rate_limiter(backend=None, limits: Optional[Dict[str, Dict[str, int]]] = None) -> RateLimiter:
+    """Replace the process-wide rate limiter (e.g. to use a shared backend)"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = RateLimiter(backend or _backend_from_env(), limits or _limits_from_env())
+    return _limiter
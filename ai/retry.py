@@ -0,0 +1,158 @@
+"""
+Retry policy for OpenRouter calls.
+
+Errors are classified as retryable (429, 408, 5xx, network failures) or
+fatal (other 4xx such as a bad key or an unknown model). Retryable errors
+are retried with capped exponential backoff and full jitter, waiting at
+least as long as the server's Retry-After header asks. An optional
+on_retry hook lets callers record each retry and veto it, e.g. when a
+batch has used up its retry budget.
+
+Configuration (environment variables):
+    OPENROUTER_MAX_ATTEMPTS: Attempts per call, including the first (default: 3)
+    OPENROUTER_RETRY_BASE_DELAY: Backoff base in seconds (default: 1.0)
+    OPENROUTER_RETRY_MAX_DELAY: Cap for a single backoff in seconds (default: 30)
+"""
+import asyncio
+import inspect
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class OpenRouterError(Exception):
+    """An OpenRouter call failed; `retryable` tells whether trying again may help"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def is_retryable_status(status_code: Optional[int]) -> bool:
+    """Network errors (no status), throttling and server errors are worth retrying"""
+    if status_code is None:
+        return True
+    return status_code in RETRYABLE_STATUS_CODES or 520 <= status_code <= 529
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def error_from_response(response: Any, message: str) -> OpenRouterError:
+    """Build a classified OpenRouterError from a failed TransportResponse"""
+    status_code = response.status_code
+    return OpenRouterError(
+        message,
+        status_code=status_code,
+        retryable=is_retryable_status(status_code),
+        retry_after=parse_retry_after(response.headers.get('Retry-After')),
+    )
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> 'RetryPolicy':
+        return cls(
+            max_attempts=int(os.getenv('OPENROUTER_MAX_ATTEMPTS', '3')),
+            base_delay=float(os.getenv('OPENROUTER_RETRY_BASE_DELAY', '1.0')),
+            max_delay=float(os.getenv('OPENROUTER_RETRY_MAX_DELAY', '30')),
+        )
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number `attempt` (1-based)"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            # The server knows best; still add jitter so clients don't return in lockstep
+            return retry_after + backoff / 2
+        return backoff
+
+
+def call_with_retry(
+    func: Callable[[], Any],
+    policy: Optional[RetryPolicy] = None,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], bool]] = None,
+) -> Any:
+    """
+    Call func(), retrying retryable OpenRouterErrors
+
+    Args:
+        func: Zero-argument callable making one attempt
+        policy: RetryPolicy (default: from environment)
+        on_retry: Called as on_retry(attempt, error, delay) before each retry;
+                  returning False gives up and re-raises the error
+
+    Raises:
+        OpenRouterError: When the error is fatal, attempts run out or on_retry refuses
+    """
+    policy = policy or RetryPolicy.from_env()
+    attempt = 1
+    while True:
+        try:
+            return func()
+        except OpenRouterError as e:
+            if not e.retryable or attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, e.retry_after)
+            if on_retry is not None and on_retry(attempt, e, delay) is False:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+async def call_with_retry_async(
+    func: Callable[[], Awaitable[Any]],
+    policy: Optional[RetryPolicy] = None,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], Any]] = None,
+) -> Any:
+    """
+    Async version of call_with_retry()
+
+    func is a zero-argument coroutine function. on_retry may be a plain or
+    a coroutine function; sleeping between attempts does not block the loop.
+    """
+    policy = policy or RetryPolicy.from_env()
+    attempt = 1
+    while True:
+        try:
+            return await func()
+        except OpenRouterError as e:
+            if not e.retryable or attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, e.retry_after)
+            if on_retry is not None:
+                allowed = on_retry(attempt, e, delay)
+                if inspect.isawaitable(allowed):
+                    allowed = await allowed
+                if allowed is False:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -2,31 +2,48 @@
 Standalone AI service for processing files with prompts using OpenRouter API
 """
 import os
-import base64
+import contextvars
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, Optional
-import requests
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
 
-# Try to import PDF/DOCX text extraction libraries
+# Support both package imports (ai.service) and running from the ai folder
 try:
-    import PyPDF2
-    HAS_PYPDF2 = True
+    from .transport import get_transport, TransportError
+    from .ratelimit import get_rate_limiter, estimate_tokens
+    from .concurrency import get_concurrency_limiter
+    from .upload import FileDataURL, file_data_url, request_body
+    from .budget import fit_text_budget
+    from .retry import OpenRouterError, call_with_retry, error_from_response
+    from .circuit import call_with_failover, track_attempt
+    from .usage import record_response_usage
+    from .streaming import stream_chat_request
+    from .extraction_cache import extract_text_cached as _extract
+    from .prompt_registry import PromptTemplate, as_prompt_template, get_prompt
 except ImportError:
-    HAS_PYPDF2 = False
-
-try:
-    from docx import Document
-    HAS_DOCX = True
-except ImportError:
-    HAS_DOCX = False
+    from transport import get_transport, TransportError
+    from ratelimit import get_rate_limiter, estimate_tokens
+    from concurrency import get_concurrency_limiter
+    from upload import FileDataURL, file_data_url, request_body
+    from budget import fit_text_budget
+    from retry import OpenRouterError, call_with_retry, error_from_response
+    from circuit import call_with_failover, track_attempt
+    from usage import record_response_usage
+    from streaming import stream_chat_request
+    from extraction_cache import extract_text_cached as _extract
+    from prompt_registry import PromptTemplate, as_prompt_template, get_prompt
 
 
 def load_prompt(prompt_name: str) -> str:
     """
     Load prompt template from ai/prompts/{prompt_name}.md
     
+    Templates are cached by the prompt registry (see prompt_registry.get_prompt).
+    
     Args:
         prompt_name: Name of the prompt file without .md extension
         
@@ -36,16 +53,7 @@ def load_prompt(prompt_name: str) -> str:
     Raises:
         FileNotFoundError: If prompt file doesn't exist
     """
-    # Get the directory where this file is located
-    current_dir = Path(__file__).parent
-    prompts_dir = current_dir / 'prompts'
-    prompt_path = prompts_dir / f"{prompt_name}.md"
-    
-    if not prompt_path.exists():
-        raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
-    
-    with open(prompt_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    return get_prompt(prompt_name).text
 
 
 def _get_mime_type(file_path: str) -> str:
@@ -63,13 +71,18 @@ def _get_mime_type(file_path: str) -> str:
         '.pdf': 'application/pdf',
         '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
         '.doc': 'application/msword',
+        '.jpg': 'image/jpeg',
+        '.jpeg': 'image/jpeg',
+        '.png': 'image/png',
+        '.webp': 'image/webp',
     }
     return mime_types.get(ext, 'application/octet-stream')
 
 
 def _extract_text_from_file(file_path: str) -> str:
     """
-    Extract text from PDF or DOCX file
+    Extract text from PDF or DOCX file (through the extraction cache when
+    EXTRACTION_CACHE_DIR is set)
     
     Args:
         file_path: Path to the file
@@ -77,61 +90,115 @@ def _extract_text_from_file(file_path: str) -> str:
     Returns:
         Extracted text as string
     """
-    file_ext = Path(file_path).suffix.lower()
-    
-    if file_ext == '.pdf':
-        if not HAS_PYPDF2:
-            raise ImportError("PyPDF2 is required for PDF text extraction. Install it with: pip install PyPDF2")
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
-        except Exception as e:
-            raise ValueError(f"Error reading PDF: {str(e)}")
-    
-    elif file_ext in ['.doc', '.docx']:
-        if not HAS_DOCX:
-            raise ImportError("python-docx is required for DOCX text extraction. Install it with: pip install python-docx")
-        try:
-            doc = Document(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            return text
-        except Exception as e:
-            raise ValueError(f"Error reading DOCX: {str(e)}")
-    
-    else:
-        raise ValueError(f"Text extraction not supported for file type: {file_ext}")
+    return _extract(file_path).text
 
 
-def _file_to_base64_data_url(file_path: str) -> str:
+def _file_to_base64_data_url(file_path: str) -> FileDataURL:
     """
     Convert file to base64 data URL
     
+    The file is not read here: the returned FileDataURL is encoded in blocks
+    while the request is sent (see upload.py).
+    
     Args:
         file_path: Path to the file (absolute or relative)
         
     Returns:
-        Base64 data URL string
+        FileDataURL for the request payload
+        
+    Raises:
+        FileTooLargeError: If the file is above OPENROUTER_MAX_FILE_MB
+    """
+    return file_data_url(file_path, _get_mime_type(file_path))
+
+
+def supports_cache_control(model: str) -> bool:
+    """
+    Whether a model needs explicit cache_control breakpoints for prompt caching
+    
+    Anthropic and Gemini models only cache marked prefixes; OpenAI, DeepSeek
+    and others cache long prefixes automatically. Set OPENROUTER_PROMPT_CACHE=false
+    to send no hints, or OPENROUTER_CACHE_CONTROL_MODELS to a comma-separated
+    list of model name prefixes.
     """
-    file_path_obj = Path(file_path)
-    if not file_path_obj.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
+    if os.getenv('OPENROUTER_PROMPT_CACHE', 'true').lower() not in ('1', 'true', 'yes'):
+        return False
+    prefixes = os.getenv('OPENROUTER_CACHE_CONTROL_MODELS', 'anthropic/,google/gemini')
+    return any(model.startswith(prefix.strip()) for prefix in prefixes.split(',') if prefix.strip())
+
+
+def cacheable_content(text: str, model: str) -> Any:
+    """Message content for a static prompt prefix, marked cacheable where the model supports it"""
+    if not supports_cache_control(model):
+        return text
+    return [
+        {
+            "type": "text",
+            "text": text,
+            "cache_control": {"type": "ephemeral"}
+        }
+    ]
+
+
+def split_prompt(prompt: Union[PromptTemplate, str], resume_text: str) -> Tuple[str, str]:
+    """
+    Split a prompt into its static instructions and the per-call text
     
-    # Read file as binary
-    with open(file_path_obj, 'rb') as f:
-        file_content = f.read()
+    The {resume_text} placeholder is the boundary: everything before it is
+    identical across calls and can be served from the provider's prompt
+    cache; the resume text and whatever follows the placeholder go after it.
+    Templates without the placeholder are static as a whole.
     
-    # Encode to base64
-    base64_content = base64.b64encode(file_content).decode('utf-8')
+    Args:
+        prompt: PromptTemplate, or a template string
+        resume_text: Text to put in place of {resume_text}
     
-    # Get MIME type
-    mime_type = _get_mime_type(file_path)
+    Returns:
+        Tuple of (static prefix, per-call text)
+    """
+    prompt = as_prompt_template(prompt)
+    parts = prompt.split("resume_text")
+    if parts is None:
+        return prompt.text, f"Resume text:\n{resume_text}"
+    head, tail = parts
+    return head, f"{resume_text}{tail}"
+
+
+def prompt_instructions(prompt: Union[PromptTemplate, str]) -> str:
+    """The prompt without its {resume_text} placeholder, for requests that send the resume separately"""
+    prompt = as_prompt_template(prompt)
+    parts = prompt.split("resume_text")
+    if parts is None:
+        return prompt.text
+    head, tail = parts
+    return f"{head.rstrip()}\n{tail.lstrip()}".rstrip()
+
+
+def prompt_messages(
+    system_prompt: str,
+    prompt_template: str,
+    model: str,
+    user_content: Any
+) -> list:
+    """
+    Build chat messages with the static prompt as a cacheable system prefix
     
-    # Return data URL
-    return f"data:{mime_type};base64,{base64_content}"
+    Args:
+        system_prompt: Short role description, sent first
+        prompt_template: Static instructions (see split_prompt)
+        model: Model the request is for (decides cache_control hints)
+        user_content: The per-call part (text or a list of content parts)
+    """
+    return [
+        {
+            "role": "system",
+            "content": cacheable_content(f"{system_prompt}\n\n{prompt_template}", model)
+        },
+        {
+            "role": "user",
+            "content": user_content
+        }
+    ]
 
 
 def process_file_with_prompt(
@@ -139,6 +206,10 @@ def process_file_with_prompt(
     prompt_name: str,
     model: str,
     extract_text: bool = None,
+    resume_text: Optional[str] = None,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], bool]] = None,
+    stream: Optional[bool] = None,
+    deadline: Optional[float] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
@@ -160,6 +231,16 @@ def process_file_with_prompt(
         extract_text: If True, extract text from PDF/DOCX and send as text instead of file.
                      If None (default), auto-detect: try file first, fallback to text for PDFs.
                      If False, always send as file (may fail for PDFs).
+        resume_text: Already-extracted text for the file. When given, the file is not
+                     read again and this text is sent as given: the caller fits it
+                     to the budget (fit_text_budget) and keeps the TextBudget notes.
+                     Text extracted here is fitted here.
+        on_retry: Optional hook called as on_retry(attempt, error, delay) before each
+                  retry; return False to give up (e.g. retry budget exhausted)
+        stream: Stream the response and stop as soon as the JSON answer is complete
+                or is an {"error": true} rejection (default: OPENROUTER_STREAM)
+        deadline: Seconds allowed per streamed attempt (default: OPENROUTER_STREAM_DEADLINE,
+                  0 for none)
         **kwargs: Optional OpenRouter API parameters:
             - temperature (float): Controls randomness (0.0-2.0)
             - max_tokens (int): Maximum tokens to generate
@@ -172,17 +253,130 @@ def process_file_with_prompt(
         OpenRouter API response as dictionary (parsed JSON)
         
     Raises:
-        ValueError: If OPENROUTER_API_KEY is not set
+        ValueError: If OPENROUTER_API_KEY is not set, or extract_text is True for
+                    a file that is not a PDF or DOCX
         FileNotFoundError: If file or prompt doesn't exist
-        Exception: If OpenRouter API request fails
+        OpenRouterError: If the OpenRouter API request fails (after retries)
+        StreamDeadlineExceeded: If a streamed attempt runs past its deadline
+    """
+    if stream is None:
+        stream = os.getenv('OPENROUTER_STREAM', 'false').lower() in ('1', 'true', 'yes')
+    if deadline is None:
+        deadline = float(os.getenv('OPENROUTER_STREAM_DEADLINE', '0'))
+    
+    url, headers, payload, timeout = build_chat_request(
+        file_path, prompt_name, model,
+        extract_text=extract_text, resume_text=resume_text, **kwargs
+    )
+    if stream:
+        result = stream_chat_request(url, headers, payload, timeout, deadline=deadline or None, on_retry=on_retry)
+    else:
+        result = send_chat_request(url, headers, payload, timeout, on_retry=on_retry)
+    return parse_chat_content(result)
+
+
+def chat_endpoint() -> Tuple[str, Dict[str, str]]:
+    """
+    Return the chat completions URL and request headers
+    
+    Raises:
+        ValueError: If OPENROUTER_API_KEY is not set
     """
     # Get API key from environment
     api_key = os.getenv('OPENROUTER_API_KEY')
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY is not set in environment variables")
     
-    # Load prompt template
-    prompt_template = load_prompt(prompt_name)
+    base_url = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+    url = f"{base_url}/chat/completions"
+    
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/hirescan",
+        "X-Title": "HireScan",
+    }
+    return url, headers
+
+
+def send_chat_request(
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+    timeout: float = 60,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Send a chat completion request under the rate limiter and retry policy
+    
+    Returns:
+        The response JSON
+        
+    Raises:
+        OpenRouterError: If the request fails (after retries)
+    """
+    model = payload["model"]
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(payload)
+    
+    latency = None
+    
+    def attempt():
+        nonlocal latency
+        # Every attempt waits for the model's requests/min and tokens/min budget
+        limiter.acquire(model, estimated_tokens)
+        try:
+            # ...then for a slot under the adaptive concurrency limit
+            with get_concurrency_limiter().slot(), track_attempt(model):
+                started = time.monotonic()
+                try:
+                    # Files are encoded while they are sent, into a fresh body per attempt
+                    post_headers, body = request_body(headers, payload)
+                    # Make API request over the shared keep-alive connection pool
+                    response = get_transport().post(url, headers=post_headers, timeout=timeout, **body)
+                except TransportError as e:
+                    raise OpenRouterError(f"OpenRouter API error: {str(e)}", retryable=True)
+                result = read_chat_response(response, url, model)
+                latency = time.monotonic() - started
+        except OpenRouterError:
+            # Nothing was generated; the next attempt reserves the estimate again
+            limiter.refund(model, estimated_tokens)
+            raise
+        return result
+    
+    # Throttling, server errors and network failures are retried with backoff
+    result = call_with_retry(attempt, on_retry=on_retry)
+    limiter.record_usage(model, estimated_tokens, result.get("usage", {}).get("total_tokens"))
+    record_response_usage(model, result, latency)
+    return result
+
+
+def build_chat_request(
+    file_path: str,
+    prompt_name: str,
+    model: str,
+    extract_text: bool = None,
+    resume_text: Optional[str] = None,
+    **kwargs
+) -> Tuple[str, Dict[str, str], Dict[str, Any], float]:
+    """
+    Build the chat completion request for process_file_with_prompt
+    
+    Shared by the sync and async clients; see process_file_with_prompt for
+    the arguments. Reads the file unless resume_text is given.
+    
+    Returns:
+        Tuple of (url, headers, payload, timeout)
+        
+    Raises:
+        ValueError: If extract_text is True for a file that is not a PDF or DOCX
+                    and no resume_text is given
+    """
+    # Fails early if OPENROUTER_API_KEY is not set
+    url, headers = chat_endpoint()
+    
+    # Load prompt template (cached by the registry)
+    prompt = get_prompt(prompt_name)
     
     # Check file type
     file_ext = Path(file_path).suffix.lower()
@@ -193,28 +387,34 @@ def process_file_with_prompt(
         # Auto-detect: For PDFs, prefer text extraction (more reliable)
         extract_text = is_pdf_or_docx
     
+    # Text extracted upstream is used instead of reading the file
+    if resume_text is not None:
+        extract_text = True
+    elif extract_text and not is_pdf_or_docx:
+        raise ValueError(
+            f"Text extraction is only supported for PDF and DOCX files, not {file_ext or Path(file_path).name}; "
+            f"pass resume_text or extract_text=False"
+        )
+    
     # Prepare messages based on extraction method
-    if extract_text and is_pdf_or_docx:
+    if extract_text:
         # Extract text and send as text content
         try:
-            file_text = _extract_text_from_file(file_path)
-            # Format prompt with extracted text (if prompt has {resume_text} placeholder)
-            if "{resume_text}" in prompt_template:
-                full_prompt = prompt_template.format(resume_text=file_text)
+            if resume_text is not None:
+                # Fitted by the caller, which owns the budget and its notes
+                file_text = resume_text
             else:
-                # Append text to prompt
-                full_prompt = f"{prompt_template}\n\nResume text:\n{file_text}"
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": "You are an expert AI assistant. Process the provided resume text according to the instructions and return valid JSON when requested."
-                },
-                {
-                    "role": "user",
-                    "content": full_prompt
-                }
-            ]
+                # Long documents are cut down to RESUME_TOKEN_BUDGET, keeping the key sections
+                file_text = fit_text_budget(_extract_text_from_file(file_path)).text
+            # The instructions form a stable prefix and the resume text follows,
+            # so providers can serve the prefix from their prompt cache
+            static_prompt, user_text = split_prompt(prompt, file_text)
+            messages = prompt_messages(
+                "You are an expert AI assistant. Process the provided resume text according to the instructions and return valid JSON when requested.",
+                static_prompt,
+                model,
+                user_text
+            )
         except (ImportError, ValueError) as e:
             # If text extraction fails, fall back to file upload
             print(f"⚠️  Warning: Text extraction failed ({e}), trying file upload instead...")
@@ -222,40 +422,21 @@ def process_file_with_prompt(
     
     if not extract_text:
         # Send file as base64 data URL
-        file_data_url = _file_to_base64_data_url(file_path)
+        data_url = _file_to_base64_data_url(file_path)
         
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an expert AI assistant. Process the provided file according to the instructions and return valid JSON when requested."
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt_template
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": file_data_url
-                        }
+        messages = prompt_messages(
+            "You are an expert AI assistant. Process the provided file according to the instructions and return valid JSON when requested.",
+            prompt_instructions(prompt),
+            model,
+            [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": data_url
                     }
-                ]
-            }
-        ]
-    
-    # Prepare API request
-    base_url = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
-    url = f"{base_url}/chat/completions"
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/hirescan",
-        "X-Title": "HireScan",
-    }
+                }
+            ]
+        )
     
     # Extract timeout from kwargs if provided, default to 60
     timeout = kwargs.pop('timeout', 60)
@@ -264,30 +445,45 @@ def process_file_with_prompt(
     payload = {
         "model": model,
         "messages": messages,
+        "usage": {"include": True},  # Ask OpenRouter to report the cost of the call
         **kwargs  # Include any additional parameters (temperature, max_tokens, etc.)
     }
     
+    return url, headers, payload, timeout
+
+
+def read_chat_response(response: Any, url: str, model: str) -> Dict[str, Any]:
+    """
+    Return the JSON body of a chat completion response
+    
+    Raises:
+        OpenRouterError: For non-2xx responses, classified for retries
+        ValueError: If the body is not JSON
+    """
+    # If request failed, show detailed error
+    if not response.ok:
+        error_detail = "Unknown error"
+        try:
+            error_response = response.json()
+            error_detail = json.dumps(error_response, indent=2)
+        except:
+            error_detail = response.text
+        raise error_from_response(
+            response,
+            f"OpenRouter API error ({response.status_code}): {response.reason}\n"
+            f"Response: {error_detail}\n"
+            f"Request URL: {url}\n"
+            f"Model: {model}"
+        )
+    try:
+        return response.json()
+    except ValueError as e:
+        raise ValueError(f"Failed to parse JSON from OpenRouter response: {str(e)}")
+
+
+def parse_chat_content(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the message content of a chat completion, parsed as JSON when possible"""
     try:
-        # Make API request
-        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
-        
-        # If request failed, show detailed error
-        if not response.ok:
-            error_detail = "Unknown error"
-            try:
-                error_response = response.json()
-                error_detail = json.dumps(error_response, indent=2)
-            except:
-                error_detail = response.text
-            raise Exception(
-                f"OpenRouter API error ({response.status_code}): {response.reason}\n"
-                f"Response: {error_detail}\n"
-                f"Request URL: {url}\n"
-                f"Model: {model}"
-            )
-        
-        result = response.json()
-        
         # Extract content from response
         content = result.get("choices", [{}])[0].get("message", {}).get("content", "{}")
         
@@ -305,8 +501,223 @@ def process_file_with_prompt(
         
         return result
         
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"OpenRouter API error: {str(e)}")
     except json.JSONDecodeError as e:
         raise ValueError(f"Failed to parse JSON from OpenRouter response: {str(e)}")
 
+
+
+# Appended to the prompt when several resumes share one request
+BATCH_INSTRUCTIONS = """
+## Batched input
+
+The user message contains several resumes, each wrapped in <resume id="..."></resume> tags.
+Process every resume independently according to the instructions above.
+Return a single JSON object of the form
+{"results": [{"id": "<resume id>", "data": { ...the JSON for that resume... }}]}
+with exactly one entry per resume, using the ids exactly as given.
+"""
+
+
+@dataclass
+class BatchParseResult:
+    """Outcome of one resume in parse_resumes_batched()"""
+    data: Optional[Dict[str, Any]] = None
+    model: Optional[str] = None
+    error: Optional[Exception] = None
+    batched: bool = False  # False when the resume fell back to its own request
+
+
+def pack_resume_batches(
+    resumes: Dict[str, str],
+    max_tokens: int,
+    max_size: int
+) -> List[List[str]]:
+    """
+    Group resume ids into batches, in input order
+    
+    A batch is closed when adding the next resume would exceed max_tokens
+    (about four characters per token) or max_size resumes. A resume larger
+    than max_tokens gets a batch of its own.
+    
+    Returns:
+        List of batches, each a list of resume ids
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for resume_id, text in resumes.items():
+        tokens = len(text) // 4
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(resume_id)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_request(
+    prompt_name: str,
+    model: str,
+    resumes: Dict[str, str],
+    **kwargs
+) -> Tuple[str, Dict[str, str], Dict[str, Any], float]:
+    """
+    Build one chat completion request for several resume texts
+    
+    The prompt is sent once, as the system message; the resumes follow in
+    the user message, tagged with their ids.
+    
+    Returns:
+        Tuple of (url, headers, payload, timeout)
+    """
+    url, headers = chat_endpoint()
+    prompt = get_prompt(prompt_name)
+    
+    resume_blocks = "\n\n".join(
+        f'<resume id="{resume_id}">\n{text}\n</resume>'
+        for resume_id, text in resumes.items()
+    )
+    messages = [
+        {
+            "role": "system",
+            # Identical for every batch, so it is cacheable like the single-resume prompt
+            "content": cacheable_content(f"{prompt_instructions(prompt)}\n{BATCH_INSTRUCTIONS}", model)
+        },
+        {
+            "role": "user",
+            "content": resume_blocks
+        }
+    ]
+    
+    timeout = kwargs.pop('timeout', 60)
+    payload = {
+        "model": model,
+        "messages": messages,
+        "usage": {"include": True},
+        **kwargs
+    }
+    return url, headers, payload, timeout
+
+
+def split_batch_results(content: Dict[str, Any], resume_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Map a batched response back to its resume ids
+    
+    Entries with unknown ids or without a data object are dropped, so the
+    caller can retry the missing resumes on their own.
+    """
+    results = content.get("results") if isinstance(content, dict) else None
+    if not isinstance(results, list):
+        return {}
+    
+    wanted = set(resume_ids)
+    parsed = {}
+    for entry in results:
+        if not isinstance(entry, dict):
+            continue
+        resume_id = str(entry.get("id"))
+        if resume_id in wanted and isinstance(entry.get("data"), dict):
+            parsed.setdefault(resume_id, entry["data"])
+    return parsed
+
+
+def parse_resumes_batched(
+    resumes: Dict[str, str],
+    prompt_name: str,
+    models: Union[str, List[str]],
+    max_batch_tokens: Optional[int] = None,
+    max_batch_size: Optional[int] = None,
+    max_tokens_per_resume: int = 4000,
+    max_workers: int = 1,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], bool]] = None,
+    **kwargs
+) -> Dict[str, BatchParseResult]:
+    """
+    Parse several extracted resume texts with as few requests as possible
+    
+    Resumes are packed into batches (see pack_resume_batches) that share one
+    copy of the prompt. Resumes missing from a batch response, or from a
+    batch whose request failed, are retried with their own request.
+    
+    Args:
+        resumes: Resume text keyed by id (any string unique within the call),
+                 already fitted to the budget (see fit_text_budget) and sent as given
+        prompt_name: Name of the prompt file without .md extension
+        models: Model name, or list of models tried in failover order
+        max_batch_tokens: Resume text tokens per request
+                          (default: OPENROUTER_BATCH_MAX_TOKENS or 12000)
+        max_batch_size: Resumes per request (default: OPENROUTER_BATCH_MAX_SIZE or 4)
+        max_tokens_per_resume: Completion budget per resume; a batch request
+                               gets this times its size
+        max_workers: Batches sent concurrently
+        on_retry: Optional retry hook, see process_file_with_prompt
+        **kwargs: Additional OpenRouter API parameters (temperature, timeout, ...)
+    
+    Returns:
+        BatchParseResult for every id in resumes
+    """
+    if isinstance(models, str):
+        models = [models]
+    if max_batch_tokens is None:
+        max_batch_tokens = int(os.getenv('OPENROUTER_BATCH_MAX_TOKENS', '12000'))
+    if max_batch_size is None:
+        max_batch_size = int(os.getenv('OPENROUTER_BATCH_MAX_SIZE', '4'))
+    kwargs.setdefault("response_format", {"type": "json_object"})
+    
+    def parse_one(resume_id: str) -> BatchParseResult:
+        try:
+            data, model = call_with_failover(models, lambda model: process_file_with_prompt(
+                file_path=f"{resume_id}.txt",
+                prompt_name=prompt_name,
+                model=model,
+                resume_text=resumes[resume_id],
+                max_tokens=max_tokens_per_resume,
+                on_retry=on_retry,
+                **kwargs
+            ))
+        except Exception as e:
+            return BatchParseResult(error=e)
+        return BatchParseResult(data=data, model=model)
+    
+    def parse_batch(resume_ids: List[str]) -> Dict[str, BatchParseResult]:
+        if len(resume_ids) == 1:
+            return {resume_ids[0]: parse_one(resume_ids[0])}
+        
+        def send(model):
+            url, headers, payload, timeout = build_batch_request(
+                prompt_name, model,
+                {resume_id: resumes[resume_id] for resume_id in resume_ids},
+                max_tokens=max_tokens_per_resume * len(resume_ids),
+                **kwargs
+            )
+            result = send_chat_request(url, headers, payload, timeout, on_retry=on_retry)
+            return parse_chat_content(result)
+        
+        try:
+            content, model = call_with_failover(models, send)
+            parsed = split_batch_results(content, resume_ids)
+        except Exception as e:
+            print(f"⚠️  Warning: Batched request failed ({e}), parsing {len(resume_ids)} resumes one by one...")
+            parsed, model = {}, None
+        
+        # Partial failures are split back out into per-resume requests
+        return {
+            resume_id: (
+                BatchParseResult(data=parsed[resume_id], model=model, batched=True)
+                if resume_id in parsed else parse_one(resume_id)
+            )
+            for resume_id in resume_ids
+        }
+    
+    batches = pack_resume_batches(resumes, max_batch_tokens, max_batch_size)
+    results: Dict[str, BatchParseResult] = {}
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        # Worker threads keep the caller's usage labels
+        futures = [
+            executor.submit(contextvars.copy_context().run, parse_batch, batch)
+            for batch in batches
+        ]
+        for future in futures:
+            results.update(future.result())
+    return results
@@ -0,0 +1,360 @@
+"""
+Streaming chat completions with incremental JSON parsing.
+
+With stream=True OpenRouter sends the completion as server-sent events. The
+content is fed to an incremental JSON scanner as it arrives, which allows:
+
+    - ignoring any text after the top-level JSON object (the stream is
+      still read up to its usage event, for token accounting)
+    - stopping early when the model answers {"error": true, ...} (the parse
+      prompt's rejection path for unreadable resumes)
+    - enforcing a wall-clock deadline while the response is generated
+    - measuring time to first token
+
+Configuration (environment variables):
+    OPENROUTER_STREAM: "true" to stream by default (default: false)
+    OPENROUTER_STREAM_DEADLINE: Seconds allowed per streamed attempt, 0 for
+        no deadline (default: 0)
+"""
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Support both package imports (ai.streaming) and running from the ai folder
+try:
+    from .transport import get_transport, TransportError
+    from .ratelimit import get_rate_limiter, estimate_tokens
+    from .concurrency import get_concurrency_limiter
+    from .upload import request_body
+    from .retry import OpenRouterError, call_with_retry, error_from_response, is_retryable_status
+    from .usage import record_response_usage
+    from .circuit import track_attempt
+except ImportError:
+    from transport import get_transport, TransportError
+    from ratelimit import get_rate_limiter, estimate_tokens
+    from concurrency import get_concurrency_limiter
+    from upload import request_body
+    from retry import OpenRouterError, call_with_retry, error_from_response, is_retryable_status
+    from usage import record_response_usage
+    from circuit import track_attempt
+
+
+class StreamDeadlineExceeded(OpenRouterError):
+    """A streamed completion did not finish within its deadline"""
+
+
+class IncrementalJSONParser:
+    """
+    Incremental scanner for a JSON value arriving in chunks
+
+    Tracks strings and nesting to know when the top-level value is complete,
+    and collects the top-level scalar fields of an object (e.g. "error") as
+    soon as they have been read. Text before the first brace or bracket,
+    such as a ```json fence, is skipped.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.fields: Dict[str, Any] = {}
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = 'key'  # inside the top-level object: key, colon, value or comma
+        self._key: Optional[str] = None
+        self._token_start: Optional[int] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str):
+        """Scan the next piece of text"""
+        self.text += chunk
+        while self._pos < len(self.text) and self.end is None:
+            self._step(self.text[self._pos], self._pos)
+            self._pos += 1
+
+    def value(self) -> Any:
+        """
+        Return the parsed top-level value
+
+        Raises:
+            ValueError: If the value is not complete or not valid JSON
+        """
+        if not self.complete:
+            raise ValueError("JSON value is incomplete")
+        return json.loads(self.text[self.start:self.end])
+
+    def _step(self, ch: str, pos: int):
+        if self.start is None:
+            if ch in '{[':
+                self.start = pos
+                self._depth = 1
+                if ch == '[':
+                    self._expect = None
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._depth == 1 and self._token_start is not None:
+                    self._end_string(pos)
+            return
+
+        if ch == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect in ('key', 'value'):
+                self._token_start = pos
+        elif ch in '{[':
+            self._depth += 1
+            if self._depth == 2 and self._expect == 'value':
+                # Nested values are not collected
+                self._expect = 'comma'
+        elif ch in '}]':
+            if self._depth == 1:
+                self._end_scalar(pos)
+            self._depth -= 1
+            if self._depth == 0:
+                self.end = pos + 1
+        elif self._depth == 1 and self._expect is not None:
+            if ch == ':':
+                self._expect = 'value'
+            elif ch == ',':
+                self._end_scalar(pos)
+                self._expect = 'key'
+            elif self._expect == 'value' and self._token_start is None and not ch.isspace():
+                self._token_start = pos
+
+    def _end_string(self, pos: int):
+        value = json.loads(self.text[self._token_start:pos + 1])
+        if self._expect == 'key':
+            self._key = value
+            self._expect = 'colon'
+        else:
+            self.fields[self._key] = value
+            self._expect = 'comma'
+        self._token_start = None
+
+    def _end_scalar(self, pos: int):
+        if self._expect == 'value' and self._token_start is not None:
+            try:
+                self.fields[self._key] = json.loads(self.text[self._token_start:pos].strip())
+            except ValueError:
+                pass
+            self._expect = 'comma'
+        self._token_start = None
+
+
+class StreamStats:
+    """Counters for streamed completions (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.early_errors = 0
+        self.closed_early = 0
+        self.deadline_exceeded = 0
+        self.ttft_count = 0
+        self.ttft_total = 0.0
+        self.ttft_max = 0.0
+
+    def record(self, ttft: Optional[float] = None, early_error: bool = False,
+               closed_early: bool = False, deadline_exceeded: bool = False):
+        with self._lock:
+            self.streams += 1
+            self.early_errors += early_error
+            self.closed_early += closed_early
+            self.deadline_exceeded += deadline_exceeded
+            if ttft is not None:
+                self.ttft_count += 1
+                self.ttft_total += ttft
+                self.ttft_max = max(self.ttft_max, ttft)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'streams': self.streams,
+                'early_errors': self.early_errors,
+                'closed_early': self.closed_early,
+                'deadline_exceeded': self.deadline_exceeded,
+                'ttft_avg': round(self.ttft_total / self.ttft_count, 3) if self.ttft_count else None,
+                'ttft_max': round(self.ttft_max, 3),
+            }
+
+
+_stats = StreamStats()
+
+
+def get_stream_stats() -> Dict[str, Any]:
+    """Return counters and time-to-first-token figures for streamed completions"""
+    return _stats.snapshot()
+
+
+def _stream_error(chunk_error: Dict[str, Any], model: str) -> OpenRouterError:
+    """OpenRouterError for an error event sent mid-stream"""
+    code = chunk_error.get('code')
+    status_code = code if isinstance(code, int) else None
+    return OpenRouterError(
+        f"OpenRouter stream error: {chunk_error.get('message', chunk_error)}\nModel: {model}",
+        status_code=status_code,
+        retryable=is_retryable_status(status_code),
+    )
+
+
+def read_event_stream(response: Any, model: str, started: float,
+                      expires: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Read a streamed chat completion into the shape of a non-streamed one
+
+    Once the JSON answer is complete, text after it is ignored and the
+    stream is read on for its usage event. Reading stops early only once the
+    answer is known to be an {"error": true, ...} rejection, or when the
+    deadline passes after the answer is complete (its usage is then unknown).
+
+    Returns:
+        Dict with choices[0].message.content, usage (when the stream reached
+        it) and stream timings
+
+    Raises:
+        StreamDeadlineExceeded: If `expires` (a time.monotonic() value) passes
+        OpenRouterError: For error events and broken connections
+    """
+    parser = IncrementalJSONParser()
+    parts = []
+    usage = None
+    ttft = None
+    early_error = False
+    closed_early = False
+    try:
+        for line in response.iter_lines():
+            if expires is not None and time.monotonic() > expires:
+                if parser.complete:
+                    # The answer is in; only its usage is lost
+                    closed_early = True
+                    break
+                _stats.record(ttft, deadline_exceeded=True)
+                raise StreamDeadlineExceeded(
+                    f"OpenRouter stream exceeded its deadline after {time.monotonic() - started:.1f}s\nModel: {model}"
+                )
+            # Blank lines separate events; lines starting with ":" are keep-alive comments
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if chunk.get('error'):
+                raise _stream_error(chunk['error'], model)
+            if chunk.get('usage'):
+                usage = chunk['usage']
+                if parser.complete:
+                    break
+
+            delta = ((chunk.get('choices') or [{}])[0].get('delta') or {}).get('content')
+            if not delta or parser.complete:
+                continue
+            if ttft is None:
+                ttft = time.monotonic() - started
+            parts.append(delta)
+            parser.feed(delta)
+            if parser.fields.get('error') is True and ('message' in parser.fields or parser.complete):
+                early_error = closed_early = True
+                break
+    except TransportError as e:
+        raise OpenRouterError(f"OpenRouter API error: {str(e)}", retryable=True)
+    except json.JSONDecodeError as e:
+        raise OpenRouterError(f"Malformed event in OpenRouter stream: {str(e)}", retryable=True)
+
+    if early_error and not parser.complete:
+        content = json.dumps(parser.fields, ensure_ascii=False)
+    elif parser.complete:
+        content = parser.text[parser.start:parser.end]
+    else:
+        content = ''.join(parts)
+    _stats.record(ttft, early_error=early_error, closed_early=closed_early and usage is None)
+
+    return {
+        "choices": [{"message": {"content": content}}],
+        "usage": usage or {},
+        "stream": {
+            "ttft": ttft,
+            "duration": time.monotonic() - started,
+            "early_error": early_error,
+        },
+    }
+
+
+def stream_chat_request(
+    url: str,
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+    timeout: float = 60,
+    deadline: Optional[float] = None,
+    on_retry: Optional[Callable[[int, OpenRouterError, float], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Streaming version of service.send_chat_request
+
+    Args:
+        deadline: Seconds allowed per attempt, from sending the request to
+                  the end of the answer (None: no deadline)
+
+    Returns:
+        The completion in the shape of a non-streamed response
+
+    Raises:
+        StreamDeadlineExceeded: If an attempt runs past the deadline (not retried)
+        OpenRouterError: If the request fails (after retries)
+    """
+    model = payload["model"]
+    payload = {**payload, "stream": True}
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(payload)
+    if deadline:
+        timeout = min(timeout, deadline)
+
+    def attempt():
+        limiter.acquire(model, estimated_tokens)
+        with get_concurrency_limiter().slot(), track_attempt(model):
+            started = time.monotonic()
+            try:
+                try:
+                    post_headers, body = request_body(headers, payload)
+                    response = get_transport().post(url, headers=post_headers, timeout=timeout, stream=True, **body)
+                except TransportError as e:
+                    raise OpenRouterError(f"OpenRouter API error: {str(e)}", retryable=True)
+                if not response.ok:
+                    try:
+                        raise error_from_response(
+                            response,
+                            f"OpenRouter API error ({response.status_code}): {response.reason}\n"
+                            f"Response: {response.text}\n"
+                            f"Request URL: {url}\n"
+                            f"Model: {model}"
+                        )
+                    finally:
+                        response.close()
+            except OpenRouterError:
+                # Rejected before generating; the next attempt reserves the estimate again.
+                # A stream that fails part way keeps its reservation: tokens were generated
+                limiter.refund(model, estimated_tokens)
+                raise
+            try:
+                return read_event_stream(response, model, started, started + deadline if deadline else None)
+            finally:
+                # Closing early also tells the provider to stop generating
+                response.close()
+
+    result = call_with_retry(attempt, on_retry=on_retry)
+    limiter.record_usage(model, estimated_tokens, result["usage"].get("total_tokens"))
+    # Streams closed before the usage event (early errors) still count as calls, with unknown tokens
+    record_response_usage(model, result, result["stream"]["duration"])
+    return result
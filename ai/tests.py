@@ -0,0 +1,1278 @@
+"""
+Unit tests for the AI layer
+
+Run from the project root:
+    python -m unittest ai.tests
+"""
+import asyncio
+import base64
+import json
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+
+from ai.async_service import post_chat_completion
+from ai.budget import MIN_PARTIAL_TOKENS, count_tokens, fit_text_budget
+from ai.circuit import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError,
+    call_with_failover, call_with_failover_async, get_breaker, track_attempt,
+)
+from ai.concurrency import AdaptiveConcurrencyLimiter
+from ai.extraction import PDF_BACKENDS, ExtractionResult, extract_text, extractor_signature, pdf_backends
+from ai.extraction_cache import ExtractionCache, content_sha256, extract_text_cached
+from ai.normalize import normalize_key, normalize_text, normalization_enabled
+from ai.prompt_registry import PromptError, PromptRegistry, PromptTemplate, get_prompt
+from ai.ratelimit import MemoryBackend, RateLimiter, estimate_tokens, take_tokens
+from ai.retry import (
+    OpenRouterError, RetryPolicy, call_with_retry, call_with_retry_async,
+    error_from_response, is_retryable_status, parse_retry_after,
+)
+from ai.service import (
+    BATCH_INSTRUCTIONS, build_batch_request, build_chat_request, cacheable_content, pack_resume_batches,
+    parse_resumes_batched, prompt_instructions, prompt_messages, send_chat_request, split_batch_results, split_prompt,
+)
+from ai.streaming import IncrementalJSONParser, StreamDeadlineExceeded, read_event_stream
+from ai.transport import PooledTransport, TransportError, TransportResponse, get_transport
+from ai.upload import FileDataURL, FileTooLargeError, StreamedJSONBody, file_data_url, request_body
+
+
+class FitTextBudgetTests(unittest.TestCase):
+    """ai.budget.fit_text_budget"""
+
+    def test_text_within_budget_only_collapses_whitespace(self):
+        result = fit_text_budget("Jane  Doe\t\n\n\n\nPython   developer ", max_tokens=1000)
+        self.assertEqual(result.text, "Jane Doe\n\nPython developer")
+        self.assertFalse(result.truncated)
+
+    def test_zero_budget_disables_fitting(self):
+        text = "word " * 10000
+        result = fit_text_budget(text, max_tokens=0)
+        self.assertEqual(result.text, text.strip())
+        self.assertFalse(result.truncated)
+
+    def test_text_without_newlines_is_cut_not_dropped(self):
+        result = fit_text_budget("word " * 60000, max_tokens=8000)
+        self.assertLessEqual(result.tokens, 8000)
+        self.assertGreater(result.tokens, 7000)
+        self.assertTrue(result.text.startswith("word word"))
+        self.assertTrue(result.text.endswith("word [...]"))
+        self.assertEqual(result.truncated_sections, ('(start)',))
+        self.assertEqual(result.omitted_sections, ())
+
+    def test_one_huge_paragraph_after_a_heading_is_cut(self):
+        text = "Jane Doe\njane@example.com\nExperience\n" + "Built services. " * 20000
+        result = fit_text_budget(text, max_tokens=2000)
+        self.assertLessEqual(result.tokens, 2000)
+        self.assertIn("jane@example.com", result.text)
+        self.assertIn("Built services.", result.text)
+        self.assertIn("[...]", result.text)
+
+    def test_repeated_headers_are_kept_once(self):
+        pages = [f"ACME Corp confidential\nPage {n} of 40\n" + "x" * 400 for n in range(40)]
+        result = fit_text_budget("\n".join(pages), max_tokens=3000)
+        self.assertEqual(result.text.count("ACME Corp confidential"), 1)
+        self.assertEqual(result.text.count("of 40"), 1)
+        self.assertGreater(result.repeated_lines_removed, 0)
+
+    SECTIONED_RESUME = "\n".join([
+        "Jane Doe",
+        "Publications",
+        "A paper about things. " * 400,
+        "Summary",
+        "Backend developer.",
+        "Experience",
+        ("Senior engineer at Acme. " * 40).strip(),
+    ])
+
+    def test_low_priority_sections_are_omitted_first(self):
+        result = fit_text_budget(self.SECTIONED_RESUME, max_tokens=300)
+        self.assertLessEqual(result.tokens, 300)
+        self.assertIn(("Senior engineer at Acme. " * 40).strip(), result.text)
+        self.assertNotIn("A paper about things.", result.text)
+        self.assertIn("[omitted: Publications]", result.text)
+        self.assertEqual(result.omitted_sections, ('Publications',))
+
+    def test_section_crossing_the_budget_is_truncated(self):
+        result = fit_text_budget(self.SECTIONED_RESUME, max_tokens=600)
+        self.assertLessEqual(result.tokens, 600)
+        self.assertIn(("Senior engineer at Acme. " * 40).strip(), result.text)
+        self.assertIn("A paper about things.", result.text)
+        self.assertEqual(result.truncated_sections, ('Publications',))
+        # Sections stay in document order
+        self.assertLess(result.text.index("Publications"), result.text.index("Experience"))
+
+    def test_fitted_text_fits_again_unchanged(self):
+        text = "Experience\n" + "\n".join(f"Line {n} " + "detail " * 30 for n in range(500))
+        first = fit_text_budget(text, max_tokens=1500)
+        second = fit_text_budget(first.text, max_tokens=1500)
+        self.assertEqual(second.text, first.text)
+        self.assertFalse(second.truncated)
+
+    def test_budget_is_part_of_the_cache_key(self):
+        text = "word " * 5000
+        self.assertLess(fit_text_budget(text, max_tokens=500).tokens, fit_text_budget(text, max_tokens=1000).tokens)
+
+    def test_budget_from_environment(self):
+        text = "word " * 5000
+        with mock.patch.dict('os.environ', {'RESUME_TOKEN_BUDGET': '300'}):
+            self.assertLessEqual(fit_text_budget(text).tokens, 300)
+        with mock.patch.dict('os.environ', {'RESUME_TOKEN_BUDGET': '0'}):
+            self.assertFalse(fit_text_budget(text).truncated)
+
+    def test_notes(self):
+        result = fit_text_budget("word " * 5000, max_tokens=MIN_PARTIAL_TOKENS * 2)
+        notes = result.notes()
+        self.assertEqual(notes['budget_tokens'], MIN_PARTIAL_TOKENS * 2)
+        self.assertEqual(notes['sent_tokens'], result.tokens)
+        self.assertEqual(notes['original_tokens'], count_tokens("word " * 5000))
+
+    def user_text(self, **kwargs):
+        env = {'OPENROUTER_API_KEY': 'test-key', 'RESUME_TOKEN_BUDGET': '300'}
+        with mock.patch.dict('os.environ', env):
+            _, _, payload, _ = build_chat_request('cv.pdf', 'parse_resume', 'test/model', extract_text=True, **kwargs)
+        return payload['messages'][1]['content']
+
+    def test_text_extracted_for_the_request_is_fitted_there(self):
+        with mock.patch('ai.service._extract_text_from_file', return_value="word " * 5000):
+            self.assertLessEqual(count_tokens(self.user_text().strip()), 300)
+
+    def test_caller_text_is_sent_as_given(self):
+        # The caller fitted it and keeps the notes; fitting again here would be a second pass
+        with mock.patch('ai.service.fit_text_budget') as fit:
+            text = self.user_text(resume_text="word " * 5000)
+        fit.assert_not_called()
+        self.assertEqual(text.strip(), ("word " * 5000).strip())
+
+
+class CountTokensTests(unittest.TestCase):
+    """ai.budget.count_tokens"""
+
+    def test_latin_and_persian_estimates(self):
+        self.assertEqual(count_tokens("abcd" * 10), 10)
+        self.assertEqual(count_tokens("سلام" * 10), 20)
+        self.assertEqual(count_tokens(""), 0)
+
+
+class NormalizeTextTests(unittest.TestCase):
+    """ai.normalize.normalize_text and normalize_key"""
+
+    def test_arabic_letters_become_persian(self):
+        self.assertEqual(normalize_text("علي كريمي"), "علی کریمی")
+        self.assertEqual(normalize_text("مصطفى"), "مصطفی")
+
+    def test_digits_become_ascii(self):
+        self.assertEqual(normalize_text("۰۹۱۲۱۲۳۴۵۶۷"), "09121234567")
+        self.assertEqual(normalize_text("٢٠٢٣"), "2023")
+
+    def test_presentation_forms_become_base_letters(self):
+        # "سلام" as stored by PDFs that keep shaped glyphs
+        self.assertEqual(normalize_text("\ufeb3\ufee0\ufe8e\ufee1"), "سلام")
+        # Lam-alef ligature
+        self.assertEqual(normalize_text("\ufefb"), "لا")
+
+    def test_marks_and_controls_are_removed(self):
+        self.assertEqual(normalize_text("مـــهندس"), "مهندس")
+        self.assertEqual(normalize_text("مُهَنْدِس"), "مهندس")
+        self.assertEqual(normalize_text("\u200fPython\u202b\u200b"), "Python")
+        self.assertEqual(normalize_text("a\x00b\ue001c"), "abc")
+
+    def test_layout_whitespace_is_kept(self):
+        self.assertEqual(normalize_text("a\tb\nc\r\n"), "a\tb\nc\r\n")
+
+    def test_zero_width_non_joiner_is_kept_once_between_letters(self):
+        self.assertEqual(normalize_text("می\u200c\u200cخواهم"), "می\u200cخواهم")
+        self.assertEqual(normalize_text("\u200cکتاب\u200c ها"), "کتاب ها")
+
+    def test_ascii_text_is_unchanged(self):
+        text = "Senior Python developer, 2019-2023 (Tehran)"
+        self.assertEqual(normalize_text(text), text)
+
+    def test_normalize_key_matches_variants(self):
+        self.assertEqual(normalize_key("  پايتون "), normalize_key("پایتون"))
+        self.assertEqual(normalize_key("Machine\u00a0 Learning"), normalize_key("machine learning"))
+        self.assertEqual(normalize_key("PYTHON"), "python")
+
+    def test_normalization_enabled_by_environment(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertTrue(normalization_enabled())
+        with mock.patch.dict('os.environ', {'TEXT_NORMALIZATION': 'false'}):
+            self.assertFalse(normalization_enabled())
+
+    def test_normalization_is_part_of_the_extractor_signature(self):
+        # Text extracted without normalization is not reused once it is turned on
+        self.assertNotEqual(extractor_signature('cv.docx', normalize=True), extractor_signature('cv.docx', normalize=False))
+
+
+class TakeTokensTests(unittest.TestCase):
+    """ai.ratelimit.take_tokens"""
+
+    def test_new_bucket_starts_full(self):
+        state, wait = take_tokens(None, 1, capacity=10, rate=1, now=100.0)
+        self.assertEqual(state, {'tokens': 9, 'updated_at': 100.0})
+        self.assertEqual(wait, 0.0)
+
+    def test_empty_bucket_goes_negative_and_reports_the_wait(self):
+        state = {'tokens': 0.0, 'updated_at': 100.0}
+        state, wait = take_tokens(state, 2, capacity=10, rate=0.5, now=100.0)
+        self.assertEqual(state['tokens'], -2)
+        self.assertEqual(wait, 4.0)
+        # The next caller queues behind the first reservation
+        state, wait = take_tokens(state, 1, capacity=10, rate=0.5, now=100.0)
+        self.assertEqual(wait, 6.0)
+
+    def test_refill_is_capped_at_capacity(self):
+        state, wait = take_tokens({'tokens': 5.0, 'updated_at': 0.0}, 1, capacity=10, rate=1, now=1000.0)
+        self.assertEqual(state['tokens'], 9)
+        self.assertEqual(wait, 0.0)
+
+    def test_refill_over_elapsed_time(self):
+        state, wait = take_tokens({'tokens': -3.0, 'updated_at': 10.0}, 1, capacity=10, rate=1, now=12.0)
+        self.assertEqual(state['tokens'], -2)
+        self.assertEqual(wait, 2.0)
+
+    def test_clock_going_backwards_does_not_drain(self):
+        state, _ = take_tokens({'tokens': 5.0, 'updated_at': 10.0}, 1, capacity=10, rate=1, now=5.0)
+        self.assertEqual(state['tokens'], 4)
+
+    def test_requests_larger_than_the_bucket_take_at_most_its_capacity(self):
+        state, wait = take_tokens(None, 50, capacity=10, rate=1, now=0.0)
+        self.assertEqual(state['tokens'], 0)
+        self.assertEqual(wait, 0.0)
+
+    def test_negative_amounts_give_tokens_back(self):
+        state, _ = take_tokens({'tokens': 2.0, 'updated_at': 0.0}, -5, capacity=10, rate=1, now=0.0)
+        self.assertEqual(state['tokens'], 7)
+
+
+class RateLimiterTests(unittest.TestCase):
+    """ai.ratelimit.RateLimiter over the memory backend"""
+
+    def test_requests_per_minute(self):
+        limiter = RateLimiter(MemoryBackend(), {'default': {'rpm': 2}})
+        self.assertEqual(limiter.reserve('m'), 0.0)
+        self.assertEqual(limiter.reserve('m'), 0.0)
+        self.assertAlmostEqual(limiter.reserve('m'), 30.0, places=1)
+        self.assertEqual(limiter.get_stats()['waits'], 1)
+
+    def test_models_have_separate_buckets_and_limits(self):
+        limiter = RateLimiter(MemoryBackend(), {'default': {'rpm': 1}, 'fast': {'rpm': 0}})
+        self.assertEqual(limiter.reserve('a'), 0.0)
+        self.assertEqual(limiter.reserve('b'), 0.0)
+        for _ in range(5):
+            self.assertEqual(limiter.reserve('fast'), 0.0)
+
+    def test_tokens_per_minute_corrected_by_usage(self):
+        limiter = RateLimiter(MemoryBackend(), {'default': {'tpm': 1000}})
+        self.assertEqual(limiter.reserve('m', 900), 0.0)
+        # The call used far fewer tokens than estimated
+        limiter.record_usage('m', 900, 100)
+        self.assertEqual(limiter.reserve('m', 500), 0.0)
+
+    def test_failed_attempt_refunds_its_estimate(self):
+        limiter = RateLimiter(MemoryBackend(), {'default': {'tpm': 1000}})
+        self.assertEqual(limiter.reserve('m', 900), 0.0)
+        limiter.refund('m', 900)
+        self.assertEqual(limiter.reserve('m', 900), 0.0)
+
+    def test_estimate_tokens(self):
+        payload = {'messages': [{'role': 'user', 'content': 'x' * 400}], 'max_tokens': 100}
+        self.assertGreaterEqual(estimate_tokens(payload), 200)
+        self.assertLess(estimate_tokens(payload), 220)
+
+
+class RetryClassificationTests(unittest.TestCase):
+    """ai.retry error classification"""
+
+    def test_retryable_statuses(self):
+        for status_code in (None, 408, 409, 425, 429, 500, 502, 503, 504, 520, 529):
+            self.assertTrue(is_retryable_status(status_code), status_code)
+
+    def test_fatal_statuses(self):
+        for status_code in (400, 401, 402, 403, 404, 413, 422, 501, 530):
+            self.assertFalse(is_retryable_status(status_code), status_code)
+
+    def test_parse_retry_after_seconds(self):
+        self.assertEqual(parse_retry_after('7'), 7.0)
+        self.assertEqual(parse_retry_after('1.5'), 1.5)
+        self.assertEqual(parse_retry_after('-3'), 0.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(''))
+        self.assertIsNone(parse_retry_after('soon'))
+
+    def test_parse_retry_after_http_date(self):
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertGreater(parse_retry_after('Fri, 01 Jan 2100 00:00:00 GMT'), 0)
+
+    def test_error_from_response(self):
+        response = mock.Mock(status_code=429, headers={'Retry-After': '12'})
+        error = error_from_response(response, "rate limited")
+        self.assertEqual(str(error), "rate limited")
+        self.assertEqual(error.status_code, 429)
+        self.assertTrue(error.retryable)
+        self.assertEqual(error.retry_after, 12.0)
+
+        error = error_from_response(mock.Mock(status_code=401, headers={}), "bad key")
+        self.assertFalse(error.retryable)
+        self.assertIsNone(error.retry_after)
+
+
+class RetryPolicyTests(unittest.TestCase):
+    """ai.retry.RetryPolicy"""
+
+    def test_delay_is_capped_exponential_with_full_jitter(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+        with mock.patch('ai.retry.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([policy.delay(attempt) for attempt in range(1, 6)], [1.0, 2.0, 4.0, 5.0, 5.0])
+        with mock.patch('ai.retry.random.uniform', side_effect=lambda low, high: low):
+            self.assertEqual(policy.delay(3), 0.0)
+
+    def test_retry_after_is_a_floor(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+        for _ in range(20):
+            delay = policy.delay(2, retry_after=10.0)
+            self.assertGreaterEqual(delay, 10.0)
+            self.assertLessEqual(delay, 11.0)
+
+    def test_at_least_one_attempt(self):
+        self.assertEqual(RetryPolicy(max_attempts=0).max_attempts, 1)
+
+    def test_from_env(self):
+        with mock.patch.dict('os.environ', {'OPENROUTER_MAX_ATTEMPTS': '5', 'OPENROUTER_RETRY_MAX_DELAY': '2'}):
+            policy = RetryPolicy.from_env()
+        self.assertEqual(policy.max_attempts, 5)
+        self.assertEqual(policy.max_delay, 2.0)
+
+
+class CallWithRetryTests(unittest.TestCase):
+    """ai.retry.call_with_retry and call_with_retry_async"""
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.0)
+
+    def failing(self, *errors, result='ok'):
+        """Zero-argument callable raising each error in turn, then returning result"""
+        return mock.Mock(side_effect=list(errors) + [result])
+
+    def test_retryable_errors_are_retried(self):
+        func = self.failing(OpenRouterError("busy", 503, retryable=True))
+        with mock.patch('ai.retry.time.sleep') as sleep:
+            self.assertEqual(call_with_retry(func, self.policy), 'ok')
+        self.assertEqual(func.call_count, 2)
+        sleep.assert_called_once()
+
+    def test_fatal_errors_are_raised_at_once(self):
+        func = self.failing(OpenRouterError("bad key", 401, retryable=False))
+        with self.assertRaises(OpenRouterError):
+            call_with_retry(func, self.policy)
+        self.assertEqual(func.call_count, 1)
+
+    def test_attempts_run_out(self):
+        error = OpenRouterError("busy", 503, retryable=True)
+        func = self.failing(error, error, error)
+        with mock.patch('ai.retry.time.sleep'):
+            with self.assertRaises(OpenRouterError):
+                call_with_retry(func, self.policy)
+        self.assertEqual(func.call_count, 3)
+
+    def test_on_retry_records_and_can_refuse(self):
+        error = OpenRouterError("busy", 429, retryable=True, retry_after=0.0)
+        seen = []
+
+        def on_retry(attempt, e, delay):
+            seen.append((attempt, e, delay))
+            return attempt < 2
+
+        func = self.failing(error, error, error)
+        with mock.patch('ai.retry.time.sleep'):
+            with self.assertRaises(OpenRouterError):
+                call_with_retry(func, self.policy, on_retry=on_retry)
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual([(attempt, e) for attempt, e, _ in seen], [(1, error), (2, error)])
+
+    def test_async_retry_with_coroutine_hook(self):
+        error = OpenRouterError("busy", 502, retryable=True)
+        calls = []
+        seen = []
+
+        async def func():
+            calls.append(1)
+            if len(calls) < 3:
+                raise error
+            return 'ok'
+
+        async def on_retry(attempt, e, delay):
+            seen.append(attempt)
+
+        self.assertEqual(asyncio.run(call_with_retry_async(func, self.policy, on_retry=on_retry)), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(seen, [1, 2])
+
+    def test_async_on_retry_can_refuse(self):
+        async def func():
+            raise OpenRouterError("busy", 503, retryable=True)
+
+        with self.assertRaises(OpenRouterError):
+            asyncio.run(call_with_retry_async(func, self.policy, on_retry=lambda *args: False))
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    """ai.circuit.CircuitBreaker"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('ai.circuit.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('m', window=4, min_calls=4, error_rate=0.5, slow_call=10.0, cooldown=30.0)
+
+    def open_breaker(self):
+        for _ in range(4):
+            self.breaker.record(True, 0.1)
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_opens_at_the_error_rate(self):
+        self.breaker.record(False, 0.1)
+        self.breaker.record(False, 0.1)
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(4):
+            self.breaker.record(False, 12.0)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_window_forgets_old_failures(self):
+        self.breaker.record(True, 0.1)
+        for _ in range(5):
+            self.breaker.record(False, 0.1)
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_after_cooldown_allows_one_probe(self):
+        self.open_breaker()
+        self.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.now += 1
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # The probe is claimed; other calls keep failing over
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()['calls'], 0)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.opened_at, self.now)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_released_probe_without_an_attempt_can_be_claimed_again(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_late_attempts_are_ignored_while_open(self):
+        self.open_breaker()
+        opened_at = self.breaker.opened_at
+        self.now += 10
+        self.breaker.record(True, 0.1)
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.opened_at, opened_at)
+
+    def test_snapshot(self):
+        self.breaker.record(False, 1.0)
+        self.breaker.record(True, 3.0)
+        snapshot = self.breaker.snapshot()
+        self.assertEqual(snapshot['state'], CLOSED)
+        self.assertEqual(snapshot['calls'], 2)
+        self.assertEqual(snapshot['error_rate'], 0.5)
+        self.assertIsNone(snapshot['open_for'])
+
+
+class FailoverTests(unittest.TestCase):
+    """ai.circuit.track_attempt and call_with_failover"""
+
+    def setUp(self):
+        patcher = mock.patch.dict('ai.circuit._breakers', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        environ = mock.patch.dict('os.environ', {'OPENROUTER_BREAKER_MIN_CALLS': '2'})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def attempt(self, model, error=None):
+        with track_attempt(model):
+            if error is not None:
+                raise error
+
+    def test_track_attempt_counts_upstream_failures(self):
+        for error in (OpenRouterError("timeout"), OpenRouterError("busy", 503)):
+            with self.assertRaises(OpenRouterError):
+                self.attempt('m', error)
+        self.assertEqual(get_breaker('m').state, OPEN)
+
+    def test_track_attempt_ignores_client_errors(self):
+        for _ in range(3):
+            with self.assertRaises(OpenRouterError):
+                self.attempt('m', OpenRouterError("bad request", 400))
+        self.assertEqual(get_breaker('m').snapshot()['calls'], 0)
+        self.assertEqual(get_breaker('m').state, CLOSED)
+
+    def test_track_attempt_records_success(self):
+        self.attempt('m')
+        self.assertEqual(get_breaker('m').snapshot()['calls'], 1)
+
+    def test_fails_over_to_the_next_model(self):
+        def call(model):
+            if model == 'a':
+                raise OpenRouterError("busy", 503, retryable=True)
+            return f"answer from {model}"
+
+        self.assertEqual(call_with_failover(['a', 'b'], call), ("answer from b", 'b'))
+
+    def test_skips_models_whose_breaker_is_open(self):
+        for _ in range(2):
+            get_breaker('a').record(True, 0.1)
+        call = mock.Mock(return_value='ok')
+        self.assertEqual(call_with_failover(['a', 'b'], call), ('ok', 'b'))
+        call.assert_called_once_with('b')
+
+    def test_other_exceptions_are_not_failed_over(self):
+        call = mock.Mock(side_effect=FileNotFoundError("resume.pdf"))
+        with self.assertRaises(FileNotFoundError):
+            call_with_failover(['a', 'b'], call)
+        call.assert_called_once_with('a')
+
+    def test_last_error_when_every_model_fails(self):
+        errors = {'a': OpenRouterError("a failed", 503), 'b': OpenRouterError("b failed", 502)}
+
+        def call(model):
+            raise errors[model]
+
+        with self.assertRaises(OpenRouterError) as raised:
+            call_with_failover(['a', 'b'], call)
+        self.assertIs(raised.exception, errors['b'])
+
+    def test_circuit_open_error_when_every_breaker_is_open(self):
+        for model in ('a', 'b'):
+            for _ in range(2):
+                get_breaker(model).record(True, 0.1)
+        with self.assertRaises(CircuitOpenError) as raised:
+            call_with_failover(['a', 'b'], mock.Mock())
+        self.assertTrue(raised.exception.retryable)
+
+    def test_async_failover(self):
+        async def call(model):
+            if model == 'a':
+                raise OpenRouterError("busy", 503, retryable=True)
+            return model
+
+        self.assertEqual(asyncio.run(call_with_failover_async(['a', 'b'], call)), ('b', 'b'))
+
+
+class IncrementalJSONParserTests(unittest.TestCase):
+    """ai.streaming.IncrementalJSONParser"""
+
+    def feed(self, text, chunk_size=1):
+        parser = IncrementalJSONParser()
+        for i in range(0, len(text), chunk_size):
+            parser.feed(text[i:i + chunk_size])
+        return parser
+
+    def test_skips_a_json_fence(self):
+        parser = self.feed('```json\n{"name": "Jane"}\n```')
+        self.assertTrue(parser.complete)
+        self.assertEqual(parser.value(), {'name': 'Jane'})
+
+    def test_stops_at_the_end_of_the_value(self):
+        parser = IncrementalJSONParser()
+        parser.feed('{"a": 1} and some trailing')
+        parser.feed(' text')
+        self.assertEqual(parser.value(), {'a': 1})
+
+    def test_incomplete_value(self):
+        parser = self.feed('{"a": {"b": [1, 2')
+        self.assertFalse(parser.complete)
+        with self.assertRaises(ValueError):
+            parser.value()
+
+    def test_nested_values_are_not_collected_as_fields(self):
+        text = '{"personal_info": {"name": "Jane", "error": true}, "skills": ["a", "]}"], "years": 7, "score": 8.5}'
+        parser = self.feed(text)
+        self.assertEqual(parser.value(), json.loads(text))
+        self.assertEqual(parser.fields, {'years': 7, 'score': 8.5})
+
+    def test_strings_with_braces_and_escapes(self):
+        text = '{"summary": "uses {braces} and \\"quotes\\"", "note": "back\\\\slash"}'
+        parser = self.feed(text)
+        self.assertEqual(parser.value(), json.loads(text))
+        self.assertEqual(parser.fields['summary'], 'uses {braces} and "quotes"')
+        self.assertEqual(parser.fields['note'], 'back\\slash')
+
+    def test_error_field_is_known_before_the_object_closes(self):
+        parser = IncrementalJSONParser()
+        parser.feed('{"error": true, "mess')
+        self.assertIs(parser.fields.get('error'), True)
+        self.assertFalse(parser.complete)
+        parser.feed('age": "Not a resume", "details": {"pages": 0')
+        self.assertEqual(parser.fields['message'], "Not a resume")
+        self.assertFalse(parser.complete)
+
+    def test_scalar_fields(self):
+        parser = self.feed('{"a": null, "b": false, "c": -1.5e2 , "d": "x"}', chunk_size=3)
+        self.assertEqual(parser.fields, {'a': None, 'b': False, 'c': -150.0, 'd': 'x'})
+
+    def test_top_level_array(self):
+        parser = self.feed('[{"a": 1}, {"b": [2]}]')
+        self.assertEqual(parser.value(), [{'a': 1}, {'b': [2]}])
+        self.assertEqual(parser.fields, {})
+
+
+class ReadEventStreamTests(unittest.TestCase):
+    """ai.streaming.read_event_stream"""
+
+    def response(self, *deltas, usage=None):
+        lines = [': keep-alive']
+        for delta in deltas:
+            lines += ['data: ' + json.dumps({'choices': [{'delta': {'content': delta}}]}), '']
+        if usage is not None:
+            lines += ['data: ' + json.dumps({'choices': [], 'usage': usage}), '']
+        lines.append('data: [DONE]')
+        return mock.Mock(iter_lines=mock.Mock(return_value=iter(lines)))
+
+    def test_content_and_usage(self):
+        result = read_event_stream(self.response('{"na', 'me": "Jane"}', usage={'total_tokens': 9}), 'm', 0.0)
+        self.assertEqual(json.loads(result['choices'][0]['message']['content']), {'name': 'Jane'})
+        self.assertEqual(result['usage'], {'total_tokens': 9})
+        self.assertFalse(result['stream']['early_error'])
+
+    def test_usage_after_the_answer_and_trailing_text_is_read(self):
+        response = self.response('{"a": 1}', ' Hope this helps!', usage={'total_tokens': 12})
+        result = read_event_stream(response, 'm', 0.0)
+        self.assertEqual(result['choices'][0]['message']['content'], '{"a": 1}')
+        self.assertEqual(result['usage'], {'total_tokens': 12})
+
+    def test_deadline_after_the_answer_keeps_the_answer(self):
+        now = [0.0]
+
+        def slow_lines():
+            for line in self.response('{"a": 1}', ' trailing', usage={'total_tokens': 12}).iter_lines():
+                yield line
+                if 'trailing' in line:
+                    # The provider stalls after the answer
+                    now[0] = 100.0
+
+        with mock.patch('ai.streaming.time.monotonic', side_effect=lambda: now[0]):
+            result = read_event_stream(mock.Mock(iter_lines=slow_lines), 'm', 0.0, expires=50.0)
+        self.assertEqual(result['choices'][0]['message']['content'], '{"a": 1}')
+        self.assertEqual(result['usage'], {})
+
+    def test_fenced_answer_is_unwrapped(self):
+        result = read_event_stream(self.response('```json\n{"a": ', '[1, {"b": 2}]}', '\n```'), 'm', 0.0)
+        self.assertEqual(result['choices'][0]['message']['content'], '{"a": [1, {"b": 2}]}')
+
+    def test_stops_early_on_an_error_answer(self):
+        response = self.response('{"error": true, "message": "Not a resume", ', '"details": "never read"}')
+        result = read_event_stream(response, 'm', 0.0)
+        self.assertTrue(result['stream']['early_error'])
+        self.assertEqual(json.loads(result['choices'][0]['message']['content']),
+                         {'error': True, 'message': "Not a resume"})
+        # The rest of the stream was left unread
+        self.assertEqual(next(response.iter_lines.return_value), '')
+
+    def test_error_event(self):
+        response = mock.Mock(iter_lines=mock.Mock(return_value=iter([
+            'data: ' + json.dumps({'error': {'code': 502, 'message': 'upstream'}}),
+        ])))
+        with self.assertRaises(OpenRouterError) as raised:
+            read_event_stream(response, 'm', 0.0)
+        self.assertEqual(raised.exception.status_code, 502)
+        self.assertTrue(raised.exception.retryable)
+
+    def test_deadline(self):
+        with self.assertRaises(StreamDeadlineExceeded):
+            read_event_stream(self.response('{"a": 1}'), 'm', 0.0, expires=0.0)
+
+
+class ExtractionCacheTests(unittest.TestCase):
+    """ai.extraction_cache"""
+
+    def setUp(self):
+        self.result = ExtractionResult(text="Jane Doe\nPython", page_count=2, extractor='pymupdf',
+                                       duration_ms=12.5, extractor_version='1.24', normalized=True)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = os.path.join(tmp.name, 'extractions')
+        self.file_path = os.path.join(tmp.name, 'cv.pdf')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'%PDF-1.4 resume')
+
+    def test_round_trip(self):
+        cache = ExtractionCache(self.cache_dir)
+        cache.put('ab' * 32, 'sig', self.result)
+
+        result = cache.get('ab' * 32, 'sig')
+        self.assertEqual(result.text, self.result.text)
+        self.assertEqual(result.metadata() | {'cached': False, 'content_hash': None}, self.result.metadata())
+        self.assertTrue(result.cached)
+        self.assertEqual(result.content_hash, 'ab' * 32)
+        self.assertIsNone(cache.get('ab' * 32, 'other extractors'))
+        self.assertIsNone(cache.get('cd' * 32, 'sig'))
+
+    def test_artifacts_are_owner_only(self):
+        ExtractionCache(self.cache_dir).put('ab' * 32, 'sig', self.result)
+
+        artifact = ExtractionCache(self.cache_dir).path('ab' * 32)
+        self.assertEqual(stat.S_IMODE(os.stat(artifact).st_mode), 0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(artifact.parent).st_mode), 0o700)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_dir).st_mode), 0o700)
+
+    def test_cached_extraction_reuses_the_artifact_and_hash(self):
+        with mock.patch('ai.extraction_cache.extract_text', return_value=self.result) as extract:
+            first = extract_text_cached(self.file_path, self.cache_dir)
+            second = extract_text_cached(self.file_path, self.cache_dir, content_hash=first.content_hash)
+
+        extract.assert_called_once()
+        self.assertEqual(first.content_hash, content_sha256(self.file_path))
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.text, first.text)
+
+    def test_empty_directory_disables_the_cache(self):
+        with mock.patch('ai.extraction_cache.extract_text', return_value=self.result) as extract:
+            extract_text_cached(self.file_path, '')
+            extract_text_cached(self.file_path, '')
+
+        self.assertEqual(extract.call_count, 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+class PromptRegistryTests(unittest.TestCase):
+    """ai.prompt_registry"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.write('rank', "Rank for {job_description}: {candidates_data} as {{\"ranked\": []}}")
+
+    def write(self, name, text, mtime=None):
+        path = os.path.join(self.directory, f"{name}.md")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_template_is_loaded_once_until_the_file_changes(self):
+        registry = PromptRegistry(self.directory, reload_interval=0)
+        self.write('parse', "Version one", mtime=1000)
+        first = registry.get('parse')
+        self.assertIs(registry.get('parse'), first)
+
+        self.write('parse', "Version two", mtime=2000)
+        second = registry.get('parse')
+        self.assertEqual(second.text, "Version two")
+        self.assertNotEqual(second.sha256, first.sha256)
+
+    def test_modification_time_is_checked_at_most_every_interval(self):
+        registry = PromptRegistry(self.directory, reload_interval=60)
+        self.write('parse', "Version one", mtime=1000)
+        with mock.patch('ai.prompt_registry.time.monotonic', return_value=100.0):
+            first = registry.get('parse')
+        self.write('parse', "Version two", mtime=2000)
+        with mock.patch('ai.prompt_registry.time.monotonic', return_value=130.0):
+            self.assertIs(registry.get('parse'), first)
+        with mock.patch('ai.prompt_registry.time.monotonic', return_value=161.0):
+            self.assertEqual(registry.get('parse').text, "Version two")
+
+    def test_placeholders_are_validated(self):
+        registry = PromptRegistry(self.directory, reload_interval=0)
+        rank = registry.get('rank', require=('job_description', 'candidates_data'))
+        self.assertEqual(rank.format(job_description="Dev", candidates_data="[]"), 'Rank for Dev: [] as {"ranked": []}')
+        with self.assertRaises(PromptError):
+            registry.get('rank', require=('resume_text',))
+        with self.assertRaises(PromptError):
+            rank.format(job_description="Dev")
+
+        self.write('broken', "Fill {resume_text} into {\"name\": 1}")
+        with self.assertRaises(PromptError):
+            registry.get('broken')
+        with self.assertRaises(FileNotFoundError):
+            registry.get('missing')
+
+    def test_template_without_placeholders_is_sent_verbatim(self):
+        template = PromptTemplate.from_text('Return {"name": "..."}')
+        self.assertEqual(template.placeholders, frozenset())
+        self.assertEqual(template.format(), 'Return {"name": "..."}')
+        self.assertIsNone(template.split('resume_text'))
+
+
+class PromptPrefixTests(unittest.TestCase):
+    """ai.service split_prompt / prompt_messages cacheable prefixes"""
+
+    TEMPLATE = "Extract {{\"name\": ...}} from the resume.\n\n{resume_text}\n\nAnswer in JSON."
+
+    def test_split_at_the_placeholder(self):
+        static, user_text = split_prompt(PromptTemplate.from_text(self.TEMPLATE), "Jane Doe")
+        self.assertEqual(static, 'Extract {"name": ...} from the resume.\n\n')
+        self.assertEqual(user_text, "Jane Doe\n\nAnswer in JSON.")
+
+    def test_template_strings_are_accepted(self):
+        self.assertEqual(
+            split_prompt(self.TEMPLATE, "Jane Doe"),
+            split_prompt(PromptTemplate.from_text(self.TEMPLATE), "Jane Doe"),
+        )
+        self.assertEqual(split_prompt("Static only", "Jane Doe"), ("Static only", "Resume text:\nJane Doe"))
+
+    def test_instructions_leave_out_the_placeholder(self):
+        self.assertEqual(prompt_instructions(self.TEMPLATE), 'Extract {"name": ...} from the resume.\nAnswer in JSON.')
+        self.assertEqual(prompt_instructions("Static only"), "Static only")
+
+    def test_parse_prompt_has_a_static_prefix(self):
+        prompt = get_prompt('parse_resume', require=('resume_text',))
+        static, user_text = split_prompt(prompt, "Jane Doe")
+        self.assertEqual(user_text.strip(), "Jane Doe")
+        self.assertIn('"personal_info"', static)
+        self.assertNotIn("{{", static)
+        self.assertEqual(prompt_instructions(prompt), static.rstrip())
+
+    def test_cache_control_only_for_listed_models(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_PROMPT_CACHE': 'true', 'OPENROUTER_CACHE_CONTROL_MODELS': 'anthropic/'}):
+            marked = prompt_messages("Role", "Instructions", 'anthropic/claude-sonnet-4', "Jane Doe")
+            plain = prompt_messages("Role", "Instructions", 'openai/gpt-4o', "Jane Doe")
+        self.assertEqual(marked[0]['content'], [
+            {'type': 'text', 'text': "Role\n\nInstructions", 'cache_control': {'type': 'ephemeral'}},
+        ])
+        self.assertEqual(plain[0]['content'], "Role\n\nInstructions")
+        self.assertEqual(marked[1], {'role': 'user', 'content': "Jane Doe"})
+
+    def test_prompt_cache_can_be_turned_off(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_PROMPT_CACHE': 'false'}):
+            self.assertEqual(cacheable_content("Instructions", 'anthropic/claude-sonnet-4'), "Instructions")
+
+
+class RetryReservationTests(unittest.TestCase):
+    """Rate limit reservations of retried requests (ai.service, ai.async_service)"""
+
+    PAYLOAD = {'model': 'test/model', 'messages': [{'role': 'user', 'content': 'x' * 4000}]}
+
+    def setUp(self):
+        self.limiter = RateLimiter(MemoryBackend(), {'default': {'tpm': 100000}})
+        self.estimate = estimate_tokens(self.PAYLOAD)
+        for patcher in (
+            mock.patch('ai.service.get_rate_limiter', return_value=self.limiter),
+            mock.patch('ai.async_service.get_rate_limiter', return_value=self.limiter),
+            mock.patch('ai.service.record_response_usage'),
+            mock.patch('ai.async_service.record_response_usage'),
+            mock.patch('ai.retry.time.sleep'),
+            mock.patch('ai.retry.asyncio.sleep', new=mock.AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def responses(self):
+        throttled = TransportResponse(429, 'Too Many Requests', {}, httpx.Response(429, json={'error': 'slow down'}))
+        ok = TransportResponse(200, 'OK', {}, httpx.Response(200, json={
+            'choices': [{'message': {'content': '{}'}}],
+            'usage': {'prompt_tokens': 250, 'completion_tokens': 50, 'total_tokens': 300},
+        }))
+        return [throttled, throttled, ok]
+
+    def assert_only_actual_usage_taken(self):
+        tokens = self.limiter.backend._buckets['test/model:tpm']['tokens']
+        # Without refunds each throttled attempt would keep its estimate reserved
+        self.assertGreater(self.estimate, 500)
+        self.assertAlmostEqual(tokens, 100000 - 300, delta=50)
+
+    def test_sync_retries_reserve_the_estimate_once(self):
+        transport = mock.Mock(post=mock.Mock(side_effect=self.responses()))
+        with mock.patch('ai.service.get_transport', return_value=transport):
+            result = send_chat_request('https://example.com/chat', {}, self.PAYLOAD)
+
+        self.assertEqual(result['usage']['total_tokens'], 300)
+        self.assertEqual(transport.post.call_count, 3)
+        self.assert_only_actual_usage_taken()
+
+    def test_async_retries_reserve_the_estimate_once(self):
+        transport = mock.Mock(post=mock.AsyncMock(side_effect=self.responses()))
+        result = asyncio.run(post_chat_completion(transport, 'https://example.com/chat', {}, self.PAYLOAD))
+
+        self.assertEqual(result['usage']['total_tokens'], 300)
+        self.assert_only_actual_usage_taken()
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 handler answering every POST with its body length"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        received = len(self.rfile.read(int(self.headers['Content-Length'])))
+        body = json.dumps({'received': received}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledTransportTests(unittest.TestCase):
+    """ai.transport.PooledTransport over the requests backend"""
+
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_address[1]}/chat/completions"
+
+    def test_sequential_requests_reuse_one_connection(self):
+        transport = PooledTransport(pool_connections=1, pool_maxsize=2)
+        self.addCleanup(transport.close)
+        for _ in range(3):
+            response = transport.post(self.url, json={'model': 'm'})
+            self.assertTrue(response.ok)
+            self.assertEqual(response.json(), {'received': len(json.dumps({'model': 'm'}))})
+
+        stats = transport.get_stats()
+        self.assertEqual(stats['backend'], 'requests')
+        self.assertEqual((stats['requests'], stats['pool_hits'], stats['pool_misses']), (3, 2, 1))
+
+    def test_connection_errors_raise_transport_error(self):
+        transport = PooledTransport()
+        self.addCleanup(transport.close)
+        with self.assertRaises(TransportError):
+            transport.post("http://127.0.0.1:9/unreachable", json={}, timeout=2)
+
+    def test_process_shares_one_transport(self):
+        with mock.patch('ai.transport._transport', None):
+            first = get_transport()
+            self.addCleanup(first.close)
+            self.assertIs(get_transport(), first)
+
+
+class StreamedJSONBodyTests(unittest.TestCase):
+    """ai.upload file data URLs and StreamedJSONBody"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.file_path = os.path.join(tmp.name, 'scan.pdf')
+        # Not a multiple of the 3-byte base64 group or of the encode block size
+        self.content = os.urandom(200 * 1024 + 1)
+        with open(self.file_path, 'wb') as f:
+            f.write(self.content)
+
+    def payload(self, url):
+        return {
+            'model': 'test/model',
+            'messages': [
+                {'role': 'system', 'content': "متن رزومه را استخراج کن"},
+                {'role': 'user', 'content': [{'type': 'image_url', 'image_url': {'url': url}}]},
+            ],
+        }
+
+    def expected(self):
+        url = "data:application/pdf;base64," + base64.b64encode(self.content).decode('ascii')
+        return json.dumps(self.payload(url), ensure_ascii=False).encode('utf-8')
+
+    def test_body_equals_json_dumps(self):
+        body = StreamedJSONBody(self.payload(file_data_url(self.file_path, 'application/pdf')))
+        expected = self.expected()
+        self.assertEqual(len(body), len(expected))
+        self.assertEqual(b''.join(body), expected)
+
+    def test_reads_in_small_pieces(self):
+        body = StreamedJSONBody(self.payload(file_data_url(self.file_path, 'application/pdf')))
+        pieces = list(iter(lambda: body.read(1000), b''))
+        self.assertTrue(all(len(piece) == 1000 for piece in pieces[:-1]))
+        self.assertEqual(b''.join(pieces), self.expected())
+
+    def test_data_url_length_is_known_before_reading(self):
+        url = FileDataURL(self.file_path, 'application/pdf')
+        self.assertEqual(len(url), len(b''.join(url.chunks())))
+
+    def test_request_body(self):
+        payload = self.payload("https://example.com/cv.png")
+        self.assertEqual(request_body({'A': '1'}, payload), ({'A': '1'}, {'json': payload}))
+
+        headers, body = request_body({'A': '1'}, self.payload(file_data_url(self.file_path, 'application/pdf')))
+        self.assertEqual(headers['Content-Length'], str(len(self.expected())))
+        self.assertIsInstance(body['data'], StreamedJSONBody)
+
+    def test_files_above_the_limit_are_rejected(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_MAX_FILE_MB': '0.1'}):
+            with self.assertRaises(FileTooLargeError):
+                file_data_url(self.file_path, 'application/pdf')
+        with self.assertRaises(FileNotFoundError):
+            file_data_url(self.file_path + '.missing', 'application/pdf')
+
+
+class AdaptiveConcurrencyTests(unittest.TestCase):
+    """ai.concurrency.AdaptiveConcurrencyLimiter"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('ai.concurrency.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def round_trip(self, limiter, latency=1.0, calls=None):
+        """Fill every slot, then release them all after latency seconds"""
+        calls = calls or limiter.limit
+        for _ in range(calls):
+            limiter.acquire()
+        self.now += latency
+        for _ in range(calls):
+            limiter.release(latency)
+
+    def test_limit_grows_by_one_over_limit_per_saturated_round(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=4)
+        self.round_trip(limiter)
+        self.round_trip(limiter)
+        self.assertEqual(limiter.limit, 2)
+        self.round_trip(limiter)
+        self.assertEqual(limiter.limit, 3)
+        self.assertEqual(limiter.snapshot()['increases'], 3)
+        for _ in range(10):
+            self.round_trip(limiter)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_limit_only_grows_when_it_held_requests_back(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=3)
+        self.round_trip(limiter, calls=2)
+        self.assertEqual(limiter.snapshot()['increases'], 0)
+
+    def test_throttling_halves_the_limit_once_per_round(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=8, min_limit=2)
+        self.round_trip(limiter)
+        self.now += 10
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 4)
+        self.now += 10
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.now += 10
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.snapshot()['throttled'], 5)
+
+    def test_slow_calls_decrease_the_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=10, latency_tolerance=2.0)
+        for _ in range(20):
+            self.round_trip(limiter, latency=1.0, calls=1)
+        self.now += 10
+        self.round_trip(limiter, latency=10.0, calls=1)
+        self.assertEqual(limiter.limit, 9)
+
+    def test_waiters_get_slots_in_order(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1, max_limit=1)
+        limiter.acquire()
+        order = []
+        threads = [threading.Thread(target=lambda n=n: (limiter.acquire(), order.append(n), limiter.release()))
+                   for n in range(3)]
+        for queued, thread in enumerate(threads, 1):
+            thread.start()
+            while limiter.snapshot()['queued'] < queued:
+                threading.Event().wait(0.001)
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual(limiter.snapshot()['in_flight'], 0)
+
+    def test_disabled_limiter_only_counts(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1, enabled=False)
+        for _ in range(5):
+            limiter.acquire()
+        self.assertEqual(limiter.snapshot()['in_flight'], 5)
+        for _ in range(5):
+            limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.snapshot()['decreases'], 0)
+
+
+def _fake_pdf_backend(name, pages, available=True, version='1.0'):
+    """A PDF backend returning fixed page texts (or raising pages, if an exception)"""
+    def extract_pages(file_path, start=0, stop=None):
+        if isinstance(pages, Exception):
+            raise pages
+        calls.append((start, stop))
+        return pages[start:stop]
+
+    calls = []
+    return type(name, (), {
+        'name': name, 'available': available, 'version': version, 'calls': calls,
+        'page_count': staticmethod(lambda file_path: len(pages)),
+        'extract_pages': staticmethod(extract_pages),
+    })
+
+
+class PDFBackendSelectionTests(unittest.TestCase):
+    """ai.extraction backend order and fallback"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {'TEXT_NORMALIZATION': 'false'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def use_backends(self, *backends):
+        patcher = mock.patch.dict(PDF_BACKENDS, {backend.name: backend for backend in backends}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_backends_follow_pdf_extractors_and_skip_missing_ones(self):
+        fast = _fake_pdf_backend('fast', [])
+        slow = _fake_pdf_backend('slow', [])
+        missing = _fake_pdf_backend('missing', [], available=False)
+        self.use_backends(fast, slow, missing)
+        with mock.patch.dict(os.environ, {'PDF_EXTRACTORS': 'missing, slow,fast'}):
+            self.assertEqual(pdf_backends(), [slow, fast])
+        with self.assertRaises(ValueError):
+            pdf_backends(['fast', 'nope'])
+
+    def test_sparse_text_falls_back_to_the_next_backend(self):
+        fast = _fake_pdf_backend('fast', ['', 'x'])
+        slow = _fake_pdf_backend('slow', ['Jane Doe, engineer', 'Python, Django, SQL'])
+        self.use_backends(fast, slow)
+        result = extract_text('cv.pdf', backends=['fast', 'slow'])
+        self.assertEqual(result.extractor, 'slow')
+        self.assertEqual(result.text, 'Jane Doe, engineer\nPython, Django, SQL\n')
+        self.assertEqual(result.page_count, 2)
+
+    def test_enough_text_skips_later_backends(self):
+        fast = _fake_pdf_backend('fast', ['Jane Doe, software engineer'])
+        slow = _fake_pdf_backend('slow', ['unused'])
+        self.use_backends(fast, slow)
+        self.assertEqual(extract_text('cv.pdf', backends=['fast', 'slow']).extractor, 'fast')
+        self.assertEqual(slow.calls, [])
+
+    def test_best_text_is_kept_when_every_backend_is_sparse(self):
+        self.use_backends(
+            _fake_pdf_backend('broken', ValueError('bad xref')),
+            _fake_pdf_backend('some', ['Jane']),
+            _fake_pdf_backend('none', ['']),
+        )
+        result = extract_text('cv.pdf', backends=['broken', 'some', 'none'])
+        self.assertEqual((result.extractor, result.text), ('some', 'Jane\n'))
+
+    def test_failure_of_every_backend_is_a_value_error(self):
+        self.use_backends(_fake_pdf_backend('broken', ValueError('bad xref')))
+        with self.assertRaisesRegex(ValueError, 'bad xref'):
+            extract_text('cv.pdf', backends=['broken'])
+
+    def test_long_pdfs_are_split_across_the_executor(self):
+        pages = [f"page {number} of the resume" for number in range(10)]
+        backend = _fake_pdf_backend('fast', pages)
+        self.use_backends(backend)
+        env = {'PDF_PARALLEL_MIN_PAGES': '8', 'PDF_PAGES_PER_TASK': '4'}
+        with mock.patch.dict(os.environ, env), ThreadPoolExecutor(2) as executor:
+            result = extract_text('cv.pdf', backends=['fast'], executor=executor)
+        self.assertEqual(result.text, ''.join(f"{text}\n" for text in pages))
+        self.assertEqual(sorted(backend.calls), [(0, 4), (4, 8), (8, 12)])
+
+    def test_signature_changes_with_backends_and_versions(self):
+        self.use_backends(_fake_pdf_backend('fast', []), _fake_pdf_backend('slow', []))
+        signature = extractor_signature('cv.pdf', ['fast', 'slow'])
+        self.assertEqual(signature, 'fast-1.0,slow-1.0')
+        self.assertNotEqual(extractor_signature('cv.pdf', ['slow', 'fast']), signature)
+        PDF_BACKENDS['fast'].version = '2.0'
+        self.assertNotEqual(extractor_signature('cv.pdf', ['fast', 'slow']), signature)
+        self.assertEqual(extractor_signature('cv.txt'), '')
+
+
+class BatchedParseTests(unittest.TestCase):
+    """ai.service batched resume parsing"""
+
+    def setUp(self):
+        patcher = mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': 'test-key'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batches_close_at_the_token_budget_or_size(self):
+        resumes = {'a': 'x' * 400, 'b': 'x' * 400, 'c': 'x' * 400, 'd': 'x' * 4000, 'e': 'x' * 40}
+        self.assertEqual(pack_resume_batches(resumes, max_tokens=250, max_size=4), [['a', 'b'], ['c'], ['d'], ['e']])
+        self.assertEqual(pack_resume_batches(resumes, max_tokens=10000, max_size=2), [['a', 'b'], ['c', 'd'], ['e']])
+
+    def test_request_sends_the_prompt_once_and_tags_each_resume(self):
+        _, _, payload, _ = build_batch_request('parse_resume', 'test/model', {'1': 'Jane Doe', '2': 'Ali Rezaei'})
+        system, user = payload['messages']
+        self.assertNotIn('{resume_text}', system['content'])
+        self.assertTrue(system['content'].endswith(BATCH_INSTRUCTIONS))
+        self.assertEqual(user['content'], '<resume id="1">\nJane Doe\n</resume>\n\n<resume id="2">\nAli Rezaei\n</resume>')
+
+    def test_split_keeps_only_well_formed_entries_for_requested_ids(self):
+        content = {'results': [
+            {'id': 1, 'data': {'name': 'Jane'}},
+            {'id': '1', 'data': {'name': 'Duplicate'}},
+            {'id': '2', 'data': 'not an object'},
+            {'id': '9', 'data': {'name': 'Unknown'}},
+            'garbage',
+        ]}
+        self.assertEqual(split_batch_results(content, ['1', '2']), {'1': {'name': 'Jane'}})
+        self.assertEqual(split_batch_results({'content': 'no json'}, ['1']), {})
+
+    def chat_response(self, results):
+        return {'choices': [{'message': {'content': json.dumps({'results': results})}}]}
+
+    def test_resumes_missing_from_a_batch_get_their_own_request(self):
+        resumes = {'1': 'Jane Doe', '2': 'Ali Rezaei', '3': 'Sara Ahmadi'}
+        response = self.chat_response([{'id': '1', 'data': {'name': 'Jane'}}, {'id': '3', 'data': {'name': 'Sara'}}])
+        with mock.patch('ai.service.send_chat_request', return_value=response) as send, \
+                mock.patch('ai.service.process_file_with_prompt', return_value={'name': 'Ali'}) as single:
+            results = parse_resumes_batched(resumes, 'parse_resume', 'batch-test/model', max_batch_size=4)
+
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(send.call_args.args[2]['max_tokens'], 3 * 4000)
+        self.assertEqual(single.call_args.kwargs['resume_text'], 'Ali Rezaei')
+        self.assertEqual({resume_id: (result.data, result.batched) for resume_id, result in results.items()}, {
+            '1': ({'name': 'Jane'}, True), '2': ({'name': 'Ali'}, False), '3': ({'name': 'Sara'}, True),
+        })
+
+    def test_failed_batch_falls_back_to_one_request_per_resume(self):
+        resumes = {'1': 'Jane Doe', '2': 'Ali Rezaei'}
+        error = OpenRouterError("bad request", 400)
+        with mock.patch('ai.service.send_chat_request', side_effect=error), mock.patch('builtins.print'), \
+                mock.patch('ai.service.process_file_with_prompt',
+                           side_effect=[{'name': 'Jane'}, ValueError("unreadable")]):
+            results = parse_resumes_batched(resumes, 'parse_resume', 'batch-failed-test/model')
+
+        self.assertEqual((results['1'].data, results['1'].batched), ({'name': 'Jane'}, False))
+        self.assertIsInstance(results['2'].error, ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+"""
+Shared, process-wide HTTP transport for OpenRouter calls.
+
+Every call path (the standalone AI service and the Django OpenRouterClient)
+goes through a single pooled transport so TCP/TLS connections are kept alive
+and reused across resumes instead of being re-established per request.
+
+Configuration (environment variables):
+    OPENROUTER_POOL_CONNECTIONS: Number of per-host pools to keep (default: 4)
+    OPENROUTER_POOL_MAXSIZE: Max keep-alive connections per host (default: 10)
+    OPENROUTER_HTTP2: "true" to use HTTP/2 when httpx[http2] is installed
+"""
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# httpx is optional and only used for HTTP/2
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+
+class TransportError(Exception):
+    """Raised for network failures and non-2xx responses"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, response: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class PoolStats:
+    """Thread-safe connection pool hit/miss counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.misses = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'pool_hits': max(self.requests - self.misses, 0),
+                'pool_misses': self.misses,
+            }
+
+
+class TransportResponse:
+    """Backend-independent view of an HTTP response"""
+
+    def __init__(self, status_code: int, reason: str, headers: Any, native: Any):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self._native = native
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self._native.text
+
+    def json(self) -> Any:
+        return self._native.json()
+
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Iterate over decoded response lines (for streamed responses)
+
+        Raises:
+            TransportError: If the connection fails mid-stream
+        """
+        try:
+            if HAS_HTTPX and isinstance(self._native, httpx.Response):
+                yield from self._native.iter_lines()
+            else:
+                # Event streams are UTF-8, whatever requests guesses from the content type
+                self._native.encoding = 'utf-8'
+                for line in self._native.iter_lines(decode_unicode=True):
+                    yield line
+        except requests.exceptions.RequestException as e:
+            raise TransportError(str(e)) from e
+        except Exception as e:
+            if HAS_HTTPX and isinstance(e, httpx.HTTPError):
+                raise TransportError(str(e)) from e
+            raise
+
+    def close(self):
+        self._native.close()
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise TransportError(
+                f"{self.status_code} {self.reason}",
+                status_code=self.status_code,
+                response=self,
+            )
+
+
+def _counting_pool_classes(stats: PoolStats):
+    """Build urllib3 pool classes that report new connections to stats"""
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        def _get_conn(self, timeout=None):
+            stats.record_request()
+            return super()._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            stats.record_miss()
+            return super()._new_conn()
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        def _get_conn(self, timeout=None):
+            stats.record_request()
+            return super()._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            stats.record_miss()
+            return super()._new_conn()
+
+    return {'http': CountingHTTPConnectionPool, 'https': CountingHTTPSConnectionPool}
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools count connection reuse"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self.stats)
+
+
+class PooledTransport:
+    """Keep-alive, connection-pooled HTTP client shared by all OpenRouter calls"""
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 10, http2: bool = False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.stats = PoolStats()
+        self.http2 = bool(http2 and HAS_HTTPX and HAS_H2)
+
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=pool_connections * pool_maxsize,
+                    max_keepalive_connections=pool_maxsize,
+                ),
+            )
+            self._session = None
+        else:
+            self._client = None
+            self._session = requests.Session()
+            adapter = PooledAdapter(
+                self.stats,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+            )
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+
+    def _httpx_trace(self, event_name: str, info: Dict[str, Any]):
+        # A TCP connect only happens when no pooled connection could be reused
+        if event_name == 'connection.connect_tcp.complete':
+            self.stats.record_miss()
+
+    def post(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        timeout: float = 60,
+        stream: bool = False,
+        data: Any = None,
+    ) -> TransportResponse:
+        """
+        Send a POST request over the shared pool
+
+        Args:
+            url: Request URL
+            headers: Request headers
+            json: JSON-serializable request body
+            timeout: Request timeout in seconds
+            stream: If True, the body is not read up front (use iter_lines)
+            data: Pre-encoded body instead of json, e.g. a StreamedJSONBody
+                  (sent as it is read, with the Content-Length from headers)
+
+        Returns:
+            TransportResponse
+
+        Raises:
+            TransportError: On connection errors or timeouts
+        """
+        if self._client is not None:
+            self.stats.record_request()
+            try:
+                request = self._client.build_request(
+                    'POST', url, headers=headers, json=json, content=data, timeout=timeout,
+                    extensions={'trace': self._httpx_trace},
+                )
+                native = self._client.send(request, stream=stream)
+            except httpx.HTTPError as e:
+                raise TransportError(str(e)) from e
+            return TransportResponse(native.status_code, native.reason_phrase, native.headers, native)
+
+        try:
+            native = self._session.post(
+                url, headers=headers, json=json, data=data, timeout=timeout, stream=stream
+            )
+        except requests.exceptions.RequestException as e:
+            raise TransportError(str(e)) from e
+        return TransportResponse(native.status_code, native.reason, native.headers, native)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return pool hit/miss counters and pool configuration"""
+        return {
+            'backend': 'httpx' if self._client is not None else 'requests',
+            'http2': self.http2,
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            **self.stats.snapshot(),
+        }
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        if self._session is not None:
+            self._session.close()
+
+
+_transport: Optional[PooledTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> PooledTransport:
+    """Return the process-wide transport, creating it on first use"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = PooledTransport(
+                    pool_connections=int(os.getenv('OPENROUTER_POOL_CONNECTIONS', '4')),
+                    pool_maxsize=int(os.getenv('OPENROUTER_POOL_MAXSIZE', '10')),
+                    http2=os.getenv('OPENROUTER_HTTP2', 'false').lower() in ('1', 'true', 'yes'),
+                )
+    return _transport
+
+
+def get_transport_stats() -> Dict[str, Any]:
+    """Return counters for the process-wide transport"""
+    return get_transport().get_stats()
@@ -0,0 +1,204 @@
+"""
+Streamed file uploads for OpenRouter requests.
+
+When a file is sent as a base64 data URL (file mode, e.g. scanned resumes),
+the message holds a FileDataURL instead of the encoded string. The request
+body is then written by StreamedJSONBody, which reads and base64-encodes the
+file in fixed-size blocks while the request is sent, so a 20 MB scan no
+longer costs ~50 MB of bytes, base64 and JSON copies per concurrent request.
+
+Files above the size limit are rejected before anything is read; images
+are first downsampled to a JPEG that fits when Pillow is installed.
+
+Configuration (environment variables):
+    OPENROUTER_MAX_FILE_MB: Largest file sent in file mode (default: 20)
+"""
+import base64
+import io
+import json
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Pillow is optional and only used to downsample oversized images
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+# File bytes encoded per block; a multiple of 3, so blocks encode without padding
+ENCODE_CHUNK_BYTES = 48 * 1024
+
+# Longest side of a downsampled image, and the smallest worth sending
+DOWNSAMPLE_MAX_SIDE = 2048
+DOWNSAMPLE_MIN_SIDE = 512
+DOWNSAMPLE_JPEG_QUALITY = 85
+
+
+class FileTooLargeError(ValueError):
+    """Raised when a file is above OPENROUTER_MAX_FILE_MB and cannot be downsampled"""
+
+
+def max_file_bytes() -> int:
+    return int(float(os.getenv('OPENROUTER_MAX_FILE_MB', '20')) * 1024 * 1024)
+
+
+class FileDataURL:
+    """A base64 data URL whose file is only read while the request is sent"""
+
+    def __init__(self, file_path: str, mime_type: str, content: Optional[bytes] = None):
+        self.file_path = file_path
+        self.mime_type = mime_type
+        # Set for downsampled images, which are already in memory
+        self.content = content
+        self.size = len(content) if content is not None else os.path.getsize(file_path)
+        self.prefix = f"data:{mime_type};base64,".encode('ascii')
+
+    def __len__(self) -> int:
+        """Length of the encoded data URL"""
+        return len(self.prefix) + 4 * ((self.size + 2) // 3)
+
+    def chunks(self) -> Iterator[bytes]:
+        """Yield the data URL in pieces of at most 64 KB"""
+        yield self.prefix
+        source = io.BytesIO(self.content) if self.content is not None else open(self.file_path, 'rb')
+        with source as f:
+            for block in iter(lambda: f.read(ENCODE_CHUNK_BYTES), b''):
+                yield base64.b64encode(block)
+
+
+def _downsample_image(file_path: str, max_bytes: int) -> Optional[bytes]:
+    """JPEG of the image no larger than max_bytes, or None if it cannot get that small"""
+    with Image.open(file_path) as image:
+        # Lets the JPEG decoder skip detail we would throw away anyway
+        image.draft('RGB', (DOWNSAMPLE_MAX_SIDE, DOWNSAMPLE_MAX_SIDE))
+        image = image.convert('RGB')
+    image.thumbnail((DOWNSAMPLE_MAX_SIDE, DOWNSAMPLE_MAX_SIDE))
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=DOWNSAMPLE_JPEG_QUALITY, optimize=True)
+        if buffer.tell() <= max_bytes:
+            return buffer.getvalue()
+        width, height = image.size
+        if max(width, height) * 3 // 4 < DOWNSAMPLE_MIN_SIDE:
+            return None
+        image = image.resize((width * 3 // 4, height * 3 // 4))
+
+
+def file_data_url(file_path: str, mime_type: str) -> FileDataURL:
+    """
+    Prepare a file for sending as a data URL, enforcing OPENROUTER_MAX_FILE_MB
+
+    Args:
+        file_path: Path to the file
+        mime_type: MIME type for the data URL
+
+    Returns:
+        FileDataURL (nothing is read yet, unless an image had to be downsampled)
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        FileTooLargeError: If the file is above the limit and cannot be downsampled
+    """
+    if not Path(file_path).exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    limit = max_file_bytes()
+    size = os.path.getsize(file_path)
+    if size <= limit:
+        return FileDataURL(file_path, mime_type)
+
+    if mime_type.startswith('image/') and HAS_PIL:
+        content = _downsample_image(file_path, limit)
+        if content is not None:
+            return FileDataURL(file_path, 'image/jpeg', content)
+
+    raise FileTooLargeError(
+        f"{Path(file_path).name} is {size / 1024 / 1024:.1f} MB, above the "
+        f"{limit / 1024 / 1024:.0f} MB limit for file uploads (OPENROUTER_MAX_FILE_MB)"
+    )
+
+
+def _has_files(value: Any) -> bool:
+    if isinstance(value, FileDataURL):
+        return True
+    if isinstance(value, dict):
+        return any(_has_files(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_files(item) for item in value)
+    return False
+
+
+class StreamedJSONBody:
+    """
+    JSON body of a payload holding FileDataURL values, encoded while it is sent
+
+    Holds at most one encoded block beyond what the HTTP client asked for.
+    Can be sent once; build a new body for each attempt.
+    """
+
+    def __init__(self, payload: Dict[str, Any]):
+        marker = uuid.uuid4().hex
+        files: List[FileDataURL] = []
+
+        def placeholder(value):
+            if not isinstance(value, FileDataURL):
+                raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+            files.append(value)
+            return f"{marker}:{len(files) - 1}"
+
+        text = json.dumps(payload, ensure_ascii=False, default=placeholder)
+        pieces = re.split(f'{marker}:(\\d+)', text)
+        # Alternating JSON text and file indexes
+        self.parts: List[Any] = [
+            files[int(piece)] if i % 2 else piece.encode('utf-8')
+            for i, piece in enumerate(pieces)
+        ]
+        self._length = sum(len(part) for part in self.parts)
+        self._chunks: Optional[Iterator[bytes]] = None
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, FileDataURL):
+                yield from part.chunks()
+            elif part:
+                yield part
+
+    def read(self, size: int = -1) -> bytes:
+        """File-like read, for HTTP clients that stream from file objects"""
+        if self._chunks is None:
+            self._chunks = iter(self)
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def request_body(headers: Dict[str, str], payload: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    Headers and transport body arguments for a request payload
+
+    Payloads without files are sent as json=payload; payloads with files get
+    a fresh StreamedJSONBody as data=, with its Content-Length.
+
+    Returns:
+        Tuple of (headers, keyword arguments for PooledTransport.post / AsyncTransport.post)
+    """
+    if not _has_files(payload.get('messages')):
+        return headers, {'json': payload}
+    body = StreamedJSONBody(payload)
+    headers = {**headers, 'Content-Type': 'application/json', 'Content-Length': str(len(body))}
+    return headers, {'data': body}
@@ -0,0 +1,152 @@
+"""
+Token usage counters for OpenRouter calls.
+
+Every completed chat request reports its `usage` block here, so the share of
+prompt tokens served from the provider's prompt cache can be watched per
+model. OpenRouter reports cache hits as usage.prompt_tokens_details.cached_tokens
+(and, for some providers, cache writes as cache_write_tokens), and the cost
+of the call as usage.cost when the request asks for usage accounting.
+
+Callers can attach labels to the calls made inside a block (e.g. the batch
+or file being processed) with usage_labels(), and register sinks with
+add_usage_sink() to persist each call; the Django app stores them as
+LLMUsage rows.
+
+Configuration (environment variables):
+    OPENROUTER_PRICES: JSON object of per-model prices in USD per million
+        tokens, used when a response carries no cost, e.g.
+        {"openai/gpt-4o-mini": {"prompt": 0.15, "completion": 0.6, "cached": 0.075}}
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_labels: contextvars.ContextVar = contextvars.ContextVar('llm_usage_labels', default={})
+_sinks: List[Callable[[str, Dict[str, Any], Dict[str, Any]], None]] = []
+
+
+def usage_from_response(result: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Normalized token counts of a chat completion response
+
+    Returns:
+        Dict with prompt_tokens, completion_tokens, total_tokens,
+        cached_tokens and cache_write_tokens (0 when not reported)
+    """
+    usage = result.get('usage') or {}
+    details = usage.get('prompt_tokens_details') or {}
+    return {
+        'prompt_tokens': int(usage.get('prompt_tokens') or 0),
+        'completion_tokens': int(usage.get('completion_tokens') or 0),
+        'total_tokens': int(usage.get('total_tokens') or 0),
+        'cached_tokens': int(details.get('cached_tokens') or usage.get('cache_read_input_tokens') or 0),
+        'cache_write_tokens': int(details.get('cache_write_tokens') or usage.get('cache_creation_input_tokens') or 0),
+    }
+
+
+class UsageStats:
+    """Per-model token counters (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: str, result: Dict[str, Any]) -> Dict[str, int]:
+        """Add a response's usage to the model's counters and return it"""
+        usage = usage_from_response(result)
+        with self._lock:
+            counters = self._models.setdefault(model, {'requests': 0, **{key: 0 for key in usage}})
+            counters['requests'] += 1
+            for key, value in usage.items():
+                counters[key] += value
+        return usage
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                model: {
+                    **counters,
+                    'cache_hit_ratio': round(counters['cached_tokens'] / counters['prompt_tokens'], 3)
+                    if counters['prompt_tokens'] else 0.0,
+                }
+                for model, counters in self._models.items()
+            }
+
+
+_stats = UsageStats()
+
+
+def _prices() -> Dict[str, Dict[str, float]]:
+    raw = os.getenv('OPENROUTER_PRICES')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"OPENROUTER_PRICES is not valid JSON: {e}")
+
+
+def call_cost(model: str, result: Dict[str, Any], usage: Dict[str, int]) -> Optional[float]:
+    """
+    Cost of a call in USD: the cost OpenRouter reported, otherwise an estimate
+    from OPENROUTER_PRICES, otherwise None
+    """
+    reported = (result.get('usage') or {}).get('cost')
+    if reported is not None:
+        return float(reported)
+    price = _prices().get(model)
+    if not price:
+        return None
+    cached = usage['cached_tokens']
+    return (
+        (usage['prompt_tokens'] - cached) * price.get('prompt', 0)
+        + cached * price.get('cached', price.get('prompt', 0))
+        + usage['completion_tokens'] * price.get('completion', 0)
+    ) / 1_000_000
+
+
+@contextmanager
+def usage_labels(**labels) -> Iterator[Dict[str, Any]]:
+    """Attach labels to the usage of every call made inside the block (nests)"""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield _labels.get()
+    finally:
+        _labels.reset(token)
+
+
+def add_usage_sink(sink: Callable[[str, Dict[str, Any], Dict[str, Any]], None]):
+    """Register sink(model, usage, labels), called after every completed call"""
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def record_response_usage(model: str, result: Dict[str, Any],
+                          latency: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Record the usage of a chat completion response
+
+    Updates the process-wide counters and passes the usage, with cost and
+    latency (seconds), to the registered sinks. Sink errors are logged, never
+    raised, so accounting cannot fail a call.
+    """
+    usage = _stats.record(model, result)
+    usage = {**usage, 'cost': call_cost(model, result, usage), 'latency': latency}
+    labels = _labels.get()
+    for sink in _sinks:
+        try:
+            sink(model, usage, labels)
+        except Exception:
+            logger.exception("LLM usage sink failed")
+    return usage
+
+
+def get_usage_stats() -> Dict[str, Dict[str, Any]]:
+    """Return per-model token counters, including cached prompt tokens"""
+    return _stats.snapshot()
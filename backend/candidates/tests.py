@@ -1,3 +1,124 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from ai.retry import OpenRouterError
+from ai.usage import record_response_usage
+from core.models import User
+from jobs.models import Job
+from processing.models import BatchUpload, FileItem, LLMUsage, Task
+from .models import ParsedResume
+
+
+def run_inline(items, get_path, handle_item):
+    """Stand-in for run_parse_pipeline: no extraction processes or threads"""
+    for item in items:
+        yield handle_item(item, None, None)
+
+
+def fake_parse(resume, extraction=None, on_retry=None):
+    """Stand-in for parse_resume_service: one retried LLM call"""
+    if on_retry is not None:
+        on_retry(1, OpenRouterError("busy", 503, retryable=True), 0.0)
+    record_response_usage('test/model', {'usage': {'prompt_tokens': 100, 'completion_tokens': 20}})
+    return ParsedResume.objects.create(resume=resume)
+
+
+@mock.patch('candidates.views.run_parse_pipeline', run_inline)
+@mock.patch('processing.services.parse_resume_service', fake_parse)
+class CVUploadViewTests(TestCase):
+    """Synchronous CV uploads (candidates.views.CVUploadView)"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user(email='recruiter@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, **data):
+        files = [SimpleUploadedFile('cv.pdf', b'%PDF-1.4', content_type='application/pdf')]
+        return self.client.post('/api/candidates/upload-cv/', {'files': files, 'async': 'false', **data},
+                                format='multipart')
+
+    def test_upload_for_a_job_records_retries_and_labels_usage(self):
+        job = Job.objects.create(title='Backend developer', description='Python', created_by=self.user)
+        response = self.upload(job_id=job.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['successful'], 1)
+        file_item = FileItem.objects.get(batch_id=response.data['batch_id'])
+        self.assertEqual(file_item.status, 'completed')
+        self.assertEqual(file_item.retry_count, 1)
+
+        usage = LLMUsage.objects.get()
+        self.assertEqual(usage.operation, 'parse')
+        self.assertEqual(usage.file_item_id, file_item.id)
+        self.assertEqual(usage.batch_id, file_item.batch_id)
+        self.assertEqual(usage.user_id, self.user.id)
+
+    def test_upload_without_a_batch_labels_usage_with_the_uploader(self):
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['successful'], 1)
+        self.assertFalse(BatchUpload.objects.exists())
+
+        usage = LLMUsage.objects.get()
+        self.assertEqual(usage.operation, 'parse')
+        self.assertEqual(usage.user_id, self.user.id)
+        self.assertIsNone(usage.batch_id)
+        self.assertIsNone(usage.file_item_id)
+
+    def test_invalid_file_type(self):
+        files = [SimpleUploadedFile('cv.png', b'\x89PNG', content_type='image/png')]
+        response = self.client.post('/api/candidates/upload-cv/', {'files': files}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncCVUploadViewTests(TestCase):
+    """Asynchronous CV uploads (candidates.views.CVUploadView)"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(email='recruiter@example.com', password='secret'))
+
+    def test_async_upload_only_stores_and_queues_the_files(self):
+        files = [SimpleUploadedFile(f'cv{n}.pdf', b'%PDF-1.4', content_type='application/pdf') for n in range(3)]
+        with mock.patch('processing.services.parse_resume_service', side_effect=AssertionError("parsed in the request")):
+            response = self.client.post('/api/candidates/upload-cv/?async=true', {'files': files}, format='multipart')
+
+        self.assertEqual(response.status_code, 202)
+        batch = BatchUpload.objects.get(id=response.data['batch_id'])
+        self.assertEqual((batch.status, batch.total_files, batch.processed_files), ('processing', 3, 0))
+        file_items = FileItem.objects.filter(batch=batch)
+        self.assertEqual({item.status for item in file_items}, {'pending'})
+        tasks = Task.objects.filter(kind='parse_resume', status='pending')
+        self.assertEqual(sorted(task.payload['file_item_id'] for task in tasks), sorted(item.id for item in file_items))
+        self.assertEqual({task.payload['batch_id'] for task in tasks}, {batch.id})
+        self.assertFalse(ParsedResume.objects.exists())
+
+        status_response = self.client.get(response.data['status_url'])
+        self.assertEqual(status_response.status_code, 200)
+        self.assertEqual(status_response.data['status'], 'processing')
+
+    @override_settings(CV_UPLOAD_ASYNC=True)
+    def test_async_is_the_default_when_configured(self):
+        files = [SimpleUploadedFile('cv.pdf', b'%PDF-1.4', content_type='application/pdf')]
+        response = self.client.post('/api/candidates/upload-cv/', {'files': files}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Task.objects.count(), 1)
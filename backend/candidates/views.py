@@ -1,14 +1,13 @@
 """
 Candidates app views
 """
-import threading
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import uuid
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
 from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import Candidate, Resume, ParsedResume, Note, TimelineEvent
@@ -17,6 +16,10 @@ from .serializers import (
     NoteSerializer, TimelineEventSerializer, ParsedResumeSerializer
 )
 from processing.models import BatchUpload, FileItem
+from processing.pipeline import run_parse_pipeline
+from processing.tasks import enqueue_resumes
+from processing.usage import file_item_usage
+from ai.usage import usage_labels
 
 
 class CandidateViewSet(viewsets.ModelViewSet):
@@ -90,7 +93,7 @@ class ResumeViewSet(viewsets.ModelViewSet):
 class CVUploadView(APIView):
     """
     API endpoint to upload CV files for a job and process them with AI
-    Uses threading for concurrent processing
+    Extracts text in a process pool and parses concurrently in threads
     """
     permission_classes = [IsAuthenticated]
     
@@ -101,9 +104,17 @@ class CVUploadView(APIView):
         Expected request:
         - job_id: integer (optional, can be passed in query params or body)
         - files: list of files (PDF, DOC, DOCX)
+        - async: "true" to only store the files, queue them for the background
+          workers and return 202 with a batch_id (optional, query params or body;
+          defaults to the CV_UPLOAD_ASYNC setting)
         """
         job_id = request.data.get('job_id') or request.query_params.get('job_id')
         files = request.FILES.getlist('files')
+        async_param = request.data.get('async') or request.query_params.get('async')
+        if async_param is None:
+            async_mode = settings.CV_UPLOAD_ASYNC
+        else:
+            async_mode = str(async_param).lower() in ('1', 'true', 'yes')
         
         if not files:
             return Response(
@@ -141,6 +152,14 @@ class CVUploadView(APIView):
             except Exception:
                 pass  # Continue without batch if job not found
         
+        # Async uploads are tracked through their batch
+        if async_mode and batch is None:
+            batch = BatchUpload.objects.create(
+                user=request.user,
+                status='pending',
+                total_files=len(files)
+            )
+        
         # Store files and create candidates/resumes
         resumes_to_process = []
         file_items = []
@@ -148,7 +167,7 @@ class CVUploadView(APIView):
         for file in files:
             # Create a temporary candidate (will be updated after parsing)
             candidate = Candidate.objects.create(
-                email=f"temp_{file.name}_{threading.get_ident()}@temp.com",
+                email=f"temp_{uuid.uuid4().hex}_{file.name}@temp.com",
                 name=f"Temp Candidate {file.name}"
             )
             
@@ -169,33 +188,54 @@ class CVUploadView(APIView):
                 )
                 file_items.append(file_item)
         
-        # Process resumes concurrently using threading
-        # Use ThreadPoolExecutor with max 3 workers to respect rate limits
+        if async_mode:
+            # Hand off to `manage.py run_workers`; poll the batch status action
+            enqueue_resumes(batch, resumes_to_process, file_items)
+            return Response({
+                'message': f'Queued {len(files)} files for processing',
+                'batch_id': batch.id,
+                'status_url': f'/api/batch/batches/{batch.id}/status/',
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        # Process resumes concurrently: extraction in worker processes,
+        # LLM calls in worker threads, paced by the OpenRouter rate limiter and
+        # the adaptive concurrency limit
         results = []
         errors = []
         
-        def process_single_resume(resume):
-            """Process a single resume with AI"""
+        def find_file_item(resume):
+            """File item tracking a resume in the batch, if there is a batch"""
+            if not batch:
+                return None
+            return FileItem.objects.filter(batch=batch, candidate=resume.candidate).first()
+        
+        def process_single_resume(resume, extraction, extraction_error):
+            """Process a single resume with AI using its extracted text"""
             try:
+                if extraction_error is not None:
+                    raise extraction_error
+                
                 # Import here to avoid circular imports
-                from processing.services import parse_resume_service
+                from processing.services import batch_retry_hook, parse_resume_service
                 
-                # Small delay to respect rate limits (20 requests/minute = ~3 seconds between requests)
-                # Since we have max 3 workers, this helps spread out the requests
-                time.sleep(0.5)  # 500ms delay per request
+                # Retries are recorded on the file item and count against its batch's budget
+                file_item = find_file_item(resume)
+                on_retry = batch_retry_hook(file_item) if file_item else None
                 
-                # Process the resume
-                parsed_resume = parse_resume_service(resume)
+                # Account the LLM usage to the file item, or at least to the uploader
+                if file_item:
+                    labels = file_item_usage(file_item)
+                else:
+                    labels = usage_labels(operation='parse', user=request.user.id)
+                
+                # Process the resume (OpenRouter calls wait on the shared rate limiter)
+                with labels:
+                    parsed_resume = parse_resume_service(resume, extraction=extraction, on_retry=on_retry)
                 
                 # Update file item status if batch exists
-                if batch:
-                    file_item = FileItem.objects.filter(
-                        batch=batch,
-                        candidate=resume.candidate
-                    ).first()
-                    if file_item:
-                        file_item.status = 'completed'
-                        file_item.save()
+                if file_item:
+                    file_item.status = 'completed'
+                    file_item.save()
                 
                 return {
                     'resume_id': resume.id,
@@ -205,15 +245,11 @@ class CVUploadView(APIView):
                 }
             except Exception as e:
                 # Update file item status if batch exists
-                if batch:
-                    file_item = FileItem.objects.filter(
-                        batch=batch,
-                        candidate=resume.candidate
-                    ).first()
-                    if file_item:
-                        file_item.status = 'failed'
-                        file_item.error_message = str(e)
-                        file_item.save()
+                file_item = find_file_item(resume)
+                if file_item:
+                    file_item.status = 'failed'
+                    file_item.error_message = str(e)
+                    file_item.save()
                 
                 return {
                     'resume_id': resume.id,
@@ -222,21 +258,16 @@ class CVUploadView(APIView):
                     'error': str(e)
                 }
         
-        # Process with threading (max 3 concurrent to respect rate limits)
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # Submit all tasks
-            future_to_resume = {
-                executor.submit(process_single_resume, resume): resume 
-                for resume in resumes_to_process
-            }
-            
-            # Collect results as they complete
-            for future in as_completed(future_to_resume):
-                result = future.result()
-                if result['status'] == 'success':
-                    results.append(result)
-                else:
-                    errors.append(result)
+        # Extract text in the process pool and parse with LLM worker threads
+        for result in run_parse_pipeline(
+            resumes_to_process,
+            get_path=lambda resume: resume.file.path,
+            handle_item=process_single_resume
+        ):
+            if result['status'] == 'success':
+                results.append(result)
+            else:
+                errors.append(result)
         
         # Update batch status
         if batch:
@@ -2,10 +2,20 @@
 OpenRouter API client for AI operations
 """
 import os
-import requests
 import json
+import re
+import time
 from django.conf import settings
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
+from ai.transport import get_transport, TransportError
+from ai.ratelimit import get_rate_limiter, estimate_tokens
+from ai.concurrency import get_concurrency_limiter
+from ai.retry import OpenRouterError, call_with_retry, error_from_response
+from ai.circuit import call_with_failover, call_with_failover_async, track_attempt
+from ai.async_service import post_chat_completion
+from ai.service import prompt_messages, split_prompt
+from ai.prompt_registry import PromptTemplate, as_prompt_template
+from ai.usage import record_response_usage
 
 
 class OpenRouterClient:
@@ -14,14 +24,17 @@ class OpenRouterClient:
     def __init__(self):
         self.api_key = settings.OPENROUTER_API_KEY
         self.base_url = settings.OPENROUTER_BASE_URL
-        self.parse_model = settings.OPENROUTER_PARSE_MODEL
-        self.rank_model = settings.OPENROUTER_RANK_MODEL
+        # Ordered failover lists; the first model is preferred
+        self.parse_models = settings.OPENROUTER_PARSE_MODELS
+        self.rank_models = settings.OPENROUTER_RANK_MODELS
+        self.parse_model = self.parse_models[0]
+        self.rank_model = self.rank_models[0]
         
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY is not set in environment variables")
     
-    def _make_request(self, model: str, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
-        """Make a request to OpenRouter API"""
+    def _build_request(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        """Return (url, headers, payload) for a chat completion"""
         url = f"{self.base_url}/chat/completions"
         
         headers = {
@@ -34,47 +47,76 @@ class OpenRouterClient:
         payload = {
             "model": model,
             "messages": messages,
+            "usage": {"include": True},  # Ask OpenRouter to report the cost of the call
             **kwargs
         }
-        
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"OpenRouter API error: {str(e)}")
+        return url, headers, payload
+    
+    @staticmethod
+    def _read_response(response) -> Dict[str, Any]:
+        if not response.ok:
+            raise error_from_response(
+                response,
+                f"OpenRouter API error: {response.status_code} {response.reason}"
+            )
+        return response.json()
     
-    def parse_resume(self, resume_text: str, prompt_template: str) -> Dict[str, Any]:
+    def _make_request(self, model: str, messages: List[Dict[str, str]], on_retry=None, **kwargs) -> Dict[str, Any]:
         """
-        Parse a resume using OpenRouter API
+        Make a request to OpenRouter API
         
-        Args:
-            resume_text: The text content of the resume
-            prompt_template: The prompt template for parsing
-            
-        Returns:
-            Parsed resume data as dictionary
+        Retryable failures (429, 5xx, network errors) are retried with backoff;
+        on_retry(attempt, error, delay) is called before each retry and may
+        return False to give up.
+        
+        Raises:
+            OpenRouterError: If the request fails (after retries)
         """
-        # Format the prompt with resume text
-        full_prompt = prompt_template.format(resume_text=resume_text)
+        url, headers, payload = self._build_request(model, messages, **kwargs)
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_tokens(payload)
         
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an expert at parsing resumes and extracting structured information. Always return valid JSON."
-            },
-            {
-                "role": "user",
-                "content": full_prompt
-            }
-        ]
+        latency = None
         
-        response = self._make_request(
-            model=self.parse_model,
-            messages=messages,
-            response_format={"type": "json_object"} if "json" in self.parse_model.lower() else None
-        )
+        def attempt():
+            nonlocal latency
+            # Wait for the model's requests/min and tokens/min budget
+            limiter.acquire(model, estimated_tokens)
+            try:
+                # ...and for a slot under the adaptive concurrency limit
+                with get_concurrency_limiter().slot(), track_attempt(model):
+                    started = time.monotonic()
+                    try:
+                        # Reuse pooled keep-alive connections shared with the AI service
+                        response = get_transport().post(url, headers=headers, json=payload, timeout=60)
+                    except TransportError as e:
+                        raise OpenRouterError(f"OpenRouter API error: {str(e)}", retryable=True)
+                    result = self._read_response(response)
+                    latency = time.monotonic() - started
+            except OpenRouterError:
+                # Nothing was generated; the next attempt reserves the estimate again
+                limiter.refund(model, estimated_tokens)
+                raise
+            return result
         
+        result = call_with_retry(attempt, on_retry=on_retry)
+        limiter.record_usage(model, estimated_tokens, result.get('usage', {}).get('total_tokens'))
+        record_response_usage(model, result, latency)
+        return result
+    
+    @staticmethod
+    def _parse_resume_messages(resume_text: str, prompt_template: Union[PromptTemplate, str], model: str) -> List[Dict[str, Any]]:
+        # Static instructions first (cacheable by the provider), resume text last
+        static_prompt, user_text = split_prompt(prompt_template, resume_text)
+        return prompt_messages(
+            "You are an expert at parsing resumes and extracting structured information. Always return valid JSON.",
+            static_prompt,
+            model,
+            user_text
+        )
+    
+    @staticmethod
+    def _parsed_resume_from_response(response: Dict[str, Any]) -> Dict[str, Any]:
         # Extract the content from the response
         content = response.get("choices", [{}])[0].get("message", {}).get("content", "{}")
         
@@ -82,32 +124,21 @@ class OpenRouterClient:
             return json.loads(content)
         except json.JSONDecodeError:
             # Try to extract JSON from markdown code blocks if present
-            import re
             json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', content, re.DOTALL)
             if json_match:
                 return json.loads(json_match.group(1))
             raise ValueError(f"Failed to parse JSON from OpenRouter response: {content}")
     
-    def rank_candidates(self, job_description: str, candidates_data: List[Dict[str, Any]], prompt_template: str) -> List[Dict[str, Any]]:
-        """
-        Rank candidates for a job using OpenRouter API
-        
-        Args:
-            job_description: The job description text
-            candidates_data: List of candidate data dictionaries
-            prompt_template: The prompt template for ranking
-            
-        Returns:
-            Ranked list of candidates with scores
-        """
+    @staticmethod
+    def _rank_messages(job_description: str, candidates_data: List[Dict[str, Any]], prompt_template: Union[PromptTemplate, str]) -> List[Dict[str, str]]:
         # Format the prompt with job description and candidates
         candidates_json = json.dumps(candidates_data, indent=2)
-        full_prompt = prompt_template.format(
+        full_prompt = as_prompt_template(prompt_template).format(
             job_description=job_description,
             candidates_data=candidates_json
         )
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": "You are an expert at ranking candidates for job positions. Always return valid JSON with a ranked list."
@@ -117,13 +148,9 @@ class OpenRouterClient:
                 "content": full_prompt
             }
         ]
-        
-        response = self._make_request(
-            model=self.rank_model,
-            messages=messages,
-            response_format={"type": "json_object"} if "json" in self.rank_model.lower() else None
-        )
-        
+    
+    @staticmethod
+    def _ranked_candidates_from_response(response: Dict[str, Any]) -> List[Dict[str, Any]]:
         # Extract the content from the response
         content = response.get("choices", [{}])[0].get("message", {}).get("content", "{}")
         
@@ -138,7 +165,6 @@ class OpenRouterClient:
                 raise ValueError("Unexpected response format from ranking API")
         except json.JSONDecodeError:
             # Try to extract JSON from markdown code blocks if present
-            import re
             json_match = re.search(r'```(?:json)?\s*(\[.*?\]|\{.*?\})\s*```', content, re.DOTALL)
             if json_match:
                 parsed = json.loads(json_match.group(1))
@@ -147,4 +173,114 @@ class OpenRouterClient:
                 elif isinstance(parsed, list):
                     return parsed
             raise ValueError(f"Failed to parse JSON from OpenRouter response: {content}")
+    
+    def parse_resume(self, resume_text: str, prompt_template: Union[PromptTemplate, str], on_retry=None, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Parse a resume using OpenRouter API
+        
+        Args:
+            resume_text: The text content of the resume, already fitted to the
+                         budget (see ai.budget.fit_text_budget); sent as given
+            prompt_template: The parse prompt (see ai.prompt_registry.get_prompt), or a template string
+            on_retry: Optional retry hook, see _make_request
+            model: Model to use; if omitted, the parse models are tried in
+                   failover order
+        
+        Returns:
+            Parsed resume data as dictionary
+        """
+        if model is None:
+            result, _ = call_with_failover(
+                self.parse_models,
+                lambda parse_model: self.parse_resume(resume_text, prompt_template, on_retry, model=parse_model)
+            )
+            return result
+        
+        response = self._make_request(
+            model=model,
+            messages=self._parse_resume_messages(resume_text, prompt_template, model),
+            on_retry=on_retry,
+            response_format={"type": "json_object"} if "json" in model.lower() else None
+        )
+        return self._parsed_resume_from_response(response)
+    
+    def rank_candidates(self, job_description: str, candidates_data: List[Dict[str, Any]], prompt_template: Union[PromptTemplate, str], model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Rank candidates for a job using OpenRouter API
+        
+        Args:
+            job_description: The job description text
+            candidates_data: List of candidate data dictionaries
+            prompt_template: The ranking prompt (see ai.prompt_registry.get_prompt), or a template string
+            model: Model to use; if omitted, the rank models are tried in
+                   failover order
+        
+        Returns:
+            Ranked list of candidates with scores
+        """
+        if model is None:
+            result, _ = call_with_failover(
+                self.rank_models,
+                lambda rank_model: self.rank_candidates(job_description, candidates_data, prompt_template, model=rank_model)
+            )
+            return result
+        
+        response = self._make_request(
+            model=model,
+            messages=self._rank_messages(job_description, candidates_data, prompt_template),
+            response_format={"type": "json_object"} if "json" in model.lower() else None
+        )
+        return self._ranked_candidates_from_response(response)
 
+
+class AsyncOpenRouterClient(OpenRouterClient):
+    """
+    asyncio version of OpenRouterClient
+    
+    Same methods as OpenRouterClient, as coroutines. Requests go over the given
+    ai.async_service.AsyncTransport, so many calls can be in flight at once
+    without a thread each.
+    """
+    
+    def __init__(self, transport):
+        super().__init__()
+        self.transport = transport
+    
+    async def _make_request(self, model: str, messages: List[Dict[str, str]], on_retry=None, **kwargs) -> Dict[str, Any]:
+        """Async version of OpenRouterClient._make_request; on_retry may be a coroutine function"""
+        url, headers, payload = self._build_request(model, messages, **kwargs)
+        result = await post_chat_completion(self.transport, url, headers, payload, timeout=60, on_retry=on_retry)
+        return result
+    
+    async def parse_resume(self, resume_text: str, prompt_template: Union[PromptTemplate, str], on_retry=None, model: Optional[str] = None) -> Dict[str, Any]:
+        """Async version of OpenRouterClient.parse_resume"""
+        if model is None:
+            result, _ = await call_with_failover_async(
+                self.parse_models,
+                lambda parse_model: self.parse_resume(resume_text, prompt_template, on_retry, model=parse_model)
+            )
+            return result
+        
+        response = await self._make_request(
+            model=model,
+            messages=self._parse_resume_messages(resume_text, prompt_template, model),
+            on_retry=on_retry,
+            response_format={"type": "json_object"} if "json" in model.lower() else None
+        )
+        return self._parsed_resume_from_response(response)
+    
+    async def rank_candidates(self, job_description: str, candidates_data: List[Dict[str, Any]], prompt_template: Union[PromptTemplate, str], model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Async version of OpenRouterClient.rank_candidates"""
+        if model is None:
+            result, _ = await call_with_failover_async(
+                self.rank_models,
+                lambda rank_model: self.rank_candidates(job_description, candidates_data, prompt_template, model=rank_model)
+            )
+            return result
+        
+        response = await self._make_request(
+            model=model,
+            messages=self._rank_messages(job_description, candidates_data, prompt_template),
+            response_format={"type": "json_object"} if "json" in model.lower() else None
+        )
+        return self._ranked_candidates_from_response(response)
@@ -2,6 +2,7 @@
 Common utilities and helpers
 """
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import BaseRenderer
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -10,3 +11,12 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views that stream server-sent events accept text/event-stream"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +21,10 @@ load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The standalone ai package lives next to backend/; make it importable
+if str(BASE_DIR.parent) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -177,3 +182,60 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '')
 OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
 OPENROUTER_PARSE_MODEL = os.getenv('OPENROUTER_PARSE_MODEL', 'anthropic/claude-3.5-sonnet')
 OPENROUTER_RANK_MODEL = os.getenv('OPENROUTER_RANK_MODEL', 'anthropic/claude-3.5-sonnet')
+
+# Ordered failover lists (comma-separated); the first model is preferred and
+# later ones take over while its circuit breaker is open (see ai/circuit.py)
+OPENROUTER_PARSE_MODELS = [m.strip() for m in os.getenv('OPENROUTER_PARSE_MODELS', OPENROUTER_PARSE_MODEL).split(',') if m.strip()]
+OPENROUTER_RANK_MODELS = [m.strip() for m in os.getenv('OPENROUTER_RANK_MODELS', OPENROUTER_RANK_MODEL).split(',') if m.strip()]
+
+# Rate limiting (limits themselves come from OPENROUTER_RATE_LIMITS, see ai/ratelimit.py);
+# 'db' shares one quota across every worker process and host
+OPENROUTER_RATE_LIMIT_BACKEND = os.getenv('OPENROUTER_RATE_LIMIT_BACKEND', 'memory').lower()
+
+# Parse cache: reuse LLM results for identical files/prompt/model
+PARSE_CACHE_ENABLED = os.getenv('PARSE_CACHE_ENABLED', 'True') == 'True'
+
+# Singleflight: identical files being parsed at the same time share one LLM request
+# (across processes through a DB lease and the parse cache, so it needs PARSE_CACHE_ENABLED)
+PARSE_SINGLEFLIGHT = os.getenv('PARSE_SINGLEFLIGHT', 'True') == 'True'
+PARSE_LEASE_SECONDS = int(os.getenv('PARSE_LEASE_SECONDS', '300'))  # a crashed worker's parse is taken over after this
+PARSE_LEASE_POLL_INTERVAL = float(os.getenv('PARSE_LEASE_POLL_INTERVAL', '1.0'))
+
+# Re-parse writes: 'reconcile' updates only changed section rows, 'replace' recreates them all
+PARSE_SECTION_WRITE_MODE = os.getenv('PARSE_SECTION_WRITE_MODE', 'reconcile')
+
+# Parsing pipeline: process-pool text extraction feeding LLM worker threads
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '0')) or (os.cpu_count() or 1)
+EXTRACTION_TIMEOUT = int(os.getenv('EXTRACTION_TIMEOUT', '60'))  # seconds per file
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '10'))
+# Extracted text is stored once per file content as a compressed artifact here (empty to disable).
+# Resume text is personal data: keep this out of MEDIA_ROOT and anything else the web server serves
+EXTRACTION_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR', str(BASE_DIR / 'extraction_cache'))
+# LLM worker threads; with adaptive concurrency (ai/concurrency.py) at least OPENROUTER_CONCURRENCY_MAX
+# threads are started and the limiter decides how many send at once
+PARSE_LLM_WORKERS = int(os.getenv('PARSE_LLM_WORKERS', '3'))
+# LLM requests in flight for the asyncio batch driver (manage.py process_batch --async)
+PARSE_ASYNC_CONCURRENCY = int(os.getenv('PARSE_ASYNC_CONCURRENCY', '32'))
+# LLM retries allowed per batch (attempts and backoff: OPENROUTER_MAX_ATTEMPTS etc., see ai/retry.py)
+PARSE_BATCH_RETRY_BUDGET = int(os.getenv('PARSE_BATCH_RETRY_BUDGET', '20'))
+# Pack several resumes of a batch into one LLM request (the prompt is sent once per request)
+PARSE_BATCH_MODE = os.getenv('PARSE_BATCH_MODE', 'False') == 'True'
+PARSE_BATCH_MAX_TOKENS = int(os.getenv('PARSE_BATCH_MAX_TOKENS', '12000'))  # resume text per request
+PARSE_BATCH_MAX_SIZE = int(os.getenv('PARSE_BATCH_MAX_SIZE', '4'))  # resumes per request
+
+# Store tokens, latency and cost of every OpenRouter call as LLMUsage rows
+LLM_USAGE_TRACKING = os.getenv('LLM_USAGE_TRACKING', 'True') == 'True'
+
+# Background task queue (manage.py run_workers)
+TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', '300'))
+TASK_POLL_INTERVAL = float(os.getenv('TASK_POLL_INTERVAL', '1.0'))
+# Task worker threads per run_workers process (each runs one task at a time; extraction
+# goes to the shared EXTRACTION_WORKERS pool, LLM calls wait on the concurrency limiter)
+TASK_WORKER_THREADS = int(os.getenv('TASK_WORKER_THREADS', '0')) or PARSE_LLM_WORKERS
+
+# CV upload endpoint: queue files and return 202 instead of parsing in the request
+CV_UPLOAD_ASYNC = os.getenv('CV_UPLOAD_ASYNC', 'False') == 'True'
+
+# Batch progress event stream
+SSE_POLL_INTERVAL = float(os.getenv('SSE_POLL_INTERVAL', '2.0'))  # seconds between database checks per stream
+SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', '30'))  # seconds before the client reconnects; each open stream holds a server worker thread
@@ -1,3 +1,32 @@
 from django.contrib import admin
+from .models import LLMUsage, ParseCacheEntry, ParseLease, Task
 
-# Register your models here.
+
+@admin.register(ParseCacheEntry)
+class ParseCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'model', 'prompt_hash', 'hit_count', 'created_at', 'last_hit_at']
+    search_fields = ['content_hash', 'model']
+    list_filter = ['model', 'created_at']
+    readonly_fields = ['content_hash', 'prompt_hash', 'model', 'hit_count', 'created_at', 'last_hit_at']
+
+
+@admin.register(ParseLease)
+class ParseLeaseAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'prompt_hash', 'locked_by', 'lease_expires_at', 'created_at']
+    search_fields = ['content_hash', 'locked_by']
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'priority', 'attempts', 'max_attempts', 'locked_by', 'run_after', 'updated_at']
+    search_fields = ['kind', 'locked_by', 'last_error']
+    list_filter = ['status', 'kind']
+
+
+@admin.register(LLMUsage)
+class LLMUsageAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'operation', 'model', 'prompt_tokens', 'cached_tokens', 'completion_tokens', 'latency_ms', 'cost', 'batch', 'file_item', 'job', 'user']
+    search_fields = ['model']
+    list_filter = ['operation', 'model', 'created_at']
+    raw_id_fields = ['file_item', 'batch', 'job', 'user']
+    date_hierarchy = 'created_at'
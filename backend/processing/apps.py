@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class ProcessingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'processing'
+    
+    def ready(self):
+        from django.conf import settings
+        if settings.OPENROUTER_RATE_LIMIT_BACKEND == 'db':
+            from ai.ratelimit import configure_rate_limiter
+            from .ratelimit import DatabaseBackend
+            configure_rate_limiter(backend=DatabaseBackend())
+        # Async requests write rate limit buckets and usage rows on Django's
+        # sync thread, not on default-executor threads that never close their connections
+        from asgiref.sync import sync_to_async
+        from ai.async_service import configure_blocking_runner
+        configure_blocking_runner(lambda func, *args: sync_to_async(func, thread_sensitive=True)(*args))
+        if settings.LLM_USAGE_TRACKING:
+            from ai.usage import add_usage_sink
+            from .usage import store_llm_usage
+            add_usage_sink(store_llm_usage)
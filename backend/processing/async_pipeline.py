@@ -0,0 +1,136 @@
+"""
+asyncio batch driver: many LLM parses in flight from one thread
+
+The thread pipeline holds a thread per in-flight LLM call, so concurrency is
+capped by PARSE_LLM_WORKERS. Here every file is a coroutine: up to
+PARSE_ASYNC_CONCURRENCY requests wait on the network (and on the shared rate
+limiter) concurrently on one event loop. Text extraction still runs in a
+process pool (the process-wide ExtractionPool). Database work is handed to
+Django's single sync worker thread through sync_to_async, so the ORM never
+runs on the event loop.
+"""
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from ai.async_service import AsyncTransport, process_file_with_prompt_async
+from ai.circuit import call_with_failover_async
+from ai.budget import fit_text_budget
+from .models import BatchUpload
+from .pipeline import get_extraction_pool
+from .singleflight import parse_once_async
+from .usage import file_item_usage
+from .services import (
+    batch_retry_hook, create_file_item_resume, finish_file_item,
+    lookup_cached_parse, save_parsed_resume, start_file_item,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def extract_async(pool, file_path, timeout=None):
+    """
+    Extract a file in the extraction pool without blocking the event loop
+
+    Raises:
+        ExtractionTimeout: If extraction takes longer than the timeout
+    """
+    # A thread waits on the file, so its deadline counts from when it starts
+    return await asyncio.to_thread(pool.extract, file_path, timeout)
+
+
+async def request_resume_parse_async(transport, file_path, resume_text, on_retry=None):
+    """
+    Async version of services.request_resume_parse
+
+    Returns:
+        Tuple of (parsed resume data, model that produced it)
+    """
+    return await call_with_failover_async(
+        settings.OPENROUTER_PARSE_MODELS,
+        lambda model: process_file_with_prompt_async(
+            file_path=str(file_path),
+            prompt_name='parse_resume',
+            model=model,
+            transport=transport,
+            temperature=0.7,
+            max_tokens=4000,
+            response_format={"type": "json_object"},
+            resume_text=resume_text,
+            on_retry=on_retry
+        )
+    )
+
+
+async def parse_file_item_async(file_item, transport, semaphore, pool):
+    """Extract, parse and store one batch file item"""
+    async with semaphore:
+        await sync_to_async(start_file_item)(file_item)
+        try:
+            resume = await sync_to_async(create_file_item_resume)(file_item)
+            file_path = resume.file.path
+            extraction = await extract_async(pool, file_path)
+            text_budget = fit_text_budget(extraction.text)
+
+            parsed_data, cache_key = await sync_to_async(lookup_cached_parse)(file_path, extraction.content_hash)
+            if parsed_data is None:
+                with file_item_usage(file_item):
+                    # Identical files in flight at the same time share one request
+                    parsed_data = await parse_once_async(
+                        cache_key,
+                        lambda: request_resume_parse_async(
+                            transport,
+                            file_path,
+                            text_budget.text,
+                            on_retry=sync_to_async(batch_retry_hook(file_item))
+                        )
+                    )
+
+            parsed_resume = await sync_to_async(save_parsed_resume)(resume, extraction, parsed_data, text_budget)
+        except Exception as e:
+            logger.warning("Parsing file %s failed: %s", file_item.id, e)
+            await sync_to_async(finish_file_item)(file_item, error=e)
+        else:
+            await sync_to_async(finish_file_item)(file_item, parsed_resume)
+
+
+async def _process_batch(batch_id, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    pool = get_extraction_pool()
+    try:
+        file_items = await sync_to_async(
+            lambda: list(BatchUpload.objects.get(id=batch_id).file_items.all())
+        )()
+        async with AsyncTransport(max_connections=concurrency) as transport:
+            await asyncio.gather(*(
+                parse_file_item_async(file_item, transport, semaphore, pool)
+                for file_item in file_items
+            ))
+    finally:
+        await sync_to_async(connections.close_all)()
+
+
+def process_batch_async(batch_id, concurrency=None):
+    """
+    Process a batch with the asyncio driver (blocks until the batch is done)
+
+    Args:
+        batch_id: BatchUpload ID
+        concurrency: Max LLM requests in flight (default: PARSE_ASYNC_CONCURRENCY)
+    """
+    concurrency = concurrency or settings.PARSE_ASYNC_CONCURRENCY
+    batch = BatchUpload.objects.get(id=batch_id)
+    batch.status = 'processing'
+    batch.total_files = batch.file_items.count()
+    batch.save()
+
+    try:
+        asyncio.run(_process_batch(batch_id, concurrency))
+    except Exception:
+        BatchUpload.objects.filter(id=batch_id).update(status='failed')
+        raise
+
+    batch.refresh_from_db()
+    batch.status = 'completed'
+    batch.save()
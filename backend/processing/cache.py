@@ -0,0 +1,134 @@
+"""
+Content-addressed cache for LLM resume parse results
+"""
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from ai.prompt_registry import prompt_hash
+from .models import ParseCacheEntry
+
+# Per-process lookup counters (the DB only knows about stored entries)
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _record(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def is_cacheable(parsed_data):
+    """Only cache successful structured parses"""
+    return (
+        isinstance(parsed_data, dict)
+        and bool(parsed_data)
+        and not parsed_data.get('error')
+        and 'raw_response' not in parsed_data
+    )
+
+
+def get_cached_parse(content_hash, prompt_hash, models, record=True):
+    """
+    Look up a cached parse result
+
+    Args:
+        content_hash: sha256 of the resume file
+        prompt_hash: Hash of the parse prompt
+        models: Model names in order of preference; the first one with an
+                entry wins, and the lookup counts once however many there are
+        record: Count the lookup in the per-process hit/miss stats
+
+    Returns:
+        parsed_data dict, or None on a miss
+    """
+    entries = {
+        entry.model: entry
+        for entry in ParseCacheEntry.objects.filter(
+            content_hash=content_hash,
+            prompt_hash=prompt_hash,
+            model__in=models
+        ).only('id', 'model', 'parsed_data')
+    }
+    entry = next((entries[model] for model in models if model in entries), None)
+
+    if entry is None:
+        if record:
+            _record('misses')
+        return None
+
+    ParseCacheEntry.objects.filter(id=entry.id).update(
+        hit_count=F('hit_count') + 1,
+        last_hit_at=timezone.now()
+    )
+    if record:
+        _record('hits')
+    return entry.parsed_data
+
+
+def store_parse(content_hash, prompt_hash, model, parsed_data):
+    """Store a parse result (no-op for error/unstructured responses)"""
+    if not is_cacheable(parsed_data):
+        return None
+    entry, _ = ParseCacheEntry.objects.update_or_create(
+        content_hash=content_hash,
+        prompt_hash=prompt_hash,
+        model=model,
+        defaults={'parsed_data': parsed_data}
+    )
+    return entry
+
+
+def parse_cache_stats():
+    """Return stored entry counts and hit-rate statistics"""
+    totals = ParseCacheEntry.objects.aggregate(total_hits=Sum('hit_count'))
+    entries = ParseCacheEntry.objects.count()
+    total_hits = totals['total_hits'] or 0
+    with _stats_lock:
+        process_stats = dict(_stats)
+
+    lookups = process_stats['hits'] + process_stats['misses']
+    return {
+        'enabled': settings.PARSE_CACHE_ENABLED,
+        'entries': entries,
+        # Every stored entry was created by exactly one miss
+        'total_hits': total_hits,
+        'hit_rate': round(total_hits / (total_hits + entries), 4) if (total_hits + entries) else 0.0,
+        'process_hits': process_stats['hits'],
+        'process_misses': process_stats['misses'],
+        'process_hit_rate': round(process_stats['hits'] / lookups, 4) if lookups else 0.0,
+    }
+
+
+def invalidate_parse_cache(stale_only=False, older_than_days=None, model=None):
+    """
+    Delete cache entries
+
+    Args:
+        stale_only: Only delete entries not matching the current prompt and parse models
+        older_than_days: Only delete entries not hit (or created) within this many days
+        model: Only delete entries for this model
+
+    Returns:
+        Number of deleted entries
+    """
+    queryset = ParseCacheEntry.objects.all()
+
+    if stale_only:
+        queryset = queryset.exclude(
+            prompt_hash=prompt_hash('parse_resume'),
+            model__in=settings.OPENROUTER_PARSE_MODELS
+        )
+
+    if older_than_days is not None:
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        queryset = queryset.filter(
+            Q(last_hit_at__lt=cutoff) | Q(last_hit_at__isnull=True, created_at__lt=cutoff)
+        )
+
+    if model:
+        queryset = queryset.filter(model=model)
+
+    deleted, _ = queryset.delete()
+    return deleted
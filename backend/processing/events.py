@@ -0,0 +1,138 @@
+"""
+Server-sent event stream of batch progress
+
+Instead of re-serializing the whole batch on every poll, the stream sends
+one snapshot and then only the file items whose (updated_at, id) moved past
+the client's cursor, plus a small progress event when the counters change.
+Bulk .update() calls on file items must set updated_at themselves for their
+changes to be sent.
+
+The stream checks the database every SSE_POLL_INTERVAL seconds and gives
+its connection back in between. Under WSGI each open stream occupies a
+worker thread, so it ends after SSE_MAX_DURATION and the client reconnects
+with its cursor; size the server's threads for the number of open batch
+pages, not just for request throughput.
+"""
+import json
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .models import BatchUpload, FileItem
+
+FILE_ITEM_FIELDS = ('id', 'status', 'error_message', 'retry_count', 'candidate_id', 'updated_at')
+
+
+def format_event(event, data, event_id=None):
+    """Encode one SSE message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, cls=DjangoJSONEncoder)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _progress(batch):
+    total = batch['total_files']
+    return {
+        'status': batch['status'],
+        'processed_files': batch['processed_files'],
+        'total_files': total,
+        'progress_percentage': int((batch['processed_files'] / total) * 100) if total else 0,
+    }
+
+
+def format_cursor(item):
+    """Event ID of a file item event: its updated_at and id"""
+    return f"{item['updated_at'].isoformat()},{item['id']}"
+
+
+def parse_cursor(value):
+    """
+    Parse a Last-Event-ID / since value
+
+    Returns:
+        Tuple of (updated_at, id), or None. A bare timestamp resumes after
+        every item updated at that time or earlier.
+    """
+    if not value:
+        return None
+    timestamp, _, item_id = value.partition(',')
+    try:
+        updated_at = parse_datetime(timestamp)
+    except ValueError:
+        return None
+    if updated_at is None:
+        return None
+    if not item_id:
+        return updated_at, float('inf')
+    if not item_id.isdigit():
+        return None
+    return updated_at, int(item_id)
+
+
+def _after(cursor):
+    """File items past a cursor; items sharing a timestamp are ordered by id"""
+    updated_at, item_id = cursor
+    if item_id == float('inf'):
+        return Q(updated_at__gt=updated_at)
+    return Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=item_id)
+
+
+def batch_event_stream(batch_id, since=None):
+    """
+    Yield SSE messages for a batch until it finishes or SSE_MAX_DURATION passes
+
+    Args:
+        batch_id: BatchUpload ID
+        since: Only send file items past this (updated_at, id) cursor (resume a
+               stream, see parse_cursor); if None, start with a snapshot of every file item
+    """
+    started = time.monotonic()
+    last_heartbeat = started
+    cursor = since
+    last_progress = None
+
+    # Tell EventSource-style clients how long to wait before reconnecting
+    yield "retry: 3000\n\n"
+
+    while True:
+        batch = BatchUpload.objects.filter(id=batch_id).values(
+            'status', 'processed_files', 'total_files'
+        ).first()
+        if batch is None:
+            yield format_event('error', {'error': 'Batch not found'})
+            return
+
+        changed = FileItem.objects.filter(batch_id=batch_id)
+        if cursor is not None:
+            changed = changed.filter(_after(cursor))
+        changed = list(changed.order_by('updated_at', 'id').values(*FILE_ITEM_FIELDS))
+
+        for item in changed:
+            cursor = (item['updated_at'], item['id'])
+            yield format_event('file_item', item, event_id=format_cursor(item))
+
+        progress = _progress(batch)
+        if progress != last_progress:
+            last_progress = progress
+            yield format_event('progress', progress)
+
+        if batch['status'] in ('completed', 'failed'):
+            yield format_event('done', progress)
+            return
+
+        now = time.monotonic()
+        if now - started >= settings.SSE_MAX_DURATION:
+            # Clients reconnect with Last-Event-ID and continue from the cursor
+            return
+        if now - last_heartbeat >= 15:
+            last_heartbeat = now
+            yield ": keep-alive\n\n"
+
+        # Don't hold a database connection while waiting
+        connection.close()
+        time.sleep(settings.SSE_POLL_INTERVAL)
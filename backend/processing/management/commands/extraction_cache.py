@@ -0,0 +1,37 @@
+"""
+Inspect and clear the extracted-text artifact cache
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ai.extraction_cache import get_extraction_cache
+
+
+class Command(BaseCommand):
+    help = 'Show extraction cache statistics or delete cached extraction artifacts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['stats', 'clear'],
+            help='stats: show artifact count and size; clear: delete artifacts'
+        )
+        parser.add_argument(
+            '--older-than',
+            type=float,
+            metavar='DAYS',
+            help='Only delete artifacts written more than DAYS days ago'
+        )
+
+    def handle(self, *args, **options):
+        cache = get_extraction_cache(settings.EXTRACTION_CACHE_DIR)
+        if cache is None:
+            self.stderr.write('The extraction cache is disabled (EXTRACTION_CACHE_DIR is empty)')
+            return
+
+        if options['action'] == 'stats':
+            for key, value in cache.stats().items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        deleted = cache.clear(older_than_days=options['older_than'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} extraction artifacts"))
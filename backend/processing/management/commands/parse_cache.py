@@ -0,0 +1,53 @@
+"""
+Inspect and invalidate the resume parse cache
+"""
+from django.core.management.base import BaseCommand
+from processing.cache import parse_cache_stats, invalidate_parse_cache
+
+
+class Command(BaseCommand):
+    help = 'Show parse cache statistics or evict cached parse results'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['stats', 'evict', 'clear'],
+            help='stats: show hit-rate stats; evict: delete matching entries; clear: delete everything'
+        )
+        parser.add_argument(
+            '--stale',
+            action='store_true',
+            help='Only evict entries that do not match the current prompt and parse model'
+        )
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            metavar='DAYS',
+            help='Only evict entries not used in the last DAYS days'
+        )
+        parser.add_argument(
+            '--model',
+            help='Only evict entries produced by this model'
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        if action == 'stats':
+            for key, value in parse_cache_stats().items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        if action == 'clear':
+            deleted = invalidate_parse_cache()
+        else:
+            if not (options['stale'] or options['older_than'] is not None or options['model']):
+                self.stderr.write('evict requires --stale, --older-than or --model (use "clear" to delete everything)')
+                return
+            deleted = invalidate_parse_cache(
+                stale_only=options['stale'],
+                older_than_days=options['older_than'],
+                model=options['model'],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} parse cache entries"))
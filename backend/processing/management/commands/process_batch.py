@@ -0,0 +1,47 @@
+"""
+Process an uploaded batch in the foreground (thread pipeline or asyncio driver)
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from processing.models import BatchUpload
+from processing.pipeline import close_extraction_pool
+from processing.services import process_batch_service
+from processing.async_pipeline import process_batch_async
+
+
+class Command(BaseCommand):
+    help = 'Parse every file in a batch now, without the task queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch_id', type=int)
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='use_async',
+            help='Use the asyncio driver (many requests in flight from one thread)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.PARSE_ASYNC_CONCURRENCY,
+            help='Max LLM requests in flight with --async (default: PARSE_ASYNC_CONCURRENCY)'
+        )
+
+    def handle(self, *args, **options):
+        batch_id = options['batch_id']
+        if not BatchUpload.objects.filter(id=batch_id).exists():
+            raise CommandError(f"Batch {batch_id} does not exist")
+
+        try:
+            if options['use_async']:
+                process_batch_async(batch_id, concurrency=options['concurrency'])
+            else:
+                process_batch_service(batch_id)
+        finally:
+            close_extraction_pool()
+
+        batch = BatchUpload.objects.get(id=batch_id)
+        failed = batch.file_items.filter(status='failed').count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch {batch_id} {batch.status}: {batch.processed_files}/{batch.total_files} processed, {failed} failed"
+        ))
@@ -0,0 +1,76 @@
+"""
+Long-running worker that claims and runs background tasks (resume parsing)
+"""
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from processing.pipeline import close_extraction_pool
+from processing.tasks import run_worker, default_worker_id
+
+
+class Command(BaseCommand):
+    help = 'Claim and run queued processing tasks. Run several processes or hosts to scale out.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.TASK_WORKER_THREADS,
+            help='Worker threads in this process (default: TASK_WORKER_THREADS); '
+                 'they share one pool of EXTRACTION_WORKERS extraction processes'
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=settings.TASK_LEASE_SECONDS,
+            help='Seconds a claimed task stays leased before another worker may reclaim it'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.TASK_POLL_INTERVAL,
+            help='Seconds to wait between polls when the queue is empty'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is drained instead of waiting for new tasks'
+        )
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after current tasks...')
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        threads = []
+        for index in range(options['concurrency']):
+            thread = threading.Thread(
+                target=run_worker,
+                kwargs={
+                    'stop_event': stop_event,
+                    'worker_id': f"{default_worker_id()}-{index}",
+                    'lease_seconds': options['lease'],
+                    'poll_interval': options['poll_interval'],
+                    'once': options['once'],
+                },
+                name=f"task-worker-{index}"
+            )
+            thread.start()
+            threads.append(thread)
+
+        self.stdout.write(self.style.SUCCESS(f"Started {len(threads)} task workers"))
+
+        # join() with a timeout keeps the main thread responsive to signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+
+        close_extraction_pool()
+
+        self.stdout.write('All task workers stopped')
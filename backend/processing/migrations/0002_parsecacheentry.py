@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(db_index=True, help_text='sha256 of the uploaded file bytes', max_length=64)),
+                ('prompt_hash', models.CharField(help_text='sha256 of the parse prompt template', max_length=64)),
+                ('model', models.CharField(help_text='OpenRouter model used for parsing', max_length=200)),
+                ('parsed_data', models.JSONField(default=dict)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('content_hash', 'prompt_hash', 'model')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0002_parsecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='Handler name, e.g. parse_file_item', max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('priority', models.IntegerField(default=0, help_text='Higher priority tasks are claimed first')),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, help_text='Not claimed before this time')),
+                ('lease_expires_at', models.DateTimeField(blank=True, help_text='Reclaimable by another worker after this time', null=True)),
+                ('locked_by', models.CharField(blank=True, help_text='Worker currently holding the lease', max_length=100)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-priority', 'created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='processing__status_a4c277_idx')],
+            },
+        ),
+    ]
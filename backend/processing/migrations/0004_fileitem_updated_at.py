@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0003_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
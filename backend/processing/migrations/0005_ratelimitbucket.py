@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0004_fileitem_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Model and limit kind, e.g. openai/gpt-4o:rpm', max_length=255, unique=True)),
+                ('tokens', models.FloatField(help_text='Tokens left; negative while callers wait for a refill')),
+                ('updated_at', models.FloatField(help_text='Unix time of the last refill')),
+                ('version', models.IntegerField(default=0, help_text='Bumped on every write for compare-and-swap updates')),
+            ],
+        ),
+    ]
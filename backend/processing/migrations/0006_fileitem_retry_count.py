@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0005_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileitem',
+            name='retry_count',
+            field=models.IntegerField(default=0, help_text='LLM call retries spent on this file'),
+        ),
+    ]
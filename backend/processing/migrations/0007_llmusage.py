@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('jobs', '0005_auto_20251115_1332'),
+        ('processing', '0006_fileitem_retry_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(choices=[('parse', 'Parse'), ('parse_batch', 'Batched parse'), ('rank', 'Rank'), ('other', 'Other')], default='other', max_length=20)),
+                ('model', models.CharField(max_length=200)),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('cached_tokens', models.IntegerField(default=0, help_text="Prompt tokens served from the provider's prompt cache")),
+                ('latency_ms', models.IntegerField(blank=True, null=True)),
+                ('cost', models.DecimalField(blank=True, decimal_places=6, help_text='USD, as reported by OpenRouter or estimated from OPENROUTER_PRICES', max_digits=12, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_usage', to='processing.batchupload')),
+                ('file_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_usage', to='processing.fileitem')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_usage', to='jobs.job')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='processing__created_4839f1_idx')],
+            },
+        ),
+    ]
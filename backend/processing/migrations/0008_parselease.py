@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0007_llmusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(help_text='sha256 of the file being parsed', max_length=64)),
+                ('prompt_hash', models.CharField(help_text='sha256 of the parse prompt template', max_length=64)),
+                ('locked_by', models.CharField(help_text='Worker running the parse', max_length=100)),
+                ('lease_expires_at', models.DateTimeField(help_text='Another worker may take over after this time')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'prompt_hash')},
+            },
+        ),
+    ]
@@ -3,6 +3,7 @@ Processing app models
 """
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -50,8 +51,10 @@ class FileItem(models.Model):
     file = models.FileField(upload_to='batch_uploads/')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     error_message = models.TextField(blank=True)
+    retry_count = models.IntegerField(default=0, help_text="LLM call retries spent on this file")
     candidate = models.ForeignKey('candidates.Candidate', on_delete=models.SET_NULL, null=True, blank=True, related_name='file_items')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['created_at']
@@ -81,3 +84,111 @@ class Ranking(models.Model):
     
     def __str__(self):
         return f"Ranking for {self.job.title} - {self.status}"
+
+
+class ParseCacheEntry(models.Model):
+    """Cached LLM parse result keyed by file content, prompt version and model"""
+    content_hash = models.CharField(max_length=64, db_index=True, help_text="sha256 of the uploaded file bytes")
+    prompt_hash = models.CharField(max_length=64, help_text="sha256 of the parse prompt template")
+    model = models.CharField(max_length=200, help_text="OpenRouter model used for parsing")
+    parsed_data = models.JSONField(default=dict)
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ['content_hash', 'prompt_hash', 'model']
+    
+    def __str__(self):
+        return f"Parse cache {self.content_hash[:12]} ({self.model}) - {self.hit_count} hits"
+
+
+class ParseLease(models.Model):
+    """Claim on an in-flight LLM parse, so other workers wait for its cached result"""
+    content_hash = models.CharField(max_length=64, help_text="sha256 of the file being parsed")
+    prompt_hash = models.CharField(max_length=64, help_text="sha256 of the parse prompt template")
+    locked_by = models.CharField(max_length=100, help_text="Worker running the parse")
+    lease_expires_at = models.DateTimeField(help_text="Another worker may take over after this time")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['content_hash', 'prompt_hash']
+    
+    def __str__(self):
+        return f"Parse lease {self.content_hash[:12]} held by {self.locked_by}"
+
+
+class Task(models.Model):
+    """Durable background task claimed by `manage.py run_workers`"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50, help_text="Handler name, e.g. parse_file_item")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    priority = models.IntegerField(default=0, help_text="Higher priority tasks are claimed first")
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not claimed before this time")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="Reclaimable by another worker after this time")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker currently holding the lease")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+    
+    def __str__(self):
+        return f"Task {self.id} {self.kind} - {self.status} (attempt {self.attempts}/{self.max_attempts})"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by every worker when OPENROUTER_RATE_LIMIT_BACKEND=db"""
+    key = models.CharField(max_length=255, unique=True, help_text="Model and limit kind, e.g. openai/gpt-4o:rpm")
+    tokens = models.FloatField(help_text="Tokens left; negative while callers wait for a refill")
+    updated_at = models.FloatField(help_text="Unix time of the last refill")
+    version = models.IntegerField(default=0, help_text="Bumped on every write for compare-and-swap updates")
+    
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f}"
+
+
+class LLMUsage(models.Model):
+    """Tokens, latency and cost of one OpenRouter call"""
+    OPERATION_CHOICES = [
+        ('parse', 'Parse'),
+        ('parse_batch', 'Batched parse'),
+        ('rank', 'Rank'),
+        ('other', 'Other'),
+    ]
+    
+    operation = models.CharField(max_length=20, choices=OPERATION_CHOICES, default='other')
+    model = models.CharField(max_length=200)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    cached_tokens = models.IntegerField(default=0, help_text="Prompt tokens served from the provider's prompt cache")
+    latency_ms = models.IntegerField(null=True, blank=True)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, null=True, blank=True, help_text="USD, as reported by OpenRouter or estimated from OPENROUTER_PRICES")
+    file_item = models.ForeignKey(FileItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_usage')
+    batch = models.ForeignKey(BatchUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_usage')
+    job = models.ForeignKey('jobs.Job', on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_usage')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_usage')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.operation} {self.model}: {self.prompt_tokens}+{self.completion_tokens} tokens"
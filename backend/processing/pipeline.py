@@ -0,0 +1,289 @@
+"""
+Two-stage parsing pipeline: process-pool text extraction feeding LLM worker threads
+
+PDF/DOCX extraction is CPU-bound pure Python, so it runs in a process pool
+where it can use every core without contending for the GIL with request and
+LLM threads. Extracted text is handed to the LLM stage through a bounded
+queue so extraction and network waits overlap, and extraction pauses when
+the LLM stage falls behind.
+
+Batches, task worker threads and async batches all extract in one
+process-wide ExtractionPool of EXTRACTION_WORKERS processes. A file that
+hangs restarts the pool; the files it interrupted are submitted again.
+"""
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db import connections
+from ai.concurrency import get_concurrency_limiter
+from ai.extraction_cache import extract_text_cached
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Marks the end of the extraction stage for each LLM worker
+_DONE = object()
+
+# How often a caller checks whether its file has started extracting
+START_POLL_INTERVAL = 0.1
+
+# Set in extraction worker processes: reports each file as it starts
+_started_queue = None
+
+
+class ExtractionTimeout(Exception):
+    """Raised when extracting a single file exceeds EXTRACTION_TIMEOUT"""
+
+
+def llm_worker_count():
+    """
+    Threads for LLM work: enough to reach the adaptive concurrency limit's
+    ceiling (the limiter decides how many of them send at once), otherwise
+    PARSE_LLM_WORKERS
+    """
+    limiter = get_concurrency_limiter()
+    if limiter.enabled:
+        return max(settings.PARSE_LLM_WORKERS, limiter.max_limit)
+    return settings.PARSE_LLM_WORKERS
+
+
+def _init_extraction_worker(started_queue):
+    global _started_queue
+    _started_queue = started_queue
+
+
+def _extract_file(token, file_path, cache_dir):
+    """Pool task: report that extraction started, then extract"""
+    _started_queue.put(token)
+    return extract_text_cached(file_path, cache_dir)
+
+
+class ExtractionPool:
+    """
+    Extraction process pool shared by threads (see get_extraction_pool)
+
+    The per-file deadline counts from when a worker process starts the file,
+    not from when it was submitted. A running extraction cannot be cancelled,
+    so on timeout the pool is recycled: its processes are killed and the next
+    file starts new ones. Files the recycle interrupted are submitted again.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or settings.EXTRACTION_WORKERS
+        # Bumped on every recycle, so interrupted files know to retry
+        self.generation = 0
+        self._executor = None
+        self._started_queue = None
+        self._started = set()
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+
+    def _submit(self, file_path):
+        with self._lock:
+            if self._executor is None:
+                # spawn avoids forking a multi-threaded server process
+                context = multiprocessing.get_context('spawn')
+                self._started_queue = context.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_extraction_worker,
+                    initargs=(self._started_queue,),
+                )
+            token = next(self._tokens)
+            future = self._executor.submit(_extract_file, token, str(file_path), settings.EXTRACTION_CACHE_DIR)
+            return self.generation, token, future
+
+    def _has_started(self, token):
+        with self._lock:
+            while self._started_queue is not None:
+                try:
+                    self._started.add(self._started_queue.get_nowait())
+                except queue.Empty:
+                    break
+            return token in self._started
+
+    def _forget(self, token):
+        with self._lock:
+            self._started.discard(token)
+
+    def recycle(self):
+        """Kill the pool's processes; the next file starts a new pool"""
+        with self._lock:
+            executor, started_queue = self._executor, self._started_queue
+            self._executor = self._started_queue = None
+            self._started.clear()
+            self.generation += 1
+        if executor is not None:
+            processes = list((executor._processes or {}).values())
+            executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            started_queue.close()
+
+    def close(self):
+        """Shut the pool down once its files are done"""
+        with self._lock:
+            executor, started_queue = self._executor, self._started_queue
+            self._executor = self._started_queue = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            started_queue.close()
+
+    def extract(self, file_path, timeout=None):
+        """
+        Extract a single file, thread-safe
+
+        Raises:
+            ExtractionTimeout: If extraction runs longer than the timeout
+        """
+        timeout = timeout or settings.EXTRACTION_TIMEOUT
+        while True:
+            generation, token, future = self._submit(file_path)
+            try:
+                return self._wait(token, future, timeout)
+            except (BrokenProcessPool, CancelledError):
+                if self.generation != generation:
+                    # Another file's timeout recycled the pool under this one
+                    continue
+                # A worker process crashed
+                self.recycle()
+                raise
+            finally:
+                self._forget(token)
+
+    def _wait(self, token, future, timeout):
+        deadline = None
+        while True:
+            if deadline is None and self._has_started(token):
+                deadline = time.monotonic() + timeout
+            wait_for = START_POLL_INTERVAL if deadline is None else deadline - time.monotonic()
+            try:
+                return future.result(timeout=max(wait_for, 0))
+            except FutureTimeoutError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.recycle()
+                    raise ExtractionTimeout(f"Text extraction timed out after {timeout}s")
+
+
+def get_extraction_pool():
+    """Return the process-wide ExtractionPool (EXTRACTION_WORKERS processes, started on first use)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExtractionPool()
+        return _pool
+
+
+def close_extraction_pool():
+    """Shut down the process-wide pool's processes (e.g. when run_workers exits)"""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.close()
+
+
+def extract_in_pool(file_path, timeout=None):
+    """
+    Extract a single file in the process-wide pool
+
+    Raises:
+        ExtractionTimeout: If extraction takes longer than the timeout
+    """
+    return get_extraction_pool().extract(file_path, timeout)
+
+
+def _run_extraction_stage(items, get_path, out_queue, llm_workers):
+    """Extract each item's file in the process-wide pool and queue the results"""
+    items = list(items)
+    pool = get_extraction_pool()
+    handled = [False] * len(items)
+
+    def extract(index):
+        item = items[index]
+        try:
+            extraction, error = pool.extract(get_path(item)), None
+        except Exception as e:
+            extraction, error = None, e
+        # Blocks while the LLM stage is behind
+        out_queue.put((item, extraction, error))
+        handled[index] = True
+
+    try:
+        # One thread per process: each waits on its own file's deadline
+        with ThreadPoolExecutor(max_workers=min(pool.max_workers, len(items)) or 1) as executor:
+            for future in [executor.submit(extract, index) for index in range(len(items))]:
+                future.result()
+    except Exception as e:
+        # Every item must reach the LLM stage, or it would stay pending
+        for item, done in zip(items, handled):
+            if not done:
+                out_queue.put((item, None, e))
+    finally:
+        for _ in range(llm_workers):
+            out_queue.put(_DONE)
+
+
+def run_parse_pipeline(items, get_path, handle_item, llm_workers=None):
+    """
+    Run extraction and LLM handling for a list of items
+
+    Args:
+        items: Items to process (e.g. Resume or FileItem instances)
+        get_path: Callable returning the file path for an item
+        handle_item: Callable (item, extraction, error) -> result, called from an
+                     LLM worker thread. Exactly one of extraction/error is set.
+                     It should handle its own errors; an exception is re-raised
+                     only after every other item has been processed.
+        llm_workers: Number of LLM worker threads (default: llm_worker_count())
+
+    Returns:
+        List of handle_item results in completion order
+    """
+    llm_workers = llm_workers or llm_worker_count()
+    extracted = queue.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    results = []
+    results_lock = threading.Lock()
+    errors = []
+
+    def llm_worker():
+        try:
+            while True:
+                entry = extracted.get()
+                if entry is _DONE:
+                    return
+                # Keep draining the queue even if one item fails, otherwise
+                # the extraction stage would block on a full queue
+                try:
+                    result = handle_item(*entry)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                with results_lock:
+                    results.append(result)
+        finally:
+            connections.close_all()
+
+    producer = threading.Thread(
+        target=_run_extraction_stage,
+        args=(items, get_path, extracted, llm_workers),
+        daemon=True
+    )
+    producer.start()
+
+    with ThreadPoolExecutor(max_workers=llm_workers) as executor:
+        for future in [executor.submit(llm_worker) for _ in range(llm_workers)]:
+            future.result()
+
+    producer.join()
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,40 @@
+"""
+Database backend for the OpenRouter rate limiter
+
+Keeps token buckets in RateLimitBucket rows so every worker process and host
+sharing the database draws from one quota. Updates are a compare-and-swap on
+the row version, which works the same on SQLite and PostgreSQL.
+"""
+import time
+from django.db import IntegrityError, transaction
+from ai.ratelimit import take_tokens
+from .models import RateLimitBucket
+
+
+class DatabaseBackend:
+    """Bucket state stored in RateLimitBucket rows"""
+
+    def __init__(self, max_retries=20):
+        self.max_retries = max_retries
+
+    def take(self, key, amount, capacity, rate):
+        for _ in range(self.max_retries):
+            row = RateLimitBucket.objects.filter(key=key).values('tokens', 'updated_at', 'version').first()
+            state = None if row is None else {'tokens': row['tokens'], 'updated_at': row['updated_at']}
+            state, wait = take_tokens(state, amount, capacity, rate, time.time())
+
+            if row is None:
+                try:
+                    with transaction.atomic():
+                        RateLimitBucket.objects.create(key=key, **state)
+                    return wait
+                except IntegrityError:
+                    # Another worker created the bucket first; retry against it
+                    continue
+
+            if RateLimitBucket.objects.filter(key=key, version=row['version']).update(
+                version=row['version'] + 1, **state
+            ):
+                return wait
+
+        raise RuntimeError(f"Could not update rate limit bucket {key} after {self.max_retries} attempts")
@@ -0,0 +1,284 @@
+"""
+Persistence of parsed resume sections (education, experience, skills, ...)
+
+Rows are built in memory and written with one bulk_create per model, so a
+typical resume costs a handful of queries instead of one INSERT per item.
+On re-parse, reconcile_resume_sections() matches new rows to existing ones
+by natural key and only writes the differences, so unchanged rows keep
+their IDs.
+"""
+from contextlib import contextmanager
+from django.db import connection
+from candidates.models import (
+    Education, Experience, TechnicalSkill, SoftSkill, SkillMentionedInJobTitle,
+    Project, Award, Language, Course, Publication
+)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count SQL queries executed on the default connection in this block
+
+    Yields a dict whose 'count' is updated as queries run.
+    """
+    stats = {'count': 0}
+
+    def wrapper(execute, sql, params, many, context):
+        stats['count'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield stats
+
+
+def _unique(rows, *fields):
+    """Drop rows that repeat a unique_together key (the LLM sometimes lists a skill twice)"""
+    seen = set()
+    unique_rows = []
+    for row in rows:
+        key = tuple(getattr(row, field) for field in fields)
+        if key not in seen:
+            seen.add(key)
+            unique_rows.append(row)
+    return unique_rows
+
+
+def build_section_rows(parsed_resume, parsed_data):
+    """
+    Build unsaved section model instances from parsed data
+
+    Returns:
+        Dict mapping each section model to a list of unsaved instances
+    """
+    skills_data = parsed_data.get('skills', {})
+
+    return {
+        Education: [
+            Education(
+                parsed_resume=parsed_resume,
+                degree=edu_data.get('degree', ''),
+                field=edu_data.get('field', ''),
+                institution=edu_data.get('institution', ''),
+                location=edu_data.get('location', ''),
+                start_date=edu_data.get('start_date', ''),
+                end_date=edu_data.get('end_date', ''),
+                gpa=edu_data.get('gpa', ''),
+                honors=edu_data.get('honors', ''),
+                thesis=edu_data.get('thesis', ''),
+                relevant_courses=edu_data.get('relevant_courses', []),
+                order=idx
+            )
+            for idx, edu_data in enumerate(parsed_data.get('education', []))
+        ],
+        Experience: [
+            Experience(
+                parsed_resume=parsed_resume,
+                job_title=exp_data.get('job_title', ''),
+                company=exp_data.get('company', ''),
+                company_type=exp_data.get('company_type', ''),
+                location=exp_data.get('location', ''),
+                employment_type=exp_data.get('employment_type', ''),
+                start_date=exp_data.get('start_date', ''),
+                end_date=exp_data.get('end_date', ''),
+                duration=exp_data.get('duration', ''),
+                is_currently_employed=exp_data.get('is_currently_employed', False),
+                reasoning=exp_data.get('reasoning', ''),
+                responsibilities=exp_data.get('responsibilities', []),
+                order=idx
+            )
+            for idx, exp_data in enumerate(parsed_data.get('experience', []))
+        ],
+        TechnicalSkill: _unique([
+            TechnicalSkill(
+                parsed_resume=parsed_resume,
+                category=category_data.get('category', ''),
+                name=item.get('name', ''),
+                level=item.get('level', '')
+            )
+            for category_data in skills_data.get('technical', [])
+            for item in category_data.get('items', [])
+        ], 'category', 'name'),
+        SoftSkill: _unique([
+            SoftSkill(parsed_resume=parsed_resume, name=skill_name)
+            for skill_name in skills_data.get('soft', [])
+        ], 'name'),
+        SkillMentionedInJobTitle: _unique([
+            SkillMentionedInJobTitle(parsed_resume=parsed_resume, name=skill_name)
+            for skill_name in skills_data.get('skills_mentioned_in_job_title', [])
+        ], 'name'),
+        Project: [
+            Project(
+                parsed_resume=parsed_resume,
+                name=project_data.get('name', ''),
+                role=project_data.get('role', ''),
+                date=project_data.get('date', ''),
+                technologies=project_data.get('technologies', []),
+                description=project_data.get('description', ''),
+                link=project_data.get('link', ''),
+                order=idx
+            )
+            for idx, project_data in enumerate(parsed_data.get('projects', []))
+        ],
+        Award: [
+            Award(
+                parsed_resume=parsed_resume,
+                title=award_data.get('title', ''),
+                issuer=award_data.get('issuer', ''),
+                rank=award_data.get('rank', ''),
+                date=award_data.get('date', ''),
+                description=award_data.get('description', ''),
+                order=idx
+            )
+            for idx, award_data in enumerate(parsed_data.get('awards', []))
+        ],
+        Language: _unique([
+            Language(
+                parsed_resume=parsed_resume,
+                language=lang_data.get('language', ''),
+                proficiency=lang_data.get('proficiency', ''),
+                skills=lang_data.get('skills', {}),
+                certificates=lang_data.get('certificates', [])
+            )
+            for lang_data in parsed_data.get('languages', [])
+        ], 'language'),
+        Course: [
+            Course(
+                parsed_resume=parsed_resume,
+                name=course_data.get('name', ''),
+                provider=course_data.get('provider', ''),
+                instructor=course_data.get('instructor', ''),
+                completion_date=course_data.get('completion_date', ''),
+                duration=course_data.get('duration', ''),
+                certificate_id=course_data.get('certificate_id', ''),
+                verification_link=course_data.get('verification_link', ''),
+                order=idx
+            )
+            for idx, course_data in enumerate(parsed_data.get('courses', []))
+        ],
+        Publication: [
+            Publication(
+                parsed_resume=parsed_resume,
+                title=pub_data.get('title', ''),
+                authors=pub_data.get('authors', []),
+                venue=pub_data.get('venue', ''),
+                year=pub_data.get('year', ''),
+                volume_pages=pub_data.get('volume_pages', ''),
+                doi=pub_data.get('doi', ''),
+                link=pub_data.get('link', ''),
+                citations=pub_data.get('citations', ''),
+                order=idx
+            )
+            for idx, pub_data in enumerate(parsed_data.get('publications', []))
+        ],
+    }
+
+
+def _change_summary(inserted=0, updated=0, deleted=0, unchanged=0):
+    return {'inserted': inserted, 'updated': updated, 'deleted': deleted, 'unchanged': unchanged}
+
+
+def total_changes(summary):
+    """Sum a per-model change summary into one dict"""
+    totals = _change_summary()
+    for counts in summary.values():
+        for key, value in counts.items():
+            totals[key] += value
+    return totals
+
+
+def replace_resume_sections(parsed_resume, parsed_data, created=False):
+    """
+    Delete existing section rows and bulk insert new ones
+
+    Must be called inside a transaction. Pass created=True for a ParsedResume
+    that was just created to skip the DELETEs.
+
+    Returns:
+        Dict of change counts (inserted/updated/deleted/unchanged) per model name
+    """
+    summary = {}
+    for model, rows in build_section_rows(parsed_resume, parsed_data).items():
+        deleted = 0
+        if not created:
+            deleted, _ = model.objects.filter(parsed_resume=parsed_resume).delete()
+        if rows:
+            model.objects.bulk_create(rows)
+        summary[model.__name__] = _change_summary(inserted=len(rows), deleted=deleted)
+    return summary
+
+
+def natural_key_fields(model):
+    """
+    Fields identifying a section row within its parsed resume
+
+    The unique_together fields (minus parsed_resume) for skills and languages,
+    otherwise the row's position ('order').
+    """
+    for fields in model._meta.unique_together:
+        return tuple(field for field in fields if field != 'parsed_resume')
+    return ('order',)
+
+
+def _value_fields(model, key_fields):
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if not field.primary_key and field.name != 'parsed_resume' and field.name not in key_fields
+    ]
+
+
+def reconcile_resume_sections(parsed_resume, parsed_data):
+    """
+    Update existing section rows in place, writing only what changed
+
+    New rows are matched to existing ones by natural_key_fields(). Matches
+    with different values are updated, unmatched new rows are inserted and
+    unmatched existing rows are deleted. Must be called inside a transaction.
+
+    Returns:
+        Dict of change counts (inserted/updated/deleted/unchanged) per model name
+    """
+    summary = {}
+    for model, rows in build_section_rows(parsed_resume, parsed_data).items():
+        key_fields = natural_key_fields(model)
+        value_fields = _value_fields(model, key_fields)
+
+        existing = {}
+        stale_ids = []
+        for row in model.objects.filter(parsed_resume=parsed_resume):
+            key = tuple(getattr(row, field) for field in key_fields)
+            if key in existing:
+                # Older data may repeat an order value; keep the first row
+                stale_ids.append(row.pk)
+            else:
+                existing[key] = row
+
+        to_create = []
+        to_update = []
+        unchanged = 0
+        for row in rows:
+            current = existing.pop(tuple(getattr(row, field) for field in key_fields), None)
+            if current is None:
+                to_create.append(row)
+            elif any(getattr(current, field) != getattr(row, field) for field in value_fields):
+                for field in value_fields:
+                    setattr(current, field, getattr(row, field))
+                to_update.append(current)
+            else:
+                unchanged += 1
+        stale_ids.extend(row.pk for row in existing.values())
+
+        if stale_ids:
+            model.objects.filter(pk__in=stale_ids).delete()
+        if to_create:
+            model.objects.bulk_create(to_create)
+        if to_update:
+            model.objects.bulk_update(to_update, value_fields)
+
+        summary[model.__name__] = _change_summary(
+            inserted=len(to_create),
+            updated=len(to_update),
+            deleted=len(stale_ids),
+            unchanged=unchanged
+        )
+    return summary
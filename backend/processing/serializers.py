@@ -14,9 +14,9 @@ class FileItemSerializer(serializers.ModelSerializer):
         model = FileItem
         fields = [
             'id', 'batch', 'file', 'status', 'error_message',
-            'candidate', 'created_at'
+            'retry_count', 'candidate', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'retry_count', 'created_at']
 
 
 class BatchUploadSerializer(serializers.ModelSerializer):
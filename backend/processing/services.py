@@ -1,324 +1,297 @@
 """
 Processing services for resume parsing and ranking (synchronous)
 """
-import os
-import sys
-from pathlib import Path
+import time
+import logging
 from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
 from core.openrouter import OpenRouterClient
-from candidates.models import (
-    Candidate, Resume, ParsedResume, Experience, Education, TimelineEvent, JobScore,
-    TechnicalSkill, SoftSkill, SkillMentionedInJobTitle,
-    Project, Award, Language, Course, Publication
-)
-from jobs.models import Job
+from candidates.models import Candidate, Resume, ParsedResume, TimelineEvent
 from .models import BatchUpload, FileItem
-import PyPDF2
-from docx import Document
-
-# Add ai directory to path to import service
-ai_dir = Path(settings.BASE_DIR).parent / 'ai'
-if str(ai_dir) not in sys.path:
-    sys.path.insert(0, str(ai_dir))
+from .cache import get_cached_parse, store_parse
+from .pipeline import llm_worker_count, run_parse_pipeline
+from .usage import file_item_usage
+from .singleflight import parse_once
+from .sections import count_queries, replace_resume_sections, reconcile_resume_sections, total_changes
+from ai.budget import fit_text_budget
+from ai.extraction_cache import content_sha256
+from ai.normalize import normalize_key
+from ai.circuit import call_with_failover
+from ai.usage import usage_labels
+from ai.prompt_registry import get_prompt, prompt_hash
 
 try:
-    from ai.service import process_file_with_prompt
+    from ai.service import process_file_with_prompt, parse_resumes_batched
     HAS_AI_SERVICE = True
 except ImportError:
     HAS_AI_SERVICE = False
 
+logger = logging.getLogger(__name__)
+
+# Attempts at a save that SQLite rejected with "database is locked"
+SQLITE_LOCK_ATTEMPTS = 5
+
 
-def extract_text_from_file(file_path):
-    """Extract text from PDF or DOCX file"""
-    file_ext = Path(file_path).suffix.lower()
+def batch_retry_hook(file_item):
+    """
+    Build an on_retry hook that records retries on a file item
     
-    if file_ext == '.pdf':
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
-        except Exception as e:
-            raise ValueError(f"Error reading PDF: {str(e)}")
+    Retries stop once the file's batch has spent PARSE_BATCH_RETRY_BUDGET,
+    so a provider outage fails the batch quickly instead of multiplying load.
+    """
+    def on_retry(attempt, error, delay):
+        spent = FileItem.objects.filter(batch_id=file_item.batch_id).aggregate(
+            total=Sum('retry_count')
+        )['total'] or 0
+        if spent >= settings.PARSE_BATCH_RETRY_BUDGET:
+            logger.warning(
+                "Batch %s retry budget spent; not retrying file %s (%s)",
+                file_item.batch_id, file_item.id, error.status_code or 'network error'
+            )
+            return False
+        
+        # updated_at is set explicitly so batch event streams send the change
+        FileItem.objects.filter(id=file_item.id).update(retry_count=F('retry_count') + 1, updated_at=timezone.now())
+        file_item.retry_count += 1
+        logger.info(
+            "Retrying file %s in %.1fs after %s (attempt %s)",
+            file_item.id, delay, error.status_code or 'network error', attempt
+        )
+        return True
     
-    elif file_ext in ['.doc', '.docx']:
-        try:
-            doc = Document(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            return text
-        except Exception as e:
-            raise ValueError(f"Error reading DOCX: {str(e)}")
+    return on_retry
+
+
+def _parse_with_model(file_path, resume_text, model, on_retry=None):
+    """Send extracted resume text to one parse model"""
+    # Use AI service if available, otherwise fallback to old method
+    if HAS_AI_SERVICE:
+        # Errors are not retried with the direct client: the request already
+        # reached the API (and was retried), a second client would only add load
+        return process_file_with_prompt(
+            file_path=str(file_path),
+            prompt_name='parse_resume',
+            model=model,
+            temperature=0.7,
+            max_tokens=4000,
+            response_format={"type": "json_object"},
+            resume_text=resume_text,
+            on_retry=on_retry
+        )
     
-    else:
-        raise ValueError(f"Unsupported file type: {file_ext}")
-
-
-def load_prompt_template(template_name):
-    """Load prompt template from ai/prompts directory"""
-    prompts_dir = Path(settings.BASE_DIR).parent / 'ai' / 'prompts'
-    template_path = prompts_dir / f"{template_name}.md"
-    
-    if not template_path.exists():
-        raise FileNotFoundError(f"Prompt template not found: {template_path}")
-    
-    with open(template_path, 'r') as f:
-        content = f.read()
-        # Extract the prompt part (skip markdown headers)
-        lines = content.split('\n')
-        # Find the actual prompt content
-        prompt_start = False
-        prompt_lines = []
-        for line in lines:
-            if 'Resume text:' in line or 'Job Description:' in line:
-                prompt_start = True
-            if prompt_start:
-                prompt_lines.append(line)
-        
-        return '\n'.join(prompt_lines) if prompt_lines else content
+    client = OpenRouterClient()
+    return client.parse_resume(resume_text, get_prompt('parse_resume'), on_retry=on_retry, model=model)
 
 
-def parse_resume_service(resume_instance):
+def request_resume_parse(file_path, resume_text, on_retry=None):
     """
-    Parse a resume using OpenRouter API via AI service
+    Send extracted resume text to the parse model
+    
+    Models in OPENROUTER_PARSE_MODELS are tried in order, skipping any whose
+    circuit breaker is open, and the next one takes over when a call fails.
     
     Args:
-        resume_instance: Resume model instance
+        file_path: Path to the resume file
+        resume_text: Text already extracted from the file
+        on_retry: Optional retry hook (see batch_retry_hook)
         
     Returns:
-        ParsedResume instance
+        Tuple of (parsed resume data as dictionary, model that produced it)
     """
-    # Get file path
-    file_path = resume_instance.file.path
-    
-    # Use AI service if available, otherwise fallback to old method
-    if HAS_AI_SERVICE:
-        try:
-            # Use the AI service to process the file
-            parsed_data = process_file_with_prompt(
-                file_path=str(file_path),
-                prompt_name='parse_resume',
-                model=settings.OPENROUTER_PARSE_MODEL,
-                temperature=0.7,
-                max_tokens=4000,
-                response_format={"type": "json_object"},
-                extract_text=True  # Extract text for better parsing
-            )
-            # Extract text for raw_text field
-            resume_text = extract_text_from_file(file_path)
-        except Exception as e:
-            # Fallback to old method if AI service fails
-            client = OpenRouterClient()
-            resume_text = extract_text_from_file(file_path)
-            prompt_template = load_prompt_template('parse_resume')
-            parsed_data = client.parse_resume(resume_text, prompt_template)
-    else:
-        # Fallback to old method
-        client = OpenRouterClient()
-        resume_text = extract_text_from_file(file_path)
-        prompt_template = load_prompt_template('parse_resume')
-        parsed_data = client.parse_resume(resume_text, prompt_template)
-    
-    # Create or update ParsedResume
-    parsed_resume, created = ParsedResume.objects.get_or_create(
-        resume=resume_instance,
-        defaults={
-            'raw_text': resume_text,
-            'parsed_data': parsed_data
-        }
+    return call_with_failover(
+        settings.OPENROUTER_PARSE_MODELS,
+        lambda model: _parse_with_model(file_path, resume_text, model, on_retry=on_retry)
     )
+
+
+def lookup_cached_parse(file_path, content_hash=None):
+    """
+    Look up a cached parse for a resume file
     
-    if not created:
-        parsed_resume.raw_text = resume_text
-        parsed_resume.parsed_data = parsed_data
-        parsed_resume.save()
-    
-    # Extract personal info
-    personal_info = parsed_data.get('personal_info', {})
-    links = personal_info.get('links', {})
-    
-    # Update ParsedResume with personal information
-    parsed_resume.full_name = personal_info.get('full_name', '')
-    parsed_resume.phone = personal_info.get('phone', '')
-    parsed_resume.email = personal_info.get('email', '')
-    parsed_resume.address = personal_info.get('address', '')
-    parsed_resume.date_of_birth = personal_info.get('date_of_birth', '')
-    parsed_resume.marital_status = personal_info.get('marital_status', '')
-    parsed_resume.military_service = personal_info.get('military_service', '')
-    parsed_resume.linkedin_url = links.get('linkedin', '')
-    parsed_resume.github_url = links.get('github', '')
-    parsed_resume.portfolio_url = links.get('portfolio', '')
-    parsed_resume.website_url = links.get('website', '')
-    parsed_resume.other_links = links.get('other', [])
-    parsed_resume.interests = parsed_data.get('interests', {})
-    parsed_resume.other_sections = parsed_data.get('other_sections', {})
-    parsed_resume.extraction_notes = parsed_data.get('extraction_notes', {})
-    parsed_resume.save()
-    
-    # Update candidate information from parsed data
-    candidate = resume_instance.candidate
-    if parsed_resume.full_name and not candidate.name:
-        candidate.name = parsed_resume.full_name
-    if parsed_resume.email and not candidate.email:
-        candidate.email = parsed_resume.email
-    if parsed_resume.phone and not candidate.phone:
-        candidate.phone = parsed_resume.phone
-    if parsed_resume.linkedin_url and not candidate.linkedin_url:
-        candidate.linkedin_url = parsed_resume.linkedin_url
-    if parsed_resume.github_url and not candidate.github_url:
-        candidate.github_url = parsed_resume.github_url
-    candidate.save()
-    
-    # Delete existing related records
-    Education.objects.filter(parsed_resume=parsed_resume).delete()
-    Experience.objects.filter(parsed_resume=parsed_resume).delete()
-    TechnicalSkill.objects.filter(parsed_resume=parsed_resume).delete()
-    SoftSkill.objects.filter(parsed_resume=parsed_resume).delete()
-    SkillMentionedInJobTitle.objects.filter(parsed_resume=parsed_resume).delete()
-    Project.objects.filter(parsed_resume=parsed_resume).delete()
-    Award.objects.filter(parsed_resume=parsed_resume).delete()
-    Language.objects.filter(parsed_resume=parsed_resume).delete()
-    Course.objects.filter(parsed_resume=parsed_resume).delete()
-    Publication.objects.filter(parsed_resume=parsed_resume).delete()
-    
-    # Create Education records
-    for idx, edu_data in enumerate(parsed_data.get('education', [])):
-        Education.objects.create(
-            parsed_resume=parsed_resume,
-            degree=edu_data.get('degree', ''),
-            field=edu_data.get('field', ''),
-            institution=edu_data.get('institution', ''),
-            location=edu_data.get('location', ''),
-            start_date=edu_data.get('start_date', ''),
-            end_date=edu_data.get('end_date', ''),
-            gpa=edu_data.get('gpa', ''),
-            honors=edu_data.get('honors', ''),
-            thesis=edu_data.get('thesis', ''),
-            relevant_courses=edu_data.get('relevant_courses', []),
-            order=idx
-        )
+    Identical file + prompt + model means an identical parse, so the LLM call
+    can be skipped. A result from any model in the failover list is good enough.
     
-    # Create Experience records
-    for idx, exp_data in enumerate(parsed_data.get('experience', [])):
-        Experience.objects.create(
-            parsed_resume=parsed_resume,
-            job_title=exp_data.get('job_title', ''),
-            company=exp_data.get('company', ''),
-            company_type=exp_data.get('company_type', ''),
-            location=exp_data.get('location', ''),
-            employment_type=exp_data.get('employment_type', ''),
-            start_date=exp_data.get('start_date', ''),
-            end_date=exp_data.get('end_date', ''),
-            duration=exp_data.get('duration', ''),
-            is_currently_employed=exp_data.get('is_currently_employed', False),
-            reasoning=exp_data.get('reasoning', ''),
-            responsibilities=exp_data.get('responsibilities', []),
-            order=idx
-        )
+    Args:
+        file_path: Path to the resume file
+        content_hash: sha256 of the file if already known (ExtractionResult.content_hash)
     
-    # Create Technical Skills
-    skills_data = parsed_data.get('skills', {})
-    technical_skills = skills_data.get('technical', [])
-    for category_data in technical_skills:
-        category = category_data.get('category', '')
-        for item in category_data.get('items', []):
-            TechnicalSkill.objects.create(
-                parsed_resume=parsed_resume,
-                category=category,
-                name=item.get('name', ''),
-                level=item.get('level', '')
-            )
+    Returns:
+        Tuple of (parsed data or None, cache key) where the cache key is
+        (content_hash, prompt_hash) for store_parse, or None if caching is off
+    """
+    if not settings.PARSE_CACHE_ENABLED:
+        return None, None
     
-    # Create Soft Skills
-    for skill_name in skills_data.get('soft', []):
-        SoftSkill.objects.create(
-            parsed_resume=parsed_resume,
-            name=skill_name
-        )
+    cache_key = (content_hash or content_sha256(file_path), prompt_hash('parse_resume'))
+    return get_cached_parse(*cache_key, settings.OPENROUTER_PARSE_MODELS), cache_key
+
+
+def parse_resume_service(resume_instance, extraction, on_retry=None):
+    """
+    Parse a resume using OpenRouter API via AI service
     
-    # Create Skills Mentioned in Job Title
-    for skill_name in skills_data.get('skills_mentioned_in_job_title', []):
-        SkillMentionedInJobTitle.objects.create(
-            parsed_resume=parsed_resume,
-            name=skill_name
-        )
+    Args:
+        resume_instance: Resume model instance
+        extraction: ExtractionResult for the resume file (see run_parse_pipeline)
+        on_retry: Optional retry hook for the LLM call (see batch_retry_hook)
+        
+    Returns:
+        ParsedResume instance
+    """
+    # Get file path
+    file_path = resume_instance.file.path
     
-    # Create Projects
-    for idx, project_data in enumerate(parsed_data.get('projects', [])):
-        Project.objects.create(
-            parsed_resume=parsed_resume,
-            name=project_data.get('name', ''),
-            role=project_data.get('role', ''),
-            date=project_data.get('date', ''),
-            technologies=project_data.get('technologies', []),
-            description=project_data.get('description', ''),
-            link=project_data.get('link', ''),
-            order=idx
-        )
+    # Fitted once; the request sends it and its notes are saved with the parse
+    text_budget = fit_text_budget(extraction.text)
     
-    # Create Awards
-    for idx, award_data in enumerate(parsed_data.get('awards', [])):
-        Award.objects.create(
-            parsed_resume=parsed_resume,
-            title=award_data.get('title', ''),
-            issuer=award_data.get('issuer', ''),
-            rank=award_data.get('rank', ''),
-            date=award_data.get('date', ''),
-            description=award_data.get('description', ''),
-            order=idx
+    parsed_data, cache_key = lookup_cached_parse(file_path, extraction.content_hash)
+    if parsed_data is None:
+        # Concurrent parses of the same file share one request
+        parsed_data = parse_once(
+            cache_key,
+            lambda: request_resume_parse(file_path, text_budget.text, on_retry=on_retry)
         )
     
-    # Create Languages
-    for lang_data in parsed_data.get('languages', []):
-        Language.objects.create(
-            parsed_resume=parsed_resume,
-            language=lang_data.get('language', ''),
-            proficiency=lang_data.get('proficiency', ''),
-            skills=lang_data.get('skills', {}),
-            certificates=lang_data.get('certificates', [])
-        )
+    return save_parsed_resume(resume_instance, extraction, parsed_data, text_budget)
+
+
+def save_parsed_resume(resume_instance, extraction, parsed_data, text_budget=None):
+    """
+    Store parse results on the resume's ParsedResume, candidate and section rows
     
-    # Create Courses
-    for idx, course_data in enumerate(parsed_data.get('courses', [])):
-        Course.objects.create(
-            parsed_resume=parsed_resume,
-            name=course_data.get('name', ''),
-            provider=course_data.get('provider', ''),
-            instructor=course_data.get('instructor', ''),
-            completion_date=course_data.get('completion_date', ''),
-            duration=course_data.get('duration', ''),
-            certificate_id=course_data.get('certificate_id', ''),
-            verification_link=course_data.get('verification_link', ''),
-            order=idx
+    Args:
+        resume_instance: Resume model instance
+        extraction: ExtractionResult the parse was made from
+        parsed_data: Parsed resume data from the LLM (or the parse cache)
+        text_budget: TextBudget the parse request was sent with; fitted here
+                     from the extraction if omitted (e.g. for cached parses)
+        
+    Returns:
+        ParsedResume instance
+    """
+    attempts = SQLITE_LOCK_ATTEMPTS if connection.vendor == 'sqlite' else 1
+    for attempt in range(1, attempts + 1):
+        try:
+            return _write_parsed_resume(resume_instance, extraction, parsed_data, text_budget)
+        except OperationalError as e:
+            # SQLite does not wait for a lock a transaction that has already read
+            # needs to write (e.g. when singleflight hands one result to several
+            # threads at once); the transaction was rolled back, so run it again
+            if attempt == attempts or 'database is locked' not in str(e):
+                raise
+            time.sleep(0.05 * attempt)
+
+
+def _write_parsed_resume(resume_instance, extraction, parsed_data, text_budget=None):
+    resume_text = extraction.text
+    if text_budget is None:
+        text_budget = fit_text_budget(resume_text)
+    
+    # Persist everything in one transaction: one commit, short write lock
+    with transaction.atomic(), count_queries() as queries:
+        # Create or update ParsedResume
+        parsed_resume, created = ParsedResume.objects.get_or_create(
+            resume=resume_instance,
+            defaults={
+                'raw_text': resume_text,
+                'parsed_data': parsed_data
+            }
         )
-    
-    # Create Publications
-    for idx, pub_data in enumerate(parsed_data.get('publications', [])):
-        Publication.objects.create(
-            parsed_resume=parsed_resume,
-            title=pub_data.get('title', ''),
-            authors=pub_data.get('authors', []),
-            venue=pub_data.get('venue', ''),
-            year=pub_data.get('year', ''),
-            volume_pages=pub_data.get('volume_pages', ''),
-            doi=pub_data.get('doi', ''),
-            link=pub_data.get('link', ''),
-            citations=pub_data.get('citations', ''),
-            order=idx
+        
+        if not created:
+            parsed_resume.raw_text = resume_text
+            parsed_resume.parsed_data = parsed_data
+            parsed_resume.save()
+        
+        # Extract personal info
+        personal_info = parsed_data.get('personal_info', {})
+        links = personal_info.get('links', {})
+        
+        # Update ParsedResume with personal information
+        parsed_resume.full_name = personal_info.get('full_name', '')
+        parsed_resume.phone = personal_info.get('phone', '')
+        parsed_resume.email = personal_info.get('email', '')
+        parsed_resume.address = personal_info.get('address', '')
+        parsed_resume.date_of_birth = personal_info.get('date_of_birth', '')
+        parsed_resume.marital_status = personal_info.get('marital_status', '')
+        parsed_resume.military_service = personal_info.get('military_service', '')
+        parsed_resume.linkedin_url = links.get('linkedin', '')
+        parsed_resume.github_url = links.get('github', '')
+        parsed_resume.portfolio_url = links.get('portfolio', '')
+        parsed_resume.website_url = links.get('website', '')
+        parsed_resume.other_links = links.get('other', [])
+        parsed_resume.interests = parsed_data.get('interests', {})
+        parsed_resume.other_sections = parsed_data.get('other_sections', {})
+        extraction_notes = parsed_data.get('extraction_notes') or {}
+        if isinstance(extraction_notes, dict):
+            extraction_notes = {**extraction_notes, 'text_extraction': extraction.metadata()}
+            # Record what of a long document the parse never saw
+            if text_budget.truncated:
+                extraction_notes['text_budget'] = text_budget.notes()
+        parsed_resume.extraction_notes = extraction_notes
+        parsed_resume.save()
+        
+        # Update candidate information from parsed data
+        candidate = resume_instance.candidate
+        if parsed_resume.full_name and not candidate.name:
+            candidate.name = parsed_resume.full_name
+        if parsed_resume.email and not candidate.email:
+            candidate.email = parsed_resume.email
+        if parsed_resume.phone and not candidate.phone:
+            candidate.phone = parsed_resume.phone
+        if parsed_resume.linkedin_url and not candidate.linkedin_url:
+            candidate.linkedin_url = parsed_resume.linkedin_url
+        if parsed_resume.github_url and not candidate.github_url:
+            candidate.github_url = parsed_resume.github_url
+        candidate.save()
+        
+        # Bulk write section rows (education, experience, skills, ...);
+        # on re-parse only the rows that changed are written
+        if created or settings.PARSE_SECTION_WRITE_MODE == 'replace':
+            section_changes = replace_resume_sections(parsed_resume, parsed_data, created=created)
+        else:
+            section_changes = reconcile_resume_sections(parsed_resume, parsed_data)
+        changes = total_changes(section_changes)
+        
+        # Create timeline event
+        TimelineEvent.objects.create(
+            candidate=candidate,
+            event_type='parsed',
+            description='Resume parsed successfully',
+            metadata={'resume_id': resume_instance.id, 'section_changes': changes}
         )
     
-    # Create timeline event
-    TimelineEvent.objects.create(
-        candidate=candidate,
-        event_type='parsed',
-        description='Resume parsed successfully',
-        metadata={'resume_id': resume_instance.id}
+    logger.info(
+        "Saved parsed resume %s: %s in %s queries",
+        parsed_resume.id, changes, queries['count']
     )
     
     return parsed_resume
 
 
+def skill_keys(skills):
+    """
+    Matching keys for skill names (normalized script, case-folded)
+    
+    Args:
+        skills: Skill names, or {'name': ...} dicts as in Job.required_skills
+    """
+    names = (skill.get('name', '') if isinstance(skill, dict) else skill for skill in skills)
+    return {key for key in map(normalize_key, names) if key}
+
+
+def parsed_resume_skill_names(parsed_resume):
+    """Technical, soft and job-title skill names of a parsed resume"""
+    return [
+        name
+        for relation in (parsed_resume.technical_skills, parsed_resume.soft_skills,
+                         parsed_resume.skills_mentioned_in_job_title)
+        for name in relation.values_list('name', flat=True)
+    ]
+
+
 def apply_auto_reject_rules(candidate, job):
     """
     Apply auto-reject rules for a candidate against a job
@@ -350,12 +323,11 @@ def apply_auto_reject_rules(candidate, job):
     
     # Check required skills
     if 'required_skills' in rules:
-        required_skills = set(rules['required_skills'])
+        required_skills = skill_keys(rules['required_skills'])
         candidate_skills = set()
         parsed_resumes = ParsedResume.objects.filter(resume__candidate=candidate)
         for pr in parsed_resumes:
-            skills = pr.skills.values_list('name', flat=True)
-            candidate_skills.update([s.lower() for s in skills])
+            candidate_skills.update(skill_keys(parsed_resume_skill_names(pr)))
         
         missing_skills = required_skills - candidate_skills
         if missing_skills:
@@ -390,11 +362,9 @@ def calculate_initial_score(candidate, job):
     parsed_resume = parsed_resumes.first()
     
     # Score based on required skills match (40 points)
-    required_skills = set(job.required_skills or [])
+    required_skills = skill_keys(job.required_skills or [])
     if required_skills:
-        candidate_skills = set()
-        for skill in parsed_resume.skills.all():
-            candidate_skills.add(skill.name.lower())
+        candidate_skills = skill_keys(parsed_resume_skill_names(parsed_resume))
         
         matched_skills = len(required_skills & candidate_skills)
         skill_score = (matched_skills / len(required_skills)) * 40
@@ -445,7 +415,7 @@ def rank_candidates_service(job, candidates):
             'candidate_id': candidate.id,
             'name': candidate.name,
             'email': candidate.email,
-            'skills': [s.name for s in pr.skills.all()],
+            'skills': parsed_resume_skill_names(pr),
             'experiences': [
                 {
                     'company': exp.company,
@@ -462,16 +432,244 @@ def rank_candidates_service(job, candidates):
     if not candidates_data:
         return []
     
-    # Load prompt template
-    prompt_template = load_prompt_template('rank_candidates')
+    # Load prompt template (cached by the prompt registry)
+    prompt_template = get_prompt('rank_candidates', require=('job_description', 'candidates_data'))
     
     # Rank via OpenRouter
     job_description = f"{job.title}\n\n{job.description}"
-    ranked_results = client.rank_candidates(job_description, candidates_data, prompt_template)
+    with usage_labels(operation='rank', job=job.id):
+        ranked_results = client.rank_candidates(job_description, candidates_data, prompt_template)
     
     return ranked_results
 
 
+def start_file_item(file_item):
+    """Mark a batch file item as processing"""
+    file_item.status = 'processing'
+    file_item.save()
+
+
+def create_file_item_resume(file_item):
+    """
+    Create the candidate and resume for a batch file item
+    
+    A file item retried after its worker died reuses the resume created the
+    first time.
+    
+    Returns:
+        Resume instance
+    """
+    if file_item.candidate_id:
+        resume = Resume.objects.filter(candidate_id=file_item.candidate_id, file=file_item.file.name).first()
+        if resume is not None:
+            return resume
+    
+    # Create or get candidate (based on email if available in filename or parse)
+    # For MVP, create a new candidate for each file
+    candidate, created = Candidate.objects.get_or_create(
+        email=f"candidate_{file_item.id}@example.com",  # Placeholder
+        defaults={'name': f"Candidate {file_item.id}"}
+    )
+    
+    # Create resume
+    resume = Resume.objects.create(
+        candidate=candidate,
+        file=file_item.file
+    )
+    
+    file_item.candidate = candidate
+    file_item.save(update_fields=['candidate', 'updated_at'])
+    return resume
+
+
+def finish_file_item(file_item, parsed_resume=None, error=None):
+    """
+    Record a file item's outcome and count it as processed in its batch
+    
+    Args:
+        file_item: FileItem instance
+        parsed_resume: ParsedResume produced for the file, on success
+        error: Exception that failed the file, if any
+    """
+    if error is None:
+        # Update candidate email if found in parsed data
+        if parsed_resume is not None and parsed_resume.parsed_data.get('email'):
+            file_item.candidate.email = parsed_resume.parsed_data['email']
+            file_item.candidate.save()
+        file_item.status = 'completed'
+    else:
+        file_item.status = 'failed'
+        file_item.error_message = str(error)
+    _count_finished(file_item)
+
+
+def _count_finished(file_item):
+    """Save a finished file item and count it as processed, once even if two workers finish it"""
+    finished = FileItem.objects.filter(id=file_item.id, status__in=['pending', 'processing']).update(
+        status=file_item.status,
+        updated_at=timezone.now()
+    )
+    file_item.save()
+    
+    # Items finish concurrently, so increment in the database
+    if finished:
+        BatchUpload.objects.filter(id=file_item.batch_id).update(
+            processed_files=F('processed_files') + 1
+        )
+
+
+def process_file_item(file_item, extraction=None, extraction_error=None):
+    """
+    Create a candidate and resume for a batch file item and parse it
+    
+    Args:
+        file_item: FileItem instance
+        extraction: Optional ExtractionResult for the file
+        extraction_error: Exception raised while extracting the file, if any
+    """
+    start_file_item(file_item)
+    
+    try:
+        if extraction_error is not None:
+            raise extraction_error
+        
+        resume = create_file_item_resume(file_item)
+        
+        # Parse resume
+        with file_item_usage(file_item):
+            parsed_resume = parse_resume_service(
+                resume,
+                extraction=extraction,
+                on_retry=batch_retry_hook(file_item)
+            )
+    except Exception as e:
+        finish_file_item(file_item, error=e)
+    else:
+        finish_file_item(file_item, parsed_resume)
+
+
+def prepare_file_item(file_item, extraction=None, extraction_error=None):
+    """
+    Create a candidate and resume for a batch file item, finishing it from the parse cache if possible
+    
+    Returns:
+        Tuple of (file_item, resume, extraction, cache_key) if the resume still
+        needs an LLM parse, otherwise None
+    """
+    start_file_item(file_item)
+    
+    try:
+        if extraction_error is not None:
+            raise extraction_error
+        
+        resume = create_file_item_resume(file_item)
+        parsed_data, cache_key = lookup_cached_parse(resume.file.path, extraction.content_hash)
+        if parsed_data is None:
+            return file_item, resume, extraction, cache_key
+        
+        parsed_resume = save_parsed_resume(resume, extraction, parsed_data)
+    except Exception as e:
+        finish_file_item(file_item, error=e)
+    else:
+        finish_file_item(file_item, parsed_resume)
+    return None
+
+
+def process_file_items_batched(file_items):
+    """
+    Parse batch file items with several resumes per LLM request
+    
+    Extraction and cache lookups run in the pipeline as usual; the remaining
+    resumes are packed into shared requests (PARSE_BATCH_MAX_TOKENS,
+    PARSE_BATCH_MAX_SIZE) and any resume a packed request did not return is
+    retried on its own.
+    """
+    pending = [
+        entry for entry in run_parse_pipeline(
+            file_items,
+            get_path=lambda file_item: file_item.file.path,
+            handle_item=prepare_file_item
+        )
+        if entry is not None
+    ]
+    if not pending:
+        return
+    
+    text_budgets = {file_item.id: fit_text_budget(extraction.text) for file_item, _, extraction, _ in pending}
+    
+    # Identical files are sent once; the others reuse the first one's result
+    leaders = {}
+    request_ids = {}
+    for file_item, _, _, cache_key in pending:
+        key = cache_key if cache_key is not None and settings.PARSE_SINGLEFLIGHT else file_item.id
+        request_ids[file_item.id] = leaders.setdefault(key, str(file_item.id))
+    
+    # Shared requests are accounted to the batch rather than to single files
+    with usage_labels(operation='parse_batch', batch=pending[0][0].batch_id):
+        results = parse_resumes_batched(
+            {
+                str(file_item.id): text_budgets[file_item.id].text
+                for file_item, _, _, _ in pending
+                if request_ids[file_item.id] == str(file_item.id)
+            },
+            'parse_resume',
+            settings.OPENROUTER_PARSE_MODELS,
+            max_batch_tokens=settings.PARSE_BATCH_MAX_TOKENS,
+            max_batch_size=settings.PARSE_BATCH_MAX_SIZE,
+            max_workers=llm_worker_count(),
+            # Retries of shared requests count against the same batch budget
+            on_retry=batch_retry_hook(pending[0][0]),
+            temperature=0.7
+        )
+    
+    batched = 0
+    for file_item, resume, extraction, cache_key in pending:
+        request_id = request_ids[file_item.id]
+        result = results[request_id]
+        try:
+            if result.error is not None:
+                raise result.error
+            if cache_key is not None and request_id == str(file_item.id):
+                store_parse(*cache_key, result.model, result.data)
+            parsed_resume = save_parsed_resume(resume, extraction, result.data, text_budgets[file_item.id])
+        except Exception as e:
+            logger.warning("Parsing file %s failed: %s", file_item.id, e)
+            finish_file_item(file_item, error=e)
+        else:
+            finish_file_item(file_item, parsed_resume)
+        batched += result.batched
+    
+    logger.info(
+        "Parsed %s resumes in batched mode (%s from shared requests, %s duplicates)",
+        len(pending), batched, len(pending) - len(results)
+    )
+
+
+def process_uploaded_resume(resume, file_item, extraction=None, extraction_error=None):
+    """
+    Parse a resume uploaded through the CV upload endpoint and track it on its file item
+    
+    Args:
+        resume: Resume instance (candidate already created)
+        file_item: FileItem instance tracking the resume in its batch
+        extraction: Optional ExtractionResult for the file
+        extraction_error: Exception raised while extracting the file, if any
+    """
+    file_item.status = 'processing'
+    file_item.save()
+    
+    try:
+        if extraction_error is not None:
+            raise extraction_error
+        with file_item_usage(file_item):
+            parse_resume_service(resume, extraction=extraction, on_retry=batch_retry_hook(file_item))
+        file_item.status = 'completed'
+    except Exception as e:
+        file_item.status = 'failed'
+        file_item.error_message = str(e)
+    _count_finished(file_item)
+
+
 def process_batch_service(batch_id):
     """
     Process a batch of uploaded files (synchronous)
@@ -483,52 +681,23 @@ def process_batch_service(batch_id):
     batch.status = 'processing'
     batch.save()
     
-    file_items = batch.file_items.all()
-    batch.total_files = file_items.count()
+    file_items = list(batch.file_items.all())
+    batch.total_files = len(file_items)
     batch.save()
     
     try:
-        for file_item in file_items:
-            file_item.status = 'processing'
-            file_item.save()
-            
-            try:
-                # Create or get candidate (based on email if available in filename or parse)
-                # For MVP, create a new candidate for each file
-                candidate, created = Candidate.objects.get_or_create(
-                    email=f"candidate_{file_item.id}@example.com",  # Placeholder
-                    defaults={'name': f"Candidate {file_item.id}"}
-                )
-                
-                # Create resume
-                resume = Resume.objects.create(
-                    candidate=candidate,
-                    file=file_item.file
-                )
-                
-                file_item.candidate = candidate
-                
-                # Parse resume
-                parsed_resume = parse_resume_service(resume)
-                
-                # Update candidate email if found in parsed data
-                if parsed_resume.parsed_data.get('email'):
-                    candidate.email = parsed_resume.parsed_data['email']
-                    candidate.save()
-                
-                file_item.status = 'completed'
-                file_item.save()
-                
-                batch.processed_files += 1
-                batch.save()
-                
-            except Exception as e:
-                file_item.status = 'failed'
-                file_item.error_message = str(e)
-                file_item.save()
-                batch.processed_files += 1
-                batch.save()
+        if settings.PARSE_BATCH_MODE and HAS_AI_SERVICE:
+            # Several resumes per LLM request
+            process_file_items_batched(file_items)
+        else:
+            # Extract in the process pool, parse in LLM worker threads
+            run_parse_pipeline(
+                file_items,
+                get_path=lambda file_item: file_item.file.path,
+                handle_item=process_file_item
+            )
         
+        batch.refresh_from_db()
         batch.status = 'completed'
         batch.save()
         
@@ -536,4 +705,3 @@ def process_batch_service(batch_id):
         batch.status = 'failed'
         batch.save()
         raise
-
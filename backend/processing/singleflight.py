@@ -0,0 +1,300 @@
+"""
+Singleflight for LLM resume parses
+
+Identical files (same content hash and parse prompt) uploaded at the same
+time are parsed once. Within a process, concurrent callers wait for the
+first caller's request and share its result. Across processes, the first
+worker takes a ParseLease row and renews it while its request runs; the
+others poll the parse cache until the result is stored, or take over once
+the lease is released or expires (its holder died).
+
+Results are shared across processes through the parse cache, so only
+cacheable parses are (an {"error": true} answer is re-requested by the
+next worker). Requires PARSE_CACHE_ENABLED.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from .cache import get_cached_parse, store_parse
+from .models import ParseLease
+
+logger = logging.getLogger(__name__)
+
+# Per-process counters
+_stats_lock = threading.Lock()
+_stats = {'leader': 0, 'shared_in_process': 0, 'shared_across_processes': 0}
+
+
+def _record(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def singleflight_stats():
+    """Return how many parses were requested, and how many were shared"""
+    with _stats_lock:
+        return {'enabled': settings.PARSE_SINGLEFLIGHT, **_stats}
+
+
+def _lease_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def acquire_parse_lease(cache_key, owner, lease_seconds=None):
+    """
+    Claim the parse of a (content_hash, prompt_hash) key
+
+    Returns:
+        True if the caller now holds the lease
+    """
+    content_hash, prompt_hash = cache_key
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=lease_seconds or settings.PARSE_LEASE_SECONDS)
+
+    # Take over a lease whose holder died
+    if ParseLease.objects.filter(
+        content_hash=content_hash, prompt_hash=prompt_hash, lease_expires_at__lt=now
+    ).update(locked_by=owner, lease_expires_at=expires_at):
+        return True
+    try:
+        with transaction.atomic():
+            ParseLease.objects.create(
+                content_hash=content_hash,
+                prompt_hash=prompt_hash,
+                locked_by=owner,
+                lease_expires_at=expires_at
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def renew_parse_lease(cache_key, owner, lease_seconds=None):
+    """
+    Extend a held parse lease
+
+    Returns:
+        False if the lease was lost (taken over by another worker)
+    """
+    content_hash, prompt_hash = cache_key
+    expires_at = timezone.now() + timedelta(seconds=lease_seconds or settings.PARSE_LEASE_SECONDS)
+    return bool(ParseLease.objects.filter(
+        content_hash=content_hash, prompt_hash=prompt_hash, locked_by=owner
+    ).update(lease_expires_at=expires_at))
+
+
+class ParseLeaseHeartbeat(threading.Thread):
+    """Renews a parse lease every third of the lease duration until stopped"""
+
+    def __init__(self, cache_key, owner, lease_seconds=None):
+        super().__init__(name=f"parse-lease-heartbeat-{cache_key[0][:12]}", daemon=True)
+        self.cache_key = cache_key
+        self.owner = owner
+        self.lease_seconds = lease_seconds or settings.PARSE_LEASE_SECONDS
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                try:
+                    if not renew_parse_lease(self.cache_key, self.owner, self.lease_seconds):
+                        logger.warning("Parse lease %s lost to another worker", self.cache_key[0][:12])
+                        return
+                except Exception:
+                    logger.exception("Renewing parse lease %s failed", self.cache_key[0][:12])
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+async def _renew_parse_lease_async(cache_key, owner, lease_seconds=None):
+    """Async counterpart of ParseLeaseHeartbeat, run as a task and cancelled when done"""
+    lease_seconds = lease_seconds or settings.PARSE_LEASE_SECONDS
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        try:
+            if not await sync_to_async(renew_parse_lease)(cache_key, owner, lease_seconds):
+                logger.warning("Parse lease %s lost to another worker", cache_key[0][:12])
+                return
+        except Exception:
+            logger.exception("Renewing parse lease %s failed", cache_key[0][:12])
+
+
+def release_parse_lease(cache_key, owner):
+    content_hash, prompt_hash = cache_key
+    ParseLease.objects.filter(content_hash=content_hash, prompt_hash=prompt_hash, locked_by=owner).delete()
+
+
+def _cached_result(cache_key):
+    """Cached parse from any parse model; the caller's lookup was already counted as a miss"""
+    return get_cached_parse(*cache_key, settings.OPENROUTER_PARSE_MODELS, record=False)
+
+
+def _parse_as_leader(cache_key, request):
+    """
+    Run request() under the cross-process lease, or wait for another worker's result
+
+    Returns:
+        Tuple of (parsed data, whether it came from another worker)
+    """
+    owner = _lease_owner()
+    while True:
+        if acquire_parse_lease(cache_key, owner):
+            try:
+                # The holder we waited for may have stored its result just before releasing
+                parsed_data = _cached_result(cache_key)
+                if parsed_data is not None:
+                    return parsed_data, True
+                heartbeat = ParseLeaseHeartbeat(cache_key, owner)
+                heartbeat.start()
+                try:
+                    parsed_data, model = request()
+                finally:
+                    heartbeat.stop()
+                # Stored before the lease is released, so waiting workers find it
+                store_parse(*cache_key, model, parsed_data)
+                return parsed_data, False
+            finally:
+                release_parse_lease(cache_key, owner)
+
+        time.sleep(settings.PARSE_LEASE_POLL_INTERVAL)
+        parsed_data = _cached_result(cache_key)
+        if parsed_data is not None:
+            return parsed_data, True
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def parse_once(cache_key, request):
+    """
+    Parse a file once even if several callers ask for it at the same time
+
+    Args:
+        cache_key: (content_hash, prompt_hash) from lookup_cached_parse, or
+                   None to call request() directly
+        request: Callable returning (parsed data, model); its result is
+                 stored in the parse cache
+
+    Returns:
+        Parsed resume data
+    """
+    if cache_key is None or not settings.PARSE_SINGLEFLIGHT:
+        parsed_data, model = request()
+        if cache_key is not None:
+            store_parse(*cache_key, model, parsed_data)
+        return parsed_data
+
+    with _flights_lock:
+        flight = _flights.get(cache_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[cache_key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        _record('shared_in_process')
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result, shared = _parse_as_leader(cache_key, request)
+        _record('shared_across_processes' if shared else 'leader')
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[cache_key]
+        flight.done.set()
+
+
+_async_flights = {}
+
+# Set as a flight's result when its leader is cancelled, so waiters parse themselves
+_HANDED_OFF = object()
+
+
+async def parse_once_async(cache_key, request):
+    """
+    Async version of parse_once()
+
+    request is a coroutine function returning (parsed data, model). Callers
+    on the same event loop share one in-flight request; other processes are
+    coordinated through the same lease. If the leading caller is cancelled,
+    a waiting caller takes over the parse.
+    """
+    if cache_key is None or not settings.PARSE_SINGLEFLIGHT:
+        parsed_data, model = await request()
+        if cache_key is not None:
+            await sync_to_async(store_parse)(*cache_key, model, parsed_data)
+        return parsed_data
+
+    while True:
+        flight = _async_flights.get(cache_key)
+        if flight is None:
+            break
+        parsed_data = await asyncio.shield(flight)
+        if parsed_data is not _HANDED_OFF:
+            _record('shared_in_process')
+            return parsed_data
+
+    flight = _async_flights[cache_key] = asyncio.get_running_loop().create_future()
+    owner = _lease_owner()
+    try:
+        while True:
+            if await sync_to_async(acquire_parse_lease)(cache_key, owner):
+                try:
+                    parsed_data = await sync_to_async(_cached_result)(cache_key)
+                    shared = parsed_data is not None
+                    if not shared:
+                        heartbeat = asyncio.create_task(_renew_parse_lease_async(cache_key, owner))
+                        try:
+                            parsed_data, model = await request()
+                        finally:
+                            heartbeat.cancel()
+                        await sync_to_async(store_parse)(*cache_key, model, parsed_data)
+                finally:
+                    await sync_to_async(release_parse_lease)(cache_key, owner)
+                break
+
+            await asyncio.sleep(settings.PARSE_LEASE_POLL_INTERVAL)
+            parsed_data = await sync_to_async(_cached_result)(cache_key)
+            if parsed_data is not None:
+                shared = True
+                break
+    except asyncio.CancelledError:
+        flight.set_result(_HANDED_OFF)
+        raise
+    except Exception as e:
+        flight.set_exception(e)
+        # Mark the exception retrieved in case nobody else was waiting
+        flight.exception()
+        raise
+    else:
+        flight.set_result(parsed_data)
+        _record('shared_across_processes' if shared else 'leader')
+        return parsed_data
+    finally:
+        del _async_flights[cache_key]
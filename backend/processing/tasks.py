@@ -0,0 +1,346 @@
+"""
+Durable DB-backed task queue for background processing
+
+Uploads enqueue Task rows; `manage.py run_workers` processes claim them with
+a time-limited lease, renewed by a heartbeat while the handler runs. A task
+whose worker dies is reclaimed once its lease expires, so restarts no longer
+lose work. On databases that support it
+(PostgreSQL, MySQL 8) claims use SELECT ... FOR UPDATE SKIP LOCKED; on SQLite
+a conditional UPDATE acts as a compare-and-swap on the lease.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from candidates.models import Resume
+from .models import BatchUpload, FileItem, Task
+from .pipeline import extract_in_pool
+from .services import process_file_item, process_uploaded_resume
+
+logger = logging.getLogger(__name__)
+
+TASK_HANDLERS = {}
+
+
+class TaskDeferred(Exception):
+    """Raised by a handler whose work is still in progress elsewhere; retried later without using an attempt"""
+    
+    def __init__(self, message, delay):
+        super().__init__(message)
+        self.delay = delay
+
+
+def task_handler(kind):
+    """Register a function as the handler for a task kind"""
+    def decorator(func):
+        TASK_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def default_worker_id():
+    """Identify a worker thread across hosts and processes"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def enqueue_task(kind, payload=None, priority=0, max_attempts=3):
+    """Create a pending task"""
+    if kind not in TASK_HANDLERS:
+        raise ValueError(f"Unknown task kind: {kind}")
+    return Task.objects.create(
+        kind=kind,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=max_attempts
+    )
+
+
+def enqueue_batch(batch, file_items, priority=0):
+    """Enqueue a parse task for each file item and mark the batch as processing"""
+    tasks = Task.objects.bulk_create([
+        Task(
+            kind='parse_file_item',
+            payload={'file_item_id': file_item.id, 'batch_id': batch.id},
+            priority=priority
+        )
+        for file_item in file_items
+    ])
+    if tasks:
+        batch.status = 'processing'
+        batch.save()
+    return tasks
+
+
+def enqueue_resumes(batch, resumes, file_items, priority=10):
+    """
+    Enqueue parse tasks for resumes uploaded directly (CV upload endpoint)
+
+    Interactive uploads get a higher priority than bulk batch imports.
+    """
+    tasks = Task.objects.bulk_create([
+        Task(
+            kind='parse_resume',
+            payload={'resume_id': resume.id, 'file_item_id': file_item.id, 'batch_id': batch.id},
+            priority=priority
+        )
+        for resume, file_item in zip(resumes, file_items)
+    ])
+    if tasks:
+        batch.status = 'processing'
+        batch.save()
+    return tasks
+
+
+def _claimable(now):
+    """Pending tasks that are due, or running tasks whose lease has expired"""
+    return Task.objects.filter(
+        Q(status='pending', run_after__lte=now) |
+        Q(status='processing', lease_expires_at__lt=now)
+    )
+
+
+def claim_task(worker_id, lease_seconds=None):
+    """
+    Claim the next due task for this worker
+
+    Returns:
+        The claimed Task (status processing, attempts incremented), or None
+    """
+    lease_seconds = lease_seconds or settings.TASK_LEASE_SECONDS
+    now = timezone.now()
+    lease = {
+        'status': 'processing',
+        'locked_by': worker_id,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds),
+        'attempts': F('attempts') + 1,
+        'updated_at': now,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            task = _claimable(now).select_for_update(skip_locked=True).order_by('-priority', 'created_at').first()
+            if task is None:
+                return None
+            Task.objects.filter(id=task.id).update(**lease)
+    else:
+        # Compare-and-swap: the UPDATE only matches if nobody claimed it first
+        task = None
+        for task_id in _claimable(now).order_by('-priority', 'created_at').values_list('id', flat=True)[:10]:
+            if _claimable(now).filter(id=task_id).update(**lease):
+                task = Task(id=task_id)
+                break
+        if task is None:
+            return None
+
+    task.refresh_from_db()
+    return task
+
+
+def renew_lease(task, lease_seconds=None):
+    """
+    Extend a running task's lease
+    
+    Returns:
+        False if the lease was lost (reclaimed by another worker)
+    """
+    lease_seconds = lease_seconds or settings.TASK_LEASE_SECONDS
+    now = timezone.now()
+    renewed = Task.objects.filter(id=task.id, locked_by=task.locked_by, status='processing').update(
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+        updated_at=now
+    )
+    # Handlers check the file item's updated_at to tell whether a worker is still on it
+    file_item_id = task.payload.get('file_item_id')
+    if renewed and file_item_id:
+        FileItem.objects.filter(id=file_item_id, status='processing').update(updated_at=now)
+    return bool(renewed)
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews a task's lease every third of the lease duration until stopped"""
+    
+    def __init__(self, task, lease_seconds=None):
+        super().__init__(name=f"lease-heartbeat-{task.id}", daemon=True)
+        self.task = task
+        self.lease_seconds = lease_seconds or settings.TASK_LEASE_SECONDS
+        self.stopped = threading.Event()
+    
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                try:
+                    if not renew_lease(self.task, self.lease_seconds):
+                        logger.warning("Task %s lost its lease to another worker", self.task.id)
+                        return
+                except Exception:
+                    logger.exception("Renewing the lease of task %s failed", self.task.id)
+        finally:
+            connection.close()
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def complete_task(task):
+    """Mark a task as done"""
+    completed = Task.objects.filter(id=task.id, locked_by=task.locked_by).update(
+        status='completed',
+        lease_expires_at=None,
+        updated_at=timezone.now()
+    )
+    if not completed:
+        logger.warning("Task %s finished after its lease was reclaimed by another worker", task.id)
+
+
+def fail_task(task, error):
+    """Record a failure and reschedule with backoff, or give up after max_attempts"""
+    now = timezone.now()
+    if task.attempts < task.max_attempts:
+        updates = {
+            'status': 'pending',
+            'run_after': now + timedelta(seconds=min(2 ** task.attempts * 5, 300)),
+        }
+    else:
+        updates = {'status': 'failed'}
+    Task.objects.filter(id=task.id, locked_by=task.locked_by).update(
+        last_error=str(error),
+        lease_expires_at=None,
+        updated_at=now,
+        **updates
+    )
+
+
+def defer_task(task, error):
+    """Put a task back in the queue without counting the attempt"""
+    now = timezone.now()
+    Task.objects.filter(id=task.id, locked_by=task.locked_by).update(
+        status='pending',
+        run_after=now + timedelta(seconds=error.delay),
+        attempts=F('attempts') - 1,
+        last_error=str(error),
+        lease_expires_at=None,
+        updated_at=now
+    )
+
+
+def run_task(task, lease_seconds=None):
+    """Run a claimed task's handler, renewing its lease meanwhile, and record the outcome"""
+    handler = TASK_HANDLERS.get(task.kind)
+    heartbeat = LeaseHeartbeat(task, lease_seconds)
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for task kind: {task.kind}")
+        handler(**task.payload)
+    except TaskDeferred as e:
+        logger.info("Task %s (%s) deferred: %s", task.id, task.kind, e)
+        defer_task(task, e)
+        return False
+    except Exception as e:
+        logger.exception("Task %s (%s) failed", task.id, task.kind)
+        fail_task(task, e)
+        return False
+    finally:
+        heartbeat.stop()
+    complete_task(task)
+    return True
+
+
+def run_worker(stop_event, worker_id=None, lease_seconds=None, poll_interval=None, once=False):
+    """
+    Claim and run tasks until stop_event is set
+
+    Args:
+        stop_event: threading.Event that ends the loop after the current task
+        worker_id: Lease owner name (default: host:pid:thread)
+        lease_seconds: Lease duration (default: TASK_LEASE_SECONDS)
+        poll_interval: Sleep between polls when idle (default: TASK_POLL_INTERVAL)
+        once: Return as soon as no task is available
+    """
+    worker_id = worker_id or default_worker_id()
+    poll_interval = poll_interval or settings.TASK_POLL_INTERVAL
+
+    try:
+        while not stop_event.is_set():
+            task = claim_task(worker_id, lease_seconds)
+            if task is None:
+                if once:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            run_task(task, lease_seconds)
+    finally:
+        connection.close()
+
+
+def task_queue_stats():
+    """Return task counts by status"""
+    counts = dict(Task.objects.values_list('status').annotate(count=Count('id')))
+    return {status: counts.get(status, 0) for status, _ in Task.STATUS_CHOICES}
+
+
+def finalize_batch_if_done(batch_id):
+    """Mark the batch completed once none of its files are still outstanding"""
+    outstanding = FileItem.objects.filter(
+        batch_id=batch_id,
+        status__in=['pending', 'processing']
+    ).exists()
+    if not outstanding:
+        BatchUpload.objects.filter(id=batch_id).exclude(status='completed').update(
+            status='completed',
+            updated_at=timezone.now()
+        )
+
+
+def _check_not_in_progress(file_item):
+    """
+    Defer a file item another worker is still processing
+    
+    A live worker's lease heartbeat keeps its file item's updated_at within the
+    lease duration; an older 'processing' item was left by a worker that died.
+    """
+    lease_seconds = settings.TASK_LEASE_SECONDS
+    if file_item.status == 'processing' and file_item.updated_at > timezone.now() - timedelta(seconds=lease_seconds):
+        raise TaskDeferred(f"File {file_item.id} is being processed by another worker", delay=lease_seconds)
+
+
+def _extract_for_task(file_path):
+    """Extract in this worker thread's process pool, returning (extraction, error)"""
+    try:
+        return extract_in_pool(file_path), None
+    except Exception as e:
+        return None, e
+
+
+@task_handler('parse_file_item')
+def parse_file_item_task(file_item_id, batch_id=None):
+    """Extract and parse a single batch file"""
+    file_item = FileItem.objects.select_related('batch').get(id=file_item_id)
+
+    # A reclaimed task may find its file already handled, or still in progress
+    if file_item.status not in ('completed', 'failed'):
+        _check_not_in_progress(file_item)
+        extraction, extraction_error = _extract_for_task(file_item.file.path)
+        process_file_item(file_item, extraction=extraction, extraction_error=extraction_error)
+
+    finalize_batch_if_done(file_item.batch_id)
+
+
+@task_handler('parse_resume')
+def parse_resume_task(resume_id, file_item_id, batch_id=None):
+    """Extract and parse a resume uploaded through the CV upload endpoint"""
+    file_item = FileItem.objects.get(id=file_item_id)
+
+    if file_item.status not in ('completed', 'failed'):
+        _check_not_in_progress(file_item)
+        resume = Resume.objects.select_related('candidate').get(id=resume_id)
+        extraction, extraction_error = _extract_for_task(resume.file.path)
+        process_uploaded_resume(resume, file_item, extraction=extraction, extraction_error=extraction_error)
+
+    finalize_batch_if_done(file_item.batch_id)
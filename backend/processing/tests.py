@@ -1,3 +1,828 @@
-from django.test import TestCase
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+import httpx
+
+from ai.extraction import ExtractionResult
+from ai.ratelimit import take_tokens
+from ai.transport import TransportResponse
+from ai.usage import _sinks as usage_sinks, add_usage_sink
+from candidates.models import (
+    Award, Candidate, Course, Education, Experience, Language, ParsedResume, Project, Publication, Resume,
+    SkillMentionedInJobTitle, SoftSkill, TechnicalSkill,
+)
+from core.models import User
+from jobs.models import Job
+from .async_pipeline import process_batch_async
+from .cache import invalidate_parse_cache, parse_cache_stats, store_parse
+from .events import batch_event_stream, format_cursor, parse_cursor
+from .models import BatchUpload, FileItem, LLMUsage, ParseCacheEntry, ParseLease, RateLimitBucket, Task
+from .pipeline import ExtractionPool, ExtractionTimeout, extract_in_pool, get_extraction_pool, run_parse_pipeline
+from .ratelimit import DatabaseBackend
+from .sections import count_queries, reconcile_resume_sections, replace_resume_sections
+from .services import (
+    apply_auto_reject_rules, calculate_initial_score, lookup_cached_parse, parse_resume_service, rank_candidates_service,
+)
+from .singleflight import acquire_parse_lease, parse_once, parse_once_async, renew_parse_lease
+from .tasks import (
+    TaskDeferred, _check_not_in_progress, claim_task, complete_task, defer_task,
+    fail_task, renew_lease, run_task,
+)
+
+
+class DatabaseBackendTests(TestCase):
+    """processing.ratelimit.DatabaseBackend"""
+
+    def test_first_take_creates_a_full_bucket(self):
+        self.assertEqual(DatabaseBackend().take('m:rpm', 1, capacity=10, rate=1), 0.0)
+        bucket = RateLimitBucket.objects.get(key='m:rpm')
+        self.assertAlmostEqual(bucket.tokens, 9)
+        self.assertEqual(bucket.version, 0)
+
+    def test_takes_bump_the_version(self):
+        backend = DatabaseBackend()
+        backend.take('m:rpm', 1, capacity=2, rate=0.001)
+        backend.take('m:rpm', 1, capacity=2, rate=0.001)
+        wait = backend.take('m:rpm', 1, capacity=2, rate=0.001)
+        bucket = RateLimitBucket.objects.get(key='m:rpm')
+        self.assertEqual(bucket.version, 2)
+        self.assertLess(bucket.tokens, 0)
+        self.assertGreater(wait, 900)
+
+    def test_concurrent_write_is_retried_and_both_reservations_count(self):
+        backend = DatabaseBackend()
+        backend.take('m:rpm', 1, capacity=10, rate=0.001)
+        calls = []
+
+        def take_with_interleaved_writer(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                # Another worker updates the row between our read and our write
+                bucket = RateLimitBucket.objects.get(key='m:rpm')
+                RateLimitBucket.objects.filter(key='m:rpm').update(tokens=bucket.tokens - 1, version=bucket.version + 1)
+            return take_tokens(*args)
+
+        with mock.patch('processing.ratelimit.take_tokens', side_effect=take_with_interleaved_writer):
+            backend.take('m:rpm', 1, capacity=10, rate=0.001)
+
+        bucket = RateLimitBucket.objects.get(key='m:rpm')
+        # The first attempt lost the compare-and-swap; the second read the other write
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(bucket.version, 2)
+        self.assertAlmostEqual(bucket.tokens, 7, places=1)
+
+    def test_concurrent_create_is_retried_as_an_update(self):
+        calls = []
+
+        def take_with_interleaved_creator(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                # Another worker creates the bucket between our read and our insert
+                RateLimitBucket.objects.create(key='m:rpm', tokens=9, updated_at=args[4])
+            return take_tokens(*args)
+
+        with mock.patch('processing.ratelimit.take_tokens', side_effect=take_with_interleaved_creator):
+            DatabaseBackend().take('m:rpm', 1, capacity=10, rate=0.001)
+
+        bucket = RateLimitBucket.objects.get(key='m:rpm')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(bucket.version, 1)
+        self.assertAlmostEqual(bucket.tokens, 8, places=1)
+
+    def test_gives_up_after_max_retries(self):
+        RateLimitBucket.objects.create(key='m:rpm', tokens=10, updated_at=0)
+
+        def take_while_always_losing(*args):
+            RateLimitBucket.objects.filter(key='m:rpm').update(version=F('version') + 1)
+            return take_tokens(*args)
+
+        with mock.patch('processing.ratelimit.take_tokens', side_effect=take_while_always_losing):
+            with self.assertRaises(RuntimeError):
+                DatabaseBackend(max_retries=3).take('m:rpm', 1, capacity=10, rate=1)
+
+
+class ReconcileResumeSectionsTests(TestCase):
+    """processing.sections.reconcile_resume_sections"""
+
+    PARSED_DATA = {
+        'education': [
+            {'degree': 'BSc', 'field': 'Computer Engineering', 'institution': 'Sharif'},
+            {'degree': 'MSc', 'field': 'AI', 'institution': 'Tehran'},
+        ],
+        'experience': [{'job_title': 'Backend developer', 'company': 'Acme'}],
+        'skills': {
+            'technical': [{'category': 'Languages', 'items': [{'name': 'Python', 'level': 'Expert'},
+                                                              {'name': 'Go', 'level': 'Junior'}]}],
+            'soft': ['Teamwork', 'Teamwork', 'Mentoring'],
+        },
+    }
+
+    def setUp(self):
+        candidate = Candidate.objects.create(email='jane@example.com', name='Jane Doe')
+        resume = Resume.objects.create(candidate=candidate, file='resumes/jane.pdf')
+        self.parsed_resume = ParsedResume.objects.create(resume=resume)
+        replace_resume_sections(self.parsed_resume, self.PARSED_DATA, created=True)
+
+    def ids(self, model):
+        return set(model.objects.filter(parsed_resume=self.parsed_resume).values_list('pk', flat=True))
+
+    def test_unchanged_data_writes_nothing(self):
+        education_ids = self.ids(Education)
+        summary = reconcile_resume_sections(self.parsed_resume, self.PARSED_DATA)
+        self.assertEqual(summary['Education'], {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 2})
+        self.assertEqual(summary['SoftSkill']['unchanged'], 2)
+        self.assertEqual(self.ids(Education), education_ids)
+
+    def test_insert_update_and_delete(self):
+        education_ids = self.ids(Education)
+        data = {
+            'education': [
+                {'degree': 'BSc', 'field': 'Computer Engineering', 'institution': 'Sharif', 'gpa': '18.5'},
+                {'degree': 'MSc', 'field': 'AI', 'institution': 'Tehran'},
+                {'degree': 'PhD', 'field': 'AI', 'institution': 'Tehran'},
+            ],
+            'experience': [],
+            'skills': {
+                'technical': [{'category': 'Languages', 'items': [{'name': 'Python', 'level': 'Expert'},
+                                                                  {'name': 'Go', 'level': 'Senior'},
+                                                                  {'name': 'Rust', 'level': 'Junior'}]}],
+                'soft': ['Mentoring'],
+            },
+        }
+        summary = reconcile_resume_sections(self.parsed_resume, data)
+
+        self.assertEqual(summary['Education'], {'inserted': 1, 'updated': 1, 'deleted': 0, 'unchanged': 1})
+        self.assertEqual(summary['Experience'], {'inserted': 0, 'updated': 0, 'deleted': 1, 'unchanged': 0})
+        self.assertEqual(summary['TechnicalSkill'], {'inserted': 1, 'updated': 1, 'deleted': 0, 'unchanged': 1})
+        self.assertEqual(summary['SoftSkill'], {'inserted': 0, 'updated': 0, 'deleted': 1, 'unchanged': 1})
+
+        # Matched rows keep their IDs
+        self.assertTrue(education_ids < self.ids(Education))
+        education = Education.objects.filter(parsed_resume=self.parsed_resume).order_by('order')
+        self.assertEqual([(row.degree, row.gpa) for row in education], [('BSc', '18.5'), ('MSc', ''), ('PhD', '')])
+        self.assertFalse(Experience.objects.filter(parsed_resume=self.parsed_resume).exists())
+        self.assertEqual(
+            dict(TechnicalSkill.objects.filter(parsed_resume=self.parsed_resume).values_list('name', 'level')),
+            {'Python': 'Expert', 'Go': 'Senior', 'Rust': 'Junior'},
+        )
+        self.assertEqual(list(SoftSkill.objects.filter(parsed_resume=self.parsed_resume).values_list('name', flat=True)),
+                         ['Mentoring'])
+
+    def test_rows_repeating_an_order_are_deleted(self):
+        Education.objects.create(parsed_resume=self.parsed_resume, degree='Duplicate', order=0)
+        summary = reconcile_resume_sections(self.parsed_resume, self.PARSED_DATA)
+        self.assertEqual(summary['Education']['deleted'], 1)
+        self.assertEqual(Education.objects.filter(parsed_resume=self.parsed_resume).count(), 2)
+        self.assertFalse(Education.objects.filter(degree='Duplicate').exists())
+
+
+class ReplaceResumeSectionsTests(TestCase):
+    """processing.sections.replace_resume_sections and its use by parse_resume_service"""
+
+    SECTION_MODELS = [Education, Experience, TechnicalSkill, SoftSkill, SkillMentionedInJobTitle,
+                      Project, Award, Language, Course, Publication]
+
+    def parsed_data(self, count):
+        numbers = range(count)
+        return {
+            'personal_info': {'full_name': 'Jane Doe'},
+            'education': [{'degree': f'Degree {n}'} for n in numbers],
+            'experience': [{'job_title': f'Job {n}', 'responsibilities': ['Code review']} for n in numbers],
+            'skills': {
+                'technical': [{'category': 'Languages', 'items': [{'name': f'Language {n}'} for n in numbers]}],
+                'soft': [f'Soft {n}' for n in numbers],
+                'skills_mentioned_in_job_title': [f'Title skill {n}' for n in numbers],
+            },
+            'projects': [{'name': f'Project {n}'} for n in numbers],
+            'awards': [{'title': f'Award {n}'} for n in numbers],
+            'languages': [{'language': f'Language {n}'} for n in numbers],
+            'courses': [{'name': f'Course {n}'} for n in numbers],
+            'publications': [{'title': f'Paper {n}'} for n in numbers],
+        }
+
+    def setUp(self):
+        candidate = Candidate.objects.create(email='jane@example.com', name='Jane Doe')
+        self.resume = Resume.objects.create(candidate=candidate, file='resumes/jane.pdf')
+        self.parsed_resume = ParsedResume.objects.create(resume=self.resume)
+
+    def row_counts(self):
+        return {model.__name__: model.objects.filter(parsed_resume=self.parsed_resume).count()
+                for model in self.SECTION_MODELS}
+
+    def test_one_insert_per_section_model(self):
+        with count_queries() as queries:
+            replace_resume_sections(self.parsed_resume, self.parsed_data(15), created=True)
+        self.assertEqual(queries['count'], len(self.SECTION_MODELS))
+        self.assertEqual(self.row_counts(), {model.__name__: 15 for model in self.SECTION_MODELS})
+
+    def test_reparse_adds_one_delete_per_section_model(self):
+        replace_resume_sections(self.parsed_resume, self.parsed_data(15), created=True)
+        with count_queries() as queries:
+            replace_resume_sections(self.parsed_resume, self.parsed_data(2))
+        self.assertEqual(queries['count'], 2 * len(self.SECTION_MODELS))
+        self.assertEqual(self.row_counts(), {model.__name__: 2 for model in self.SECTION_MODELS})
+
+    @override_settings(PARSE_SECTION_WRITE_MODE='replace', PARSE_CACHE_ENABLED=False, PARSE_SINGLEFLIGHT=False,
+                       OPENROUTER_PARSE_MODELS=['test/model'])
+    def test_failed_save_leaves_the_previous_parse(self):
+        extraction = ExtractionResult(text="Jane Doe", page_count=1, extractor='test', duration_ms=1.0)
+        with mock.patch('processing.services.process_file_with_prompt', return_value=self.parsed_data(3)):
+            parse_resume_service(self.resume, extraction)
+
+        with mock.patch('processing.services.process_file_with_prompt', return_value=self.parsed_data(5)), \
+                mock.patch.object(Publication.objects, 'bulk_create', side_effect=IntegrityError("constraint failed")):
+            with self.assertRaises(IntegrityError):
+                parse_resume_service(self.resume, extraction)
+
+        self.assertEqual(self.row_counts(), {model.__name__: 3 for model in self.SECTION_MODELS})
+        self.assertEqual(self.resume.candidate.timeline_events.count(), 1)
+
+
+class TaskLeaseTests(TestCase):
+    """processing.tasks claiming, lease expiry and reclaiming"""
+
+    def setUp(self):
+        self.task = Task.objects.create(kind='test', payload={'value': 1})
+
+    def expire_lease(self, task):
+        Task.objects.filter(id=task.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_takes_a_lease(self):
+        task = claim_task('worker-a', lease_seconds=60)
+        self.assertEqual(task.id, self.task.id)
+        self.assertEqual(task.status, 'processing')
+        self.assertEqual(task.locked_by, 'worker-a')
+        self.assertEqual(task.attempts, 1)
+        self.assertGreater(task.lease_expires_at, timezone.now() + timedelta(seconds=50))
+
+    def test_claim_order_and_due_time(self):
+        Task.objects.create(kind='test', run_after=timezone.now() + timedelta(minutes=5), priority=100)
+        urgent = Task.objects.create(kind='test', priority=10)
+        self.assertEqual(claim_task('worker-a').id, urgent.id)
+        self.assertEqual(claim_task('worker-a').id, self.task.id)
+        self.assertIsNone(claim_task('worker-a'))
+
+    def test_leased_task_is_not_claimed_twice(self):
+        claim_task('worker-a', lease_seconds=60)
+        self.assertIsNone(claim_task('worker-b', lease_seconds=60))
+
+    def test_expired_lease_is_reclaimed(self):
+        first = claim_task('worker-a', lease_seconds=60)
+        self.expire_lease(first)
+        second = claim_task('worker-b', lease_seconds=60)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(second.locked_by, 'worker-b')
+        self.assertEqual(second.attempts, 2)
+
+        # The first worker lost the task: it can neither renew nor complete it
+        self.assertFalse(renew_lease(first, 60))
+        with self.assertLogs('processing.tasks', 'WARNING'):
+            complete_task(first)
+        self.assertEqual(Task.objects.get(id=first.id).status, 'processing')
+        complete_task(second)
+        self.assertEqual(Task.objects.get(id=first.id).status, 'completed')
+
+    def test_renewed_lease_is_not_reclaimed(self):
+        task = claim_task('worker-a', lease_seconds=60)
+        self.expire_lease(task)
+        self.assertTrue(renew_lease(task, 60))
+        self.assertIsNone(claim_task('worker-b', lease_seconds=60))
+
+    def test_renewing_touches_the_file_item(self):
+        batch = BatchUpload.objects.create(total_files=1)
+        file_item = FileItem.objects.create(batch=batch, file='batch_uploads/cv.pdf', status='processing')
+        FileItem.objects.filter(id=file_item.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        Task.objects.filter(id=self.task.id).update(payload={'file_item_id': file_item.id})
+        task = claim_task('worker-a', lease_seconds=60)
+
+        self.assertTrue(renew_lease(task, 60))
+        file_item.refresh_from_db()
+        self.assertGreater(file_item.updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_fail_reschedules_with_backoff_then_gives_up(self):
+        Task.objects.filter(id=self.task.id).update(max_attempts=2)
+        task = claim_task('worker-a')
+        fail_task(task, ValueError("boom"))
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'pending')
+        self.assertEqual(task.last_error, "boom")
+        self.assertGreater(task.run_after, timezone.now() + timedelta(seconds=5))
+
+        Task.objects.filter(id=task.id).update(run_after=timezone.now())
+        task = claim_task('worker-a')
+        fail_task(task, ValueError("boom again"))
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'failed')
+        self.assertEqual(task.attempts, 2)
+
+    def test_deferring_does_not_use_an_attempt(self):
+        task = claim_task('worker-a')
+        defer_task(task, TaskDeferred("busy elsewhere", delay=30))
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'pending')
+        self.assertEqual(task.attempts, 0)
+        self.assertIsNone(task.lease_expires_at)
+        self.assertGreater(task.run_after, timezone.now() + timedelta(seconds=25))
+        self.assertIsNone(claim_task('worker-a'))
+
+    def test_run_task_outcomes(self):
+        handler = mock.Mock()
+        with mock.patch.dict('processing.tasks.TASK_HANDLERS', {'test': handler}):
+            self.assertTrue(run_task(claim_task('worker-a'), lease_seconds=60))
+            handler.assert_called_once_with(value=1)
+            self.assertEqual(Task.objects.get(id=self.task.id).status, 'completed')
+
+            failing = Task.objects.create(kind='test')
+            handler.side_effect = ValueError("boom")
+            with self.assertLogs('processing.tasks', 'ERROR'):
+                self.assertFalse(run_task(claim_task('worker-a'), lease_seconds=60))
+            self.assertEqual(Task.objects.get(id=failing.id).status, 'pending')
+
+            deferred = Task.objects.create(kind='test', priority=1)
+            handler.side_effect = TaskDeferred("busy elsewhere", delay=30)
+            self.assertFalse(run_task(claim_task('worker-a'), lease_seconds=60))
+            self.assertEqual(Task.objects.get(id=deferred.id).attempts, 0)
+
+
+class CheckNotInProgressTests(TestCase):
+    """processing.tasks._check_not_in_progress"""
+
+    def setUp(self):
+        batch = BatchUpload.objects.create(total_files=1)
+        self.file_item = FileItem.objects.create(batch=batch, file='batch_uploads/cv.pdf', status='processing')
+
+    def test_live_item_is_deferred(self):
+        with self.assertRaises(TaskDeferred):
+            _check_not_in_progress(self.file_item)
+
+    def test_abandoned_or_idle_items_are_taken_over(self):
+        self.file_item.updated_at = timezone.now() - timedelta(hours=1)
+        _check_not_in_progress(self.file_item)
+        self.file_item.status = 'pending'
+        self.file_item.updated_at = timezone.now()
+        _check_not_in_progress(self.file_item)
+
+
+class LLMUsageViewTests(TestCase):
+    """processing.views.LLMUsageView"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='admin@example.com', password='secret', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        LLMUsage.objects.create(operation='parse', model='m', prompt_tokens=100, completion_tokens=20, user=self.user)
+        LLMUsage.objects.create(operation='rank', model='m', prompt_tokens=50, completion_tokens=10)
+
+    def test_filters(self):
+        response = self.client.get('/api/batch/usage/', {'user': self.user.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['calls'], 1)
+        self.assertEqual(response.data['totals']['prompt_tokens'], 100)
+
+    def test_non_integer_ids_are_rejected(self):
+        for param in ('batch', 'job', 'user', 'file_item'):
+            response = self.client.get('/api/batch/usage/', {param: 'abc'})
+            self.assertEqual(response.status_code, 400, param)
+            self.assertEqual(response.data['error'], f'{param} must be an integer id')
+
+    def test_invalid_group_by_and_dates_are_rejected(self):
+        self.assertEqual(self.client.get('/api/batch/usage/', {'group_by': 'colour'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/batch/usage/', {'since': 'yesterday'}).status_code, 400)
+
+
+class SkillMatchingTests(TestCase):
+    """Skill matching in processing.services.apply_auto_reject_rules and calculate_initial_score"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='recruiter@example.com', password='secret')
+        self.candidate = Candidate.objects.create(email='ali@example.com', name='Ali')
+        resume = Resume.objects.create(candidate=self.candidate, file='resumes/ali.pdf')
+        parsed_resume = ParsedResume.objects.create(resume=resume)
+        # Arabic yeh/kaf and Persian digits, as extracted from the CV
+        TechnicalSkill.objects.create(parsed_resume=parsed_resume, category='Languages', name='پايتون')
+        SoftSkill.objects.create(parsed_resume=parsed_resume, name='كار تيمي')
+        SkillMentionedInJobTitle.objects.create(parsed_resume=parsed_resume, name='Django ۴')
+        self.job = Job.objects.create(
+            title='Backend developer', description='Python', created_by=user,
+            required_skills=[{'name': 'پایتون', 'priority': 'Critical'}, {'name': 'کار تیمی'}, {'name': 'django 4'}],
+        )
+
+    def test_variant_spellings_satisfy_required_skills(self):
+        self.job.auto_reject_rules = {'required_skills': ['پایتون', 'کار  تیمی', 'DJANGO 4']}
+        self.assertEqual(apply_auto_reject_rules(self.candidate, self.job), (False, ""))
+
+    def test_missing_skills_are_reported(self):
+        self.job.auto_reject_rules = {'required_skills': ['پایتون', 'Go']}
+        is_rejected, reason = apply_auto_reject_rules(self.candidate, self.job)
+        self.assertTrue(is_rejected)
+        self.assertEqual(reason, "Missing required skills: go")
+
+    def test_initial_score_counts_variant_spellings(self):
+        self.assertEqual(calculate_initial_score(self.candidate, self.job), 40.0)
+        self.job.required_skills.append({'name': 'Go'})
+        self.assertEqual(calculate_initial_score(self.candidate, self.job), 30.0)
+
+    def test_ranking_sends_every_skill(self):
+        with mock.patch('processing.services.OpenRouterClient') as client:
+            rank_candidates_service(self.job, [self.candidate])
+        candidates_data = client.return_value.rank_candidates.call_args[0][1]
+        self.assertEqual(candidates_data[0]['skills'], ['پايتون', 'كار تيمي', 'Django ۴'])
+
+
+@override_settings(EXTRACTION_WORKERS=2)
+class ParsePipelineTests(SimpleTestCase):
+    """processing.pipeline.run_parse_pipeline and the shared extraction pool"""
+
+    def setUp(self):
+        patcher = mock.patch('processing.pipeline._pool', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_extract(self, file_path, timeout=None):
+        if file_path == 'hung.pdf':
+            raise ExtractionTimeout("Text extraction timed out after 60s")
+        return mock.Mock(text=f"text of {file_path}")
+
+    def test_every_item_reaches_the_llm_stage(self):
+        with mock.patch.object(ExtractionPool, 'extract', side_effect=self.fake_extract):
+            results = run_parse_pipeline(
+                ['a.pdf', 'hung.pdf', 'b.pdf'],
+                get_path=lambda path: path,
+                handle_item=lambda path, extraction, error: (path, extraction.text if extraction else type(error).__name__),
+                llm_workers=2,
+            )
+        self.assertEqual(sorted(results), [('a.pdf', 'text of a.pdf'), ('b.pdf', 'text of b.pdf'),
+                                           ('hung.pdf', 'ExtractionTimeout')])
+
+    def test_batches_and_task_workers_share_one_pool(self):
+        pools = []
+        with mock.patch.object(ExtractionPool, 'extract', autospec=True,
+                               side_effect=lambda pool, path, timeout=None: pools.append(pool)):
+            run_parse_pipeline(['a.pdf'], get_path=lambda path: path, handle_item=lambda *args: None, llm_workers=1)
+            worker = threading.Thread(target=extract_in_pool, args=('b.pdf',))
+            worker.start()
+            worker.join()
+        self.assertEqual(len(pools), 2)
+        self.assertIs(pools[0], pools[1])
+        self.assertIs(pools[0], get_extraction_pool())
+        self.assertEqual(pools[0].max_workers, 2)
+
+
+@override_settings(PARSE_CACHE_ENABLED=False, PARSE_SINGLEFLIGHT=False, OPENROUTER_PARSE_MODELS=['test/model'])
+class ParseResumeServiceTests(TestCase):
+    """processing.services.parse_resume_service"""
+
+    def test_pipeline_extraction_is_the_only_one(self):
+        candidate = Candidate.objects.create(email='jane@example.com')
+        resume = Resume.objects.create(candidate=candidate, file='resumes/jane.pdf')
+        extraction = ExtractionResult(text="Jane Doe\nPython developer", page_count=2, extractor='pymupdf',
+                                      duration_ms=12.5)
+        parsed = {'personal_info': {'full_name': 'Jane Doe'}}
+
+        with mock.patch('ai.service._extract_text_from_file', side_effect=AssertionError("extracted again")), \
+                mock.patch('processing.services.process_file_with_prompt', return_value=parsed) as request:
+            parsed_resume = parse_resume_service(resume, extraction)
+
+        self.assertEqual(request.call_args.kwargs['resume_text'], extraction.text)
+        self.assertEqual(parsed_resume.raw_text, extraction.text)
+        notes = parsed_resume.extraction_notes['text_extraction']
+        self.assertEqual((notes['extractor'], notes['page_count'], notes['duration_ms']), ('pymupdf', 2, 12.5))
+        self.assertNotIn('text', notes)
+
+
+class AsyncPipelineTests(TransactionTestCase):
+    """processing.async_pipeline.process_batch_async"""
+
+    PARSED = {'personal_info': {'full_name': 'Jane Doe'}, 'skills': {'soft': ['Teamwork']}}
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, PARSE_CACHE_ENABLED=False, OPENROUTER_PARSE_MODELS=['test/model'],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (
+            mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': 'test-key', 'OPENROUTER_STREAM': 'false'}),
+            mock.patch('processing.async_pipeline.get_extraction_pool', return_value=mock.Mock(extract=self.extract)),
+            mock.patch('ai.async_service.AsyncTransport.post', self.post),
+            mock.patch('ai.usage._sinks', list(usage_sinks)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(email='recruiter@example.com', password='secret')
+        self.batch = BatchUpload.objects.create(user=user, total_files=2)
+        self.file_items = [
+            FileItem.objects.create(batch=self.batch, file=f'batch_uploads/cv{n}.pdf') for n in range(2)
+        ]
+
+    def extract(self, file_path, timeout=None):
+        return ExtractionResult(text=f"Jane Doe resume {file_path}", page_count=1, extractor='test', duration_ms=1.0)
+
+    async def post(self, url, headers=None, **kwargs):
+        body = {
+            'choices': [{'message': {'content': json.dumps(self.PARSED)}}],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120},
+        }
+        return TransportResponse(200, 'OK', {}, httpx.Response(200, json=body))
+
+    def test_batch_is_parsed_and_usage_is_recorded_on_the_sync_thread(self):
+        sink_threads = []
+        add_usage_sink(lambda model, usage, labels: sink_threads.append(threading.current_thread().name))
+
+        process_batch_async(self.batch.id, concurrency=2)
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'completed')
+        self.assertEqual(self.batch.processed_files, 2)
+        for file_item in self.file_items:
+            file_item.refresh_from_db()
+            self.assertEqual(file_item.status, 'completed')
+            self.assertEqual(file_item.candidate.resumes.get().parsed_data.full_name, 'Jane Doe')
+
+        usage = LLMUsage.objects.order_by('file_item_id')
+        self.assertEqual([row.file_item_id for row in usage], [item.id for item in self.file_items])
+        self.assertEqual({(row.batch_id, row.prompt_tokens, row.completion_tokens) for row in usage},
+                         {(self.batch.id, 100, 20)})
+        # Not on asyncio's default executor, whose threads never close their connections
+        self.assertEqual(len(sink_threads), 2)
+        self.assertFalse(any(name.startswith('asyncio_') for name in sink_threads))
+
+
+@override_settings(PARSE_SINGLEFLIGHT=True, PARSE_LEASE_POLL_INTERVAL=0.02, OPENROUTER_PARSE_MODELS=['test/model'])
+class SingleflightTests(TransactionTestCase):
+    """processing.singleflight parse_once / parse_once_async and the ParseLease"""
+
+    KEY = ('a' * 64, 'b' * 64)
+    PARSED = {'personal_info': {'full_name': 'Jane Doe'}}
+
+    def setUp(self):
+        self.calls = 0
+
+    def request(self, delay=0.2, error=None):
+        self.calls += 1
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return self.PARSED, 'test/model'
+
+    def parse_in_threads(self, request, count=4):
+        results = [None] * count
+
+        def parse(n):
+            try:
+                results[n] = parse_once(self.KEY, request)
+            except Exception as e:
+                results[n] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=parse, args=(n,)) for n in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_identical_parses_share_one_request(self):
+        results = self.parse_in_threads(self.request)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [self.PARSED] * 4)
+        self.assertFalse(ParseLease.objects.exists())
+
+    def test_leader_failure_reaches_waiters_and_releases_the_lease(self):
+        results = self.parse_in_threads(lambda: self.request(error=ValueError('bad answer')))
+
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertFalse(ParseLease.objects.exists())
+        # The next caller parses again
+        self.assertEqual(parse_once(self.KEY, lambda: self.request(delay=0)), self.PARSED)
+        self.assertEqual(self.calls, 2)
+
+    def test_waits_for_another_workers_lease_and_uses_its_result(self):
+        self.assertTrue(acquire_parse_lease(self.KEY, 'other-worker'))
+        results = []
+        thread = threading.Thread(target=lambda: (results.append(parse_once(self.KEY, self.request)), connection.close()))
+        thread.start()
+        time.sleep(0.1)
+        store_parse(*self.KEY, 'test/model', self.PARSED)
+        thread.join()
+
+        self.assertEqual(results, [self.PARSED])
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertTrue(acquire_parse_lease(self.KEY, 'dead-worker'))
+        self.assertFalse(acquire_parse_lease(self.KEY, 'new-worker'))
+        ParseLease.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(acquire_parse_lease(self.KEY, 'new-worker'))
+        self.assertEqual(ParseLease.objects.get().locked_by, 'new-worker')
+        self.assertFalse(renew_parse_lease(self.KEY, 'dead-worker'))
+
+    @override_settings(PARSE_LEASE_SECONDS=0.3)
+    def test_leader_renews_its_lease_while_the_request_runs(self):
+        taken_over = []
+
+        def request():
+            # Past the first lease expiry; without renewal another worker could take it
+            time.sleep(0.45)
+            taken_over.append(acquire_parse_lease(self.KEY, 'other-worker'))
+            return self.PARSED, 'test/model'
+
+        self.assertEqual(self.parse_in_threads(request, count=1), [self.PARSED])
+        self.assertEqual(taken_over, [False])
+
+    def test_async_concurrent_identical_parses_share_one_request(self):
+        async def request():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return self.PARSED, 'test/model'
+
+        async def parse_all():
+            return await asyncio.gather(*(parse_once_async(self.KEY, request) for _ in range(3)))
+
+        self.assertEqual(async_to_sync(parse_all)(), [self.PARSED] * 3)
+        self.assertEqual(self.calls, 1)
+
+    def test_async_waiter_takes_over_when_the_leader_is_cancelled(self):
+        async def request():
+            self.calls += 1
+            if self.calls == 1:
+                await asyncio.sleep(10)
+            return self.PARSED, 'test/model'
+
+        async def parse_with_cancelled_leader():
+            leader = asyncio.create_task(parse_once_async(self.KEY, request))
+            await asyncio.sleep(0.1)
+            waiter = asyncio.create_task(parse_once_async(self.KEY, request))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await waiter
+
+        self.assertEqual(async_to_sync(parse_with_cancelled_leader)(), self.PARSED)
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(ParseLease.objects.exists())
+
+
+@override_settings(SSE_POLL_INTERVAL=0, SSE_MAX_DURATION=60)
+class BatchEventStreamTests(TestCase):
+    """processing.events cursors and batch_event_stream deltas"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='recruiter@example.com', password='secret')
+        self.batch = BatchUpload.objects.create(user=user, total_files=3, status='processing')
+        now = timezone.now()
+        self.items = [FileItem.objects.create(batch=self.batch, file=f'batch_uploads/cv{n}.pdf') for n in range(3)]
+        # The first two share a timestamp, so the cursor has to order them by id
+        for item, updated_at in zip(self.items, (now, now, now + timedelta(seconds=1))):
+            FileItem.objects.filter(id=item.id).update(updated_at=updated_at)
+            item.refresh_from_db()
+
+    def events(self, stream):
+        """(event, data) pairs, without the retry hint and keep-alives"""
+        events = []
+        for message in stream:
+            fields = dict(line.split(': ', 1) for line in message.strip().split('\n') if not line.startswith(('retry', ':')))
+            if fields:
+                events.append((fields['event'], json.loads(fields['data'])))
+        return events
+
+    def test_cursor_round_trip(self):
+        item = FileItem.objects.filter(id=self.items[0].id).values('id', 'updated_at').get()
+        self.assertEqual(parse_cursor(format_cursor(item)), (item['updated_at'], item['id']))
+        # A bare timestamp resumes after everything updated at that time
+        self.assertEqual(parse_cursor(item['updated_at'].isoformat()), (item['updated_at'], float('inf')))
+        for value in (None, '', 'yesterday', f"{item['updated_at'].isoformat()},abc"):
+            self.assertIsNone(parse_cursor(value))
+
+    def test_finished_batch_sends_a_snapshot_progress_and_done(self):
+        self.batch.status = 'completed'
+        self.batch.processed_files = 3
+        self.batch.save()
+
+        events = self.events(batch_event_stream(self.batch.id))
+
+        self.assertEqual([event for event, _ in events], ['file_item'] * 3 + ['progress', 'done'])
+        self.assertEqual([data['id'] for _, data in events[:3]], [item.id for item in self.items])
+        self.assertEqual(events[3][1], {
+            'status': 'completed', 'processed_files': 3, 'total_files': 3, 'progress_percentage': 100,
+        })
+
+    def test_resuming_sends_only_items_past_the_cursor(self):
+        self.batch.status = 'completed'
+        self.batch.save()
+        first = self.items[0]
+
+        events = self.events(batch_event_stream(self.batch.id, since=(first.updated_at, first.id)))
+
+        # The second item shares the cursor's timestamp but has a larger id
+        self.assertEqual([data['id'] for event, data in events if event == 'file_item'],
+                         [self.items[1].id, self.items[2].id])
+
+    def test_running_stream_sends_changed_items_and_progress(self):
+        def finish_one_item(seconds):
+            item = self.items[1]
+            FileItem.objects.filter(id=item.id).update(status='completed', updated_at=timezone.now() + timedelta(seconds=5))
+            BatchUpload.objects.filter(id=self.batch.id).update(status='completed', processed_files=1)
+
+        with mock.patch('processing.events.time.sleep', side_effect=finish_one_item), \
+                mock.patch('processing.events.connection.close'):
+            events = self.events(batch_event_stream(self.batch.id))
+
+        names = [event for event, _ in events]
+        self.assertEqual(names, ['file_item'] * 3 + ['progress', 'file_item', 'progress', 'done'])
+        changed = events[4][1]
+        self.assertEqual((changed['id'], changed['status']), (self.items[1].id, 'completed'))
+        self.assertEqual(events[5][1]['processed_files'], 1)
+
+    @override_settings(SSE_MAX_DURATION=0)
+    def test_stream_ends_after_max_duration(self):
+        with mock.patch('processing.events.time.sleep') as sleep:
+            events = self.events(batch_event_stream(self.batch.id))
+
+        self.assertEqual([event for event, _ in events], ['file_item'] * 3 + ['progress'])
+        sleep.assert_not_called()
+
+
+@override_settings(PARSE_CACHE_ENABLED=True, OPENROUTER_PARSE_MODELS=['primary/model', 'fallback/model', 'last/model'])
+class ParseCacheTests(TestCase):
+    """processing.cache keying, lookup counting and invalidation"""
+
+    PARSED = {'personal_info': {'full_name': 'Jane Doe'}}
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.paths = []
+        for name, content in (('a.pdf', b'resume one'), ('copy.pdf', b'resume one'), ('b.pdf', b'resume two')):
+            path = f"{tmp}/{name}"
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.paths.append(path)
+        stats = mock.patch.dict('processing.cache._stats', {'hits': 0, 'misses': 0})
+        stats.start()
+        self.addCleanup(stats.stop)
+
+    def test_identical_content_shares_an_entry(self):
+        parsed_data, cache_key = lookup_cached_parse(self.paths[0])
+        self.assertIsNone(parsed_data)
+        store_parse(*cache_key, 'fallback/model', self.PARSED)
+
+        self.assertEqual(lookup_cached_parse(self.paths[1]), (self.PARSED, cache_key))
+        self.assertIsNone(lookup_cached_parse(self.paths[2])[0])
+        # Only parseable answers are cached
+        self.assertIsNone(store_parse('c' * 64, cache_key[1], 'primary/model', {'error': True}))
+
+    def test_one_lookup_per_file_whatever_the_failover_list(self):
+        lookup_cached_parse(self.paths[0])
+        _, cache_key = lookup_cached_parse(self.paths[2])
+        store_parse(*cache_key, 'last/model', self.PARSED)
+        self.assertEqual(lookup_cached_parse(self.paths[2], content_hash=cache_key[0])[0], self.PARSED)
+
+        stats = parse_cache_stats()
+        self.assertEqual((stats['process_hits'], stats['process_misses']), (1, 2))
+        self.assertEqual(stats['total_hits'], 1)
+
+    def test_preferred_model_wins(self):
+        _, cache_key = lookup_cached_parse(self.paths[0])
+        store_parse(*cache_key, 'last/model', {'personal_info': {'full_name': 'Fallback'}})
+        store_parse(*cache_key, 'primary/model', self.PARSED)
+
+        self.assertEqual(lookup_cached_parse(self.paths[0])[0], self.PARSED)
+
+    def test_invalidation(self):
+        _, cache_key = lookup_cached_parse(self.paths[0])
+        store_parse(*cache_key, 'primary/model', self.PARSED)
+        store_parse(*cache_key, 'retired/model', self.PARSED)
+        store_parse(cache_key[0], 'old-prompt', 'primary/model', self.PARSED)
+        ParseCacheEntry.objects.filter(model='primary/model').update(created_at=timezone.now() - timedelta(days=40))
+
+        self.assertEqual(invalidate_parse_cache(stale_only=True), 2)
+        self.assertEqual(invalidate_parse_cache(older_than_days=60), 0)
+        self.assertEqual(invalidate_parse_cache(older_than_days=30, model='other/model'), 0)
+        self.assertEqual(invalidate_parse_cache(older_than_days=30), 1)
+        self.assertFalse(ParseCacheEntry.objects.exists())
+
+    @override_settings(PARSE_CACHE_ENABLED=False)
+    def test_disabled_cache_is_not_looked_up(self):
+        self.assertEqual(lookup_cached_parse(self.paths[0]), (None, None))
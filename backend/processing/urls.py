@@ -3,7 +3,7 @@ Processing app URLs
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BatchUploadViewSet, ReviewDashboardView, RankingRefreshView
+from .views import BatchUploadViewSet, ReviewDashboardView, RankingRefreshView, ProcessingMetricsView, LLMUsageView
 
 router = DefaultRouter()
 router.register(r'batches', BatchUploadViewSet, basename='batch')
@@ -12,5 +12,7 @@ urlpatterns = [
     path('', include(router.urls)),
     path('review/', ReviewDashboardView.as_view(), name='review-dashboard'),
     path('ranking/<int:job_id>/refresh/', RankingRefreshView.as_view(), name='ranking-refresh'),
+    path('metrics/', ProcessingMetricsView.as_view(), name='processing-metrics'),
+    path('usage/', LLMUsageView.as_view(), name='llm-usage'),
 ]
 
@@ -0,0 +1,100 @@
+"""
+Token and cost accounting for OpenRouter calls
+
+Every completed call is reported by the AI layer (ai.usage) and stored as an
+LLMUsage row, linked to the file item, batch, job and user named by the
+usage labels active when the call was made.
+"""
+from decimal import Decimal
+from django.db.models import Avg, Count, F, Sum
+from django.db.models.functions import TruncDate
+from ai.usage import usage_labels
+from .models import BatchUpload, LLMUsage
+
+# Usage label -> LLMUsage foreign key column
+LABEL_FIELDS = {
+    'file_item': 'file_item_id',
+    'batch': 'batch_id',
+    'job': 'job_id',
+    'user': 'user_id',
+}
+
+# group_by value -> expression to group usage rows by
+GROUP_FIELDS = {
+    'model': F('model'),
+    'operation': F('operation'),
+    'file_item': F('file_item_id'),
+    'batch': F('batch_id'),
+    'job': F('job_id'),
+    'user': F('user_id'),
+    'day': TruncDate('created_at'),
+}
+
+
+def store_llm_usage(model, usage, labels):
+    """ai.usage sink: persist one call as an LLMUsage row"""
+    links = {column: labels.get(label) for label, column in LABEL_FIELDS.items()}
+    if links['user_id'] is None and links['batch_id'] is not None:
+        links['user_id'] = BatchUpload.objects.filter(
+            id=links['batch_id']
+        ).values_list('user_id', flat=True).first()
+
+    LLMUsage.objects.create(
+        operation=labels.get('operation', 'other'),
+        model=model,
+        prompt_tokens=usage['prompt_tokens'],
+        completion_tokens=usage['completion_tokens'],
+        cached_tokens=usage['cached_tokens'],
+        latency_ms=round(usage['latency'] * 1000) if usage.get('latency') is not None else None,
+        cost=Decimal(f"{usage['cost']:.6f}") if usage.get('cost') is not None else None,
+        **links
+    )
+
+
+def file_item_usage(file_item, operation='parse'):
+    """Label the LLM calls made for a batch file item"""
+    return usage_labels(operation=operation, file_item=file_item.id, batch=file_item.batch_id)
+
+
+def usage_summary(queryset=None, group_by=None):
+    """
+    Aggregate LLM usage
+
+    Args:
+        queryset: LLMUsage rows to aggregate (default: all)
+        group_by: Optional key of GROUP_FIELDS
+
+    Returns:
+        Dict with 'totals' and, when grouped, 'groups' (largest cost first)
+    """
+    if queryset is None:
+        queryset = LLMUsage.objects.all()
+    aggregates = {
+        'calls': Count('id'),
+        'prompt_tokens': Sum('prompt_tokens'),
+        'completion_tokens': Sum('completion_tokens'),
+        'cached_tokens': Sum('cached_tokens'),
+        'cost': Sum('cost'),
+        'avg_latency_ms': Avg('latency_ms'),
+    }
+
+    def clean(row):
+        for key in ('prompt_tokens', 'completion_tokens', 'cached_tokens'):
+            row[key] = row[key] or 0
+        row['cost'] = float(row['cost'] or 0)
+        row['avg_latency_ms'] = round(row['avg_latency_ms']) if row['avg_latency_ms'] is not None else None
+        row['cache_hit_ratio'] = round(row['cached_tokens'] / row['prompt_tokens'], 3) if row['prompt_tokens'] else 0.0
+        return row
+
+    summary = {'totals': clean(queryset.aggregate(**aggregates))}
+    if group_by:
+        rows = (
+            queryset.order_by()
+            .annotate(group=GROUP_FIELDS[group_by])
+            .values('group')
+            .annotate(**aggregates)
+            .order_by('-cost', '-calls')
+        )
+        summary['group_by'] = group_by
+        summary['groups'] = [clean(row) for row in rows]
+    return summary
@@ -1,20 +1,36 @@
 """
 Processing app views
 """
-import threading
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db.models import Count, Q, Avg
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from core.utils import EventStreamRenderer
 from .models import BatchUpload, FileItem, Ranking
 from .serializers import BatchUploadSerializer, FileItemSerializer, RankingSerializer
 from .services import (
-    process_batch_service, rank_candidates_service,
+    rank_candidates_service,
     apply_auto_reject_rules, calculate_initial_score
 )
+from .tasks import enqueue_batch, task_queue_stats
 from candidates.models import Candidate, JobScore
 from jobs.models import Job
+from ai.transport import get_transport_stats
+from ai.ratelimit import get_rate_limiter
+from ai.circuit import get_breaker_states
+from ai.concurrency import get_concurrency_stats
+from ai.usage import get_usage_stats, usage_labels
+from ai.streaming import get_stream_stats
+from .cache import parse_cache_stats
+from .singleflight import singleflight_stats
+from .models import LLMUsage
+from .usage import GROUP_FIELDS, usage_summary
+from .events import batch_event_stream, parse_cursor
 
 
 class BatchUploadViewSet(viewsets.ModelViewSet):
@@ -24,20 +40,8 @@ class BatchUploadViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         """Set the user and create batch"""
-        batch = serializer.save(user=self.request.user)
-        
-        # Process files in background thread for better UX
-        # For MVP, we'll process synchronously but in a thread
-        def process_in_thread():
-            try:
-                process_batch_service(batch.id)
-            except Exception as e:
-                batch.status = 'failed'
-                batch.save()
-        
-        thread = threading.Thread(target=process_in_thread)
-        thread.daemon = True
-        thread.start()
+        # Files are queued for `manage.py run_workers` as they are uploaded
+        serializer.save(user=self.request.user)
     
     @action(detail=True, methods=['post'])
     def upload_files(self, request, pk=None):
@@ -71,20 +75,12 @@ class BatchUploadViewSet(viewsets.ModelViewSet):
             )
             file_items.append(file_item)
         
-        batch.total_files = batch.file_items.count()
+        # batch.file_items is prefetched (stale) here, so count directly
+        batch.total_files = FileItem.objects.filter(batch=batch).count()
         batch.save()
         
-        # Process batch in background
-        def process_in_thread():
-            try:
-                process_batch_service(batch.id)
-            except Exception as e:
-                batch.status = 'failed'
-                batch.save()
-        
-        thread = threading.Thread(target=process_in_thread)
-        thread.daemon = True
-        thread.start()
+        # Queue the new files for the background workers
+        enqueue_batch(batch, file_items)
         
         serializer = FileItemSerializer(file_items, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -95,6 +91,28 @@ class BatchUploadViewSet(viewsets.ModelViewSet):
         batch = self.get_object()
         serializer = self.get_serializer(batch)
         return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, pk=None):
+        """
+        Stream batch progress as server-sent events
+        
+        Sends file_item events (only items that changed), progress events when
+        the counters change and a final done event. Resume with the
+        Last-Event-ID header or ?since=<event id or timestamp>.
+        """
+        batch = self.get_object()
+        since = parse_cursor(
+            request.headers.get('Last-Event-ID') or request.query_params.get('since')
+        )
+        response = StreamingHttpResponse(
+            batch_event_stream(batch.id, since=since),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
 class ReviewDashboardView(APIView):
@@ -207,7 +225,8 @@ class RankingRefreshView(APIView):
         ).distinct()
         
         if candidates_to_rank.exists():
-            ranked_results = rank_candidates_service(job, candidates_to_rank)
+            with usage_labels(user=request.user.id):
+                ranked_results = rank_candidates_service(job, candidates_to_rank)
             
             # Update ranks
             for result in ranked_results:
@@ -242,3 +261,73 @@ class RankingRefreshView(APIView):
         })
 
 
+class ProcessingMetricsView(APIView):
+    """Operational metrics for the processing pipeline (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """Get OpenRouter transport, rate limiter, concurrency limit, circuit breaker, token usage, streaming, parse cache, singleflight and task queue state"""
+        return Response({
+            'transport': get_transport_stats(),
+            'rate_limit': get_rate_limiter().get_stats(),
+            'concurrency': get_concurrency_stats(),
+            'circuit_breakers': get_breaker_states(),
+            'token_usage': get_usage_stats(),
+            'streaming': get_stream_stats(),
+            'parse_cache': parse_cache_stats(),
+            'singleflight': singleflight_stats(),
+            'task_queue': task_queue_stats(),
+        })
+
+
+class LLMUsageView(APIView):
+    """Aggregated LLM token usage and cost (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """
+        Get usage totals, optionally grouped
+        
+        Query params:
+            group_by: model, operation, file_item, batch, job, user or day
+            batch, job, user, file_item, model, operation: filters
+            since, until: created_at date range (YYYY-MM-DD)
+        """
+        group_by = request.query_params.get('group_by')
+        if group_by and group_by not in GROUP_FIELDS:
+            return Response(
+                {'error': f"group_by must be one of: {', '.join(GROUP_FIELDS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        usage = LLMUsage.objects.all()
+        for param in ('batch', 'job', 'user', 'file_item'):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            if not value.isdigit():
+                return Response(
+                    {'error': f'{param} must be an integer id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            usage = usage.filter(**{f'{param}_id': int(value)})
+        for param in ('model', 'operation'):
+            value = request.query_params.get(param)
+            if value:
+                usage = usage.filter(**{param: value})
+        for param, lookup in (('since', 'created_at__date__gte'), ('until', 'created_at__date__lte')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                return Response(
+                    {'error': f'{param} must be a date (YYYY-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            usage = usage.filter(**{lookup: day})
+        
+        return Response(usage_summary(usage, group_by))
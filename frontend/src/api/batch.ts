@@ -1,5 +1,6 @@
+import { useEffect } from 'react';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
-import apiClient from './client';
+import apiClient, { API_BASE_URL, refreshAccessToken } from './client';
 
 export interface FileItem {
   id: number;
@@ -7,6 +8,7 @@ export interface FileItem {
   file: string;
   status: 'pending' | 'processing' | 'completed' | 'failed';
   error_message: string;
+  retry_count: number;
   candidate: any;
   created_at: string;
 }
@@ -41,11 +43,7 @@ export const useBatchUpload = (id: number) => {
       return response.data;
     },
     enabled: !!id,
-    refetchInterval: (query) => {
-      // Poll every 2 seconds if still processing
-      const data = query.state.data;
-      return data?.status === 'processing' ? 2000 : false;
-    },
+    // Kept up to date by useBatchEvents instead of polling
   });
 };
 
@@ -90,15 +88,135 @@ export const useUploadFiles = () => {
   });
 };
 
-export const useBatchStatus = (id: number) => {
-  return useQuery({
-    queryKey: ['batches', id, 'status'],
-    queryFn: async () => {
-      const response = await apiClient.get<BatchUpload>(`/batch/batches/${id}/status/`);
-      return response.data;
-    },
-    enabled: !!id,
-    refetchInterval: 2000, // Poll every 2 seconds
-  });
-};
+interface FileItemEvent {
+  id: number;
+  status: FileItem['status'];
+  error_message: string;
+  retry_count: number;
+  candidate_id: number | null;
+  updated_at: string;
+}
 
+interface BatchProgress {
+  status: BatchUpload['status'];
+  processed_files: number;
+  total_files: number;
+  progress_percentage: number;
+}
+
+// Follow a batch's server-sent event stream and apply it to useBatchUpload's data.
+// EventSource cannot send the JWT, so the stream is read with fetch.
+export const useBatchEvents = (id: number) => {
+  const queryClient = useQueryClient();
+
+  useEffect(() => {
+    if (!id) return;
+
+    const controller = new AbortController();
+    let lastEventId = '';
+    let retryDelay = 3000;
+
+    const applyFileItem = (event: FileItemEvent) => {
+      const batch = queryClient.getQueryData<BatchUpload>(['batches', id]);
+      const known = batch?.file_items?.find((item) => item.id === event.id);
+      if (!known || (known.candidate?.id ?? null) !== event.candidate_id) {
+        // New file, or a candidate we have no details for yet
+        queryClient.invalidateQueries({ queryKey: ['batches', id], exact: true });
+        return;
+      }
+      queryClient.setQueryData<BatchUpload>(['batches', id], (current) => current && {
+        ...current,
+        file_items: current.file_items?.map((item) =>
+          item.id === event.id
+            ? { ...item, status: event.status, error_message: event.error_message, retry_count: event.retry_count }
+            : item
+        ),
+      });
+    };
+
+    const applyProgress = (progress: BatchProgress) => {
+      queryClient.setQueryData<BatchUpload>(['batches', id], (current) => current && { ...current, ...progress });
+    };
+
+    // Returns true once the stream reports the batch done (or it cannot be read)
+    const connect = async (refreshed = false): Promise<boolean> => {
+      const headers: Record<string, string> = { Accept: 'text/event-stream' };
+      const token = localStorage.getItem('access_token');
+      if (token) headers.Authorization = `Bearer ${token}`;
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+      const response = await fetch(`${API_BASE_URL}/batch/batches/${id}/events/`, {
+        headers,
+        signal: controller.signal,
+      });
+      if (response.status === 401 && !refreshed) {
+        return (await refreshAccessToken()) ? connect(true) : true;
+      }
+      if (response.status === 401 || response.status === 403 || response.status === 404) {
+        return true;
+      }
+      if (!response.ok || !response.body) {
+        throw new Error(`Batch event stream failed: ${response.status}`);
+      }
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) return false;
+        buffer += value;
+
+        // Messages are separated by a blank line
+        let end = buffer.indexOf('\n\n');
+        while (end >= 0) {
+          const message = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          end = buffer.indexOf('\n\n');
+
+          let event = 'message';
+          let data = '';
+          for (const line of message.split('\n')) {
+            // Lines starting with ":" are keep-alive comments
+            const colon = line.indexOf(':');
+            if (colon <= 0) continue;
+            const field = line.slice(0, colon);
+            const fieldValue = line.slice(colon + 1).replace(/^ /, '');
+            if (field === 'event') event = fieldValue;
+            else if (field === 'data') data += fieldValue;
+            else if (field === 'id') lastEventId = fieldValue;
+            else if (field === 'retry') retryDelay = Number(fieldValue) || retryDelay;
+          }
+          if (!data) continue;
+
+          const payload = JSON.parse(data);
+          if (event === 'file_item') {
+            applyFileItem(payload);
+          } else if (event === 'progress') {
+            applyProgress(payload);
+          } else if (event === 'done') {
+            applyProgress(payload);
+            queryClient.invalidateQueries({ queryKey: ['batches'] });
+            return true;
+          } else if (event === 'error') {
+            return true;
+          }
+        }
+      }
+    };
+
+    const run = async () => {
+      // The server ends long streams; reconnect and resume from the last event
+      while (!controller.signal.aborted) {
+        try {
+          if (await connect()) return;
+        } catch {
+          if (controller.signal.aborted) return;
+        }
+        await new Promise((resolve) => setTimeout(resolve, retryDelay));
+      }
+    };
+
+    run();
+    return () => controller.abort();
+  }, [id, queryClient]);
+};
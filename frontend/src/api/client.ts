@@ -1,6 +1,6 @@
 import axios from 'axios';
 
-const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || '/api';
+export const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || '/api';
 
 const apiClient = axios.create({
   baseURL: API_BASE_URL,
@@ -28,6 +28,21 @@ apiClient.interceptors.request.use(
   }
 );
 
+// Exchange the refresh token for a new access token (null without a refresh token)
+export const refreshAccessToken = async (): Promise<string | null> => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    return null;
+  }
+  const response = await axios.post(`${API_BASE_URL}/auth/token/refresh/`, {
+    refresh: refreshToken,
+  });
+
+  const { access } = response.data;
+  localStorage.setItem('access_token', access);
+  return access;
+};
+
 // Response interceptor to handle token refresh
 apiClient.interceptors.response.use(
   (response) => response,
@@ -38,14 +53,8 @@ apiClient.interceptors.response.use(
       originalRequest._retry = true;
 
       try {
-        const refreshToken = localStorage.getItem('refresh_token');
-        if (refreshToken) {
-          const response = await axios.post(`${API_BASE_URL}/auth/token/refresh/`, {
-            refresh: refreshToken,
-          });
-
-          const { access } = response.data;
-          localStorage.setItem('access_token', access);
+        const access = await refreshAccessToken();
+        if (access) {
           originalRequest.headers.Authorization = `Bearer ${access}`;
 
           return apiClient(originalRequest);
@@ -1,45 +1,14 @@
-import { useEffect, useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import { ArrowLeft, CheckCircle, XCircle, Loader, File } from 'lucide-react';
-
-// Mock data
-const mockBatch = {
-  id: 1,
-  status: 'processing',
-  total_files: 25,
-  processed_files: 18,
-  created_at: '2024-01-15T10:30:00Z',
-  file_items: [
-    { id: 1, file: 'resume1.pdf', status: 'completed', candidate: { name: 'John Doe' } },
-    { id: 2, file: 'resume2.pdf', status: 'completed', candidate: { name: 'Jane Smith' } },
-    { id: 3, file: 'resume3.pdf', status: 'processing', candidate: null },
-    { id: 4, file: 'resume4.pdf', status: 'pending', candidate: null },
-    { id: 5, file: 'resume5.pdf', status: 'failed', error_message: 'Invalid file format', candidate: null },
-  ],
-};
+import { useBatchEvents, useBatchUpload } from '../api/batch';
 
 export const Processing = () => {
   const { batchId } = useParams();
-  const [batch, setBatch] = useState(mockBatch);
-  const [progress, setProgress] = useState(72);
+  const id = Number(batchId);
+  const { data: batch, isLoading } = useBatchUpload(id);
 
-  // Simulate progress updates
-  useEffect(() => {
-    if (batch.status === 'processing') {
-      const interval = setInterval(() => {
-        setProgress((prev) => {
-          if (prev >= 100) {
-            clearInterval(interval);
-            setBatch({ ...batch, status: 'completed', processed_files: batch.total_files });
-            return 100;
-          }
-          return prev + 2;
-        });
-      }, 1000);
-
-      return () => clearInterval(interval);
-    }
-  }, [batch.status]);
+  // Progress arrives as server-sent events instead of polling
+  useBatchEvents(id);
 
   const getStatusColor = (status: string) => {
     switch (status) {
@@ -67,6 +36,16 @@ export const Processing = () => {
     }
   };
 
+  if (isLoading || !batch) {
+    return (
+      <div className="card p-12 text-center">
+        <p className="text-gray-600">{isLoading ? 'Loading batch...' : 'Batch not found'}</p>
+      </div>
+    );
+  }
+
+  const progress = batch.progress_percentage;
+
   return (
     <div className="space-y-6">
       {/* Header */}
@@ -117,14 +96,14 @@ export const Processing = () => {
           <h2 className="text-lg font-semibold text-gray-900">File Processing Details</h2>
         </div>
         <div className="divide-y divide-gray-200 max-h-96 overflow-y-auto">
-          {batch.file_items.map((item) => (
+          {(batch.file_items ?? []).map((item) => (
             <div key={item.id} className="p-4 flex items-center justify-between hover:bg-gray-50">
               <div className="flex items-center space-x-4 flex-1">
                 <div className={`p-2 rounded-lg ${getStatusColor(item.status)}`}>
                   {getStatusIcon(item.status)}
                 </div>
                 <div className="flex-1 min-w-0">
-                  <p className="text-sm font-medium text-gray-900 truncate">{item.file}</p>
+                  <p className="text-sm font-medium text-gray-900 truncate">{item.file.split('/').pop()}</p>
                   {item.candidate && (
                     <p className="text-xs text-gray-500">Candidate: {item.candidate.name}</p>
                   )}